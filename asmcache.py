@@ -0,0 +1,194 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 IDE Assembly Cache
+
+This module has no Qt content. It saves the results of a successful assembly
+in a file, so that the next time the same source text is assembled -- for
+example when a program is opened again and LOADed -- the results can be
+restored instead of assembling it. The Source window uses it when File>Cache
+Assemblies is checked.
+
+The results are what a successful assembly leaves behind:
+
+* the memory image returned by assemble(),
+* the PC and value of each statement that generates bytes, which the Source
+  window needs for its status line and for setting breakpoints,
+* the symbol table, which the next, incremental, assembly needs.
+
+Each is saved in a JSON file whose name is the key of the source text: the
+SHA-256 hash of the text and assembler2.ASSEMBLER_VERSION. So a file can
+only be found for exactly the same text, assembled by the same assembler.
+
+Every successful assembly of a new text adds a file, so the number of files
+is limited to CACHE_LIMIT. When there are more, the ones least recently
+used are deleted. A file is "used" when it is written or found.
+
+Any problem with the cache folder or a file in it, for example a file that
+was only partly written when the machine crashed, means only that results
+are not found (or not saved), and the source is assembled as usual.
+
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+
+from typing import Dict, List, Optional
+
+from assembler2 import ASSEMBLER_VERSION
+from statement_class import Statement
+
+__all__ = [ 'source_key', 'lookup', 'store', 'load_json', 'save_json' ]
+
+CACHE_LIMIT = 64
+CACHE_SUFFIX = '.json'
+
+'''
+Return the key of a source text, as it is in the document: lines separated
+by single newlines.
+'''
+
+def source_key( text : str ) -> str :
+    digest = hashlib.sha256()
+    digest.update( 'CHIP8IDE assembler {}\n'.format( ASSEMBLER_VERSION ).encode( 'UTF-8' ) )
+    digest.update( text.encode( 'UTF-8' ) )
+    return digest.hexdigest()
+
+'''
+Look for the results saved under a key. Return None, or a dict of:
+
+    'image' : the memory image, a list of ints,
+    'lines' : the count of statements,
+    'values' : a list of (index, PC, value) for each statement that has
+               a value, in the form assembler2.restore_assembly() takes,
+    'symbols' : the symbol table.
+'''
+
+def lookup( directory : str, key : str ) -> Optional[Dict] :
+    saved = load_json( directory, key )
+    if saved is None :
+        return None
+    try :
+        return {
+            'image' : list( bytes.fromhex( saved[ 'image' ] ) ),
+            'lines' : saved[ 'lines' ],
+            'values' : [ ( index, PC, list( bytes.fromhex( value ) ) )
+                         for ( index, PC, value ) in saved[ 'values' ] ],
+            'symbols' : saved[ 'symbols' ]
+            }
+    except ( ValueError, KeyError, TypeError ) :
+        return None
+
+'''
+Save the results of a successful assembly under a key.
+'''
+
+def store( directory : str, key : str, image : List[int],
+           statements : List[Statement], symbols : Dict[ str, int ] ) -> None :
+    save_json( directory, key, {
+        'image' : bytes( image ).hex(),
+        'lines' : len( statements ),
+        'values' : [ ( index, S.PC, bytes( S.value ).hex() )
+                     for ( index, S ) in enumerate( statements ) if S.value ],
+        'symbols' : symbols
+        } )
+
+'''
+The files of the cache are read and written by the following functions,
+which are also used for the object modules of included files (linker.py).
+
+Return the dict saved under a name, if it was saved by this version of the
+assembler, or None. Finding it makes it the most recently used.
+'''
+
+def load_json( directory : str, name : str ) -> Optional[Dict] :
+    path = os.path.join( directory, name + CACHE_SUFFIX )
+    try :
+        with open( path, 'r', encoding='ASCII' ) as file :
+            saved = json.load( file )
+        if saved[ 'version' ] != ASSEMBLER_VERSION :
+            return None
+        os.utime( path )
+    except ( OSError, ValueError, KeyError, TypeError ) :
+        return None
+    return saved
+
+'''
+Save a dict under a name, with the assembler version. The file is written
+under a temporary name and renamed, so that a reader never sees a partial
+file. Then the oldest files are deleted if there are too many.
+'''
+
+def save_json( directory : str, name : str, saved : Dict ) -> None :
+    saved = dict( saved, version=ASSEMBLER_VERSION )
+    temp_path = None
+    try :
+        os.makedirs( directory, exist_ok=True )
+        ( handle, temp_path ) = tempfile.mkstemp( dir=directory, suffix='.tmp' )
+        with os.fdopen( handle, 'w', encoding='ASCII' ) as file :
+            json.dump( saved, file, separators=( ',', ':' ) )
+        os.replace( temp_path, os.path.join( directory, name + CACHE_SUFFIX ) )
+        temp_path = None
+        prune( directory )
+    except OSError :
+        if temp_path is not None :
+            try :
+                os.remove( temp_path )
+            except OSError :
+                pass
+
+def prune( directory : str ) -> None :
+    paths = [ os.path.join( directory, name ) for name in os.listdir( directory )
+              if name.endswith( CACHE_SUFFIX ) ]
+    if len( paths ) > CACHE_LIMIT :
+        paths.sort( key=os.path.getmtime )
+        for path in paths[ : len( paths ) - CACHE_LIMIT ] :
+            os.remove( path )
+
+if __name__ == '__main__' :
+
+    from assembler2 import assemble_lines, restore_assembly
+    import assembler2
+    text = 'SIZE EQU 2\nSTART: LD V0, SIZE\n  ORG START + 4\nLATER: JP START'
+    ( image, statements ) = assemble_lines( text.split( '\n' ) )
+    with tempfile.TemporaryDirectory() as directory :
+        key = source_key( text )
+        assert lookup( directory, key ) is None
+        store( directory, key, image, statements, assembler2.SYMBOLS )
+        entry = lookup( directory, key )
+        assert entry[ 'image' ] == image and entry[ 'lines' ] == 4
+        assert entry[ 'values' ] == [ ( 1, 0x200, [ 0x60, 0x02 ] ), ( 3, 0x204, [ 0x12, 0x00 ] ) ]
+        assert entry[ 'symbols' ] == { 'SIZE' : 2, 'START' : 0x200, 'LATER' : 0x204 }
+        assert source_key( text + ' ' ) != key
+        ( _, fresh ) = assemble_lines( text.split( '\n' ) )
+        restore_assembly( fresh, entry[ 'symbols' ], entry[ 'values' ] )
+        assert [ S.PC for S in fresh ] == [ S.PC for S in statements ]
+        assert not any( S.changed for S in fresh )
+        for n in range( CACHE_LIMIT + 2 ) :
+            store( directory, source_key( str( n ) ), image, statements, {} )
+        assert len( os.listdir( directory ) ) == CACHE_LIMIT
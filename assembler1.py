@@ -47,8 +47,9 @@ complete the assembly later, during the assemble() function of the assemble2
 module.
 
 '''
+import functools
 import logging
-from typing import List, Union
+from typing import FrozenSet, List, Optional, Tuple, Union
 
 '''
     Define exported names.
@@ -69,6 +70,12 @@ Import the register code numbers from the emulator.
 
 from chip8 import R as RCODES
 
+'''
+Import the expression compiler.
+'''
+
+from expression import compile_expression, ExpressionError
+
 '''
 
     Tokenization by Regular Expression
@@ -86,8 +93,10 @@ Regex coding notes: all have the ignore-case flag, so capitalization doesn't
 matter. The regex for each specific directive or opcode word is fenced with
 the \b word-break test. That avoids seeing opcodes at the start or end of
 innocent labels.
+
+The regex module itself is only imported when the regexes are compiled, on
+first use; see get_t_rex() below.
 '''
-import regex
 
 '''
 List of Directive opcodes. A search for these is the first item in the
@@ -103,6 +112,7 @@ directives = [
     r'\bDS\b',
     r'\bEQU\b',
     r'=',
+    r'\bINCLUDE\b',
     r'\bORG\b',
     ]
 
@@ -204,13 +214,25 @@ a human would like to edit, but the regex module handles it just fine.
 Given that this massive regex is applied every keystroke, one can see how
 good performance by regex is important.
 
+Compiling it takes a noticeable time, though, and there is no need to spend
+that time at startup, before there is any source text to look at. So it is
+compiled on the first call of get_t_rex(), and kept in t_rex. The same goes
+for signature_regex, below.
+
 '''
 
 token_expression = '|'.join(
     '(?P<{0}>{1})'.format(t,r) for (t,r) in token_specs
     )
 
-t_rex = regex.compile( token_expression, regex.IGNORECASE | regex.ASCII )
+t_rex = None
+
+def get_t_rex( ) :
+    global t_rex
+    if t_rex is None :
+        import regex
+        t_rex = regex.compile( token_expression, regex.IGNORECASE | regex.ASCII )
+    return t_rex
 
 '''
 Define a simple Token class. This would be a legitimate use of a
@@ -303,7 +325,8 @@ signature_dict = {
     'STMR'   : 'STM',
     'SUBR,R' : 'SUB',
     'SUBNR,R' : 'SUBN',
-    'XORR,R' : 'XOR'
+    'XORR,R' : 'XOR',
+    'INCLUDEZ' : 'INCLUDE'
     }
 
 '''
@@ -341,28 +364,15 @@ signatures = [
 signature_expression = '|'.join(
     '(?P<{0}>{1})'.format(t,r) for (t,r) in signatures
     )
-signature_regex = regex.compile( signature_expression )
-
-
-'''
-    Assembly-time Symbol Table
-
-Expressions in statements are translated into Python expressions. Each WORD
-token in an expression (which is a reference to some label) is translated
-into a call on LOOKUP(word).
-
-The name LOOKUP is resolved as a global at the time the eval() function is
-applied to evaluate the expression. When that is done in the namespace of
-this module, LOOKUP() is the following, which just returns 1 (to avoid
-unintentional divide-by-zero errors).
-
-During the real assembly (in the assembler2 module), LOOKUP is defined to
-return the actual value of the word, or None if it is not defined.
+signature_regex = None
 
-'''
+def get_signature_regex( ) :
+    global signature_regex
+    if signature_regex is None :
+        import regex
+        signature_regex = regex.compile( signature_expression )
+    return signature_regex
 
-def LOOKUP( name:str ) -> int :
-    return 1
 
 '''
     Parsing Phase 1: Recognition
@@ -382,12 +392,13 @@ Nevertheless we need to handle ones like (to concoct a ridiculous example),
 
     LD V2, (BUFEND - BUFSIZE) & ( #073 < 2 ) % 7
 
-I considered taking this as an opportunity to write my own parser for
-expressions -- but that would be masochism. There are only cosmetic
-differences between CHIPPER literals and Python ones (#073 vs. 0x073, etc),
-and a couple of operators use different characters. Once those are
-translated, we can use Python's perfectly good parser to validate them and
-(in the assemble2 phase) Python's eval to evaluate them.
+At first I translated expressions into Python, which differs only
+cosmetically (#073 vs. 0x073, etc, and a couple of operators), and used
+Python's perfectly good parser to validate them and (in the assemble2 phase)
+Python's eval to evaluate them. But that costs a compile() for every
+expression when it is scanned, and an eval() on every assembly, even for a
+plain #0F. Now the expressions are compiled by the expression module, which
+reduces literal-only expressions to their values right here.
 
 So, phase 1 of parsing proceeds in these steps:
 
@@ -414,13 +425,12 @@ So, phase 1 of parsing proceeds in these steps:
 
     * Store the form of the statement yielded by signature_dict/signature_regex.
 
-    * Convert any expression(s) into Python form and apply the built in Python
-      compile() to them.
+    * Compile any expression(s) with compile_expression().
 
-    * If compile() reports an error, return S with is_valid False.
+    * If that reports an error, return S with is_valid False.
 
-    * Store the code object(s) returned by compile() in S.expressions for
-      use at assembly time.
+    * Store the compiled expression(s) in S.expressions for use at assembly
+      time.
 
     * Set the assembled length of the instruction based on opcode and operands.
 
@@ -434,18 +444,13 @@ error text in the status line.)
 
 '''
 
-def phase_one( statement_text: str, S : Statement ) :
-    global LOOKUP
+def scan_statement( statement_text: str, S : Statement ) :
 
-    '''
-    Clear the Statement fields we will set here.
-    '''
-    S.init_static()
     '''
     Tokenize the text to get a list of tokens.
     '''
     tokens = [] # type: List[ Token ]
-    for match in regex.finditer( t_rex, statement_text ) :
+    for match in get_t_rex().finditer( statement_text ) :
 
         '''
         Ignore whitespace tokens and comments, don't even put them
@@ -466,11 +471,11 @@ def phase_one( statement_text: str, S : Statement ) :
 
         '''
         We have a recognizable token, pull its type and value from the regex
-        match. match.lastgroup() is the ?P<NAME> from the matching regex, and
+        match. match.lastgroup is the ?P<NAME> from the matching regex, and
         match.group() is the text that was actually matched to the regex.
         '''
 
-        token_type = match.lastgroup() # how did this hang around so long?
+        token_type = match.lastgroup
         token_value = match.group( token_type )
 
         '''
@@ -648,7 +653,7 @@ def phase_one( statement_text: str, S : Statement ) :
     if signature in signature_dict :
         instruction_form = signature_dict[ signature ]
     else :
-        m = signature_regex.fullmatch( signature )
+        m = get_signature_regex().fullmatch( signature )
         if m : # is not None,
             instruction_form = m.lastgroup
             '''
@@ -681,92 +686,43 @@ def phase_one( statement_text: str, S : Statement ) :
     '''
     S.form = instruction_form
 
+    '''
+    The operand of INCLUDE is the name of a file (see linker.py), not an
+    expression, and unlike other strings it keeps its case, as the file
+    system may care. Store the name as the value of the expression. An
+    INCLUDE generates no bytes in place.
+    '''
+    if S.form == 'INCLUDE' :
+        S.expressions = [ S.expressions[0][0].t_value[1:-1] ]
+        S.next_pc = 0
+        return
+
     '''
     The statement looks valid so far, but we have not actually parsed the
     expression(s) if any. They are stowed in S.expressions as a list of lists
     of tokens.
 
-    For each expression, translate the tokens to Python syntax to form a Python
-    expression text. Use the built-in compile() function to parse and convert
-    that to a code-object that can be evaluated later.
-
-    Literals need only a cosmetic brush-up except two cases: string literals,
-    need to be uppercased and converted to bytes('string',encoding=ASCII).
-    Decimal literals need to be checked for the peculiar problem that Python
-    3 does not allow a leading zero on a literal because that would have been
-    an octal literal under Python 2. So get rid of leading zeros on decimals.
-
-    Names are converted into calls on the LOOKUP() function. The one in this
-    module returns 1 for any name, so a compiled expression can be evaluated
-    at this time. (Returns 1 so that in case the user wrote "NAME1/NAME2" we
-    do not cause a divide-by-zero.)
+    Compile each one to an Expression (see expression.py), which is the
+    value itself when the expression has only literals, or otherwise a
+    little program for assembler2 to evaluate. Collect the names the
+    expressions refer to in S.references, for the assembler's use.
     '''
-
     code_list = []
+    references = set()
     for token_list in S.expressions :
-        '''
-        Again, collect a string as a list of sub-strings, then join at the end.
-        '''
-        python_expression_items = [] # type: List[str]
-
         for token in token_list :
-            if token.t_type == 'DECIMAL' :
-                # Decimals are fine except for avoiding a leading 0. However,
-                # lstrip can get carried away...
-                nonzero_decimal = token.t_value.lstrip('0')
-                python_expression_items.append( nonzero_decimal if len(nonzero_decimal) else '0' )
-            elif token.t_type == 'HEX' :
-                # #0f -> 0x0f
-                python_expression_items.append( '0x0' + token.t_value[1:] )
-            elif token.t_type == 'BINARY' :
-                # $...1..1 -> $0001001
-                token.t_value = token.t_value.replace('.','0')
-                # $0001001 -> 0b0001001
-                python_expression_items.append( "0b" + token.t_value[1:] )
-            elif token.t_type == 'OCTAL' :
-                # @377 -> 0o377
-                python_expression_items.append( '0o0' + token.t_value[1:] )
-            elif token.t_type == 'STRING' :
-                # 'ma'am' -> bytes("MA'AM",encoding="ASCII")
-                # note that an encoding error if any, happens when the
-                # expression is executed, later.
-                python_expression_items.append( 'bytes("' + token.t_value[1:-1].upper() + '", encoding="ASCII")' )
-            elif token.t_type == 'WORD' :
-                # LABEL -> LOOKUP("LABEL")
-                python_expression_items.append( 'LOOKUP("' + token.t_value + '")' )
-            else :
-                # remains only EXPOPS: ()+\-~!<>*/&|^% of which all but !<> are
-                # the same in Python expressions.
-                op = token.t_value
-                if op == '!' :
-                    # 2!4 -> 2**4
-                    python_expression_items.append( '**' )
-                elif op == '<' :
-                    # < -> <<
-                    python_expression_items.append( '<<' )
-                elif op == '>':
-                    # > -> >>
-                    python_expression_items.append( '>>' )
-                else : # op in ()+-~*/&|^%
-                    python_expression_items.append( op )
-
-        python_expression = ' '.join( python_expression_items )
-
-        '''
-        Compile the translated expression and save the code object that
-        results for later execution in the second phase.
-        '''
+            if token.t_type == 'WORD' :
+                references.add( token.t_value )
         try :
-            code_obj = None
-            code_obj = compile( python_expression, 'chip8ide assembler', 'eval' )
-            code_list.append( code_obj )
-        except Exception as E :
+            code_list.append( compile_expression( token_list ) )
+        except ExpressionError as E :
             '''
-            compile() threw an exception, note the error and exit the loop.
+            The tokens do not make an expression: note the error and exit
+            the loop.
             '''
             S.text_error = True
-            S.error_msg = 'Invalid expression'
-            S.error_pos = token_list[0].t_start
+            S.error_msg = str( E )
+            S.error_pos = E.position
             break
 
     '''
@@ -775,10 +731,11 @@ def phase_one( statement_text: str, S : Statement ) :
     if S.text_error :
         return
     '''
-    Save code objects in S. Copy the list so we don't leave S pointing to our
-    local memory.
+    Save the expressions in S. Copy the list so we don't leave S pointing to
+    our local memory.
     '''
     S.expressions = list( code_list )
+    S.references = frozenset( references )
 
     '''
     If the statement got through all that unscathed it is good -- assuming
@@ -815,6 +772,56 @@ def phase_one( statement_text: str, S : Statement ) :
     '''
     return
 
+'''
+
+    Caching the results of phase 1
+
+The syntax highlighter calls phase_one for every line it is given, which is
+every line of a file when it is opened or pasted, and every line that is
+touched by an edit. A program has many identical lines: empty lines, many
+comments, and many instances of CLS, RET, ADD V1,1 and such. The result of
+the scan depends only on the text of the line, so we keep the results of the
+last PHASE_ONE_CACHE_SIZE different lines in a least-recently-used cache,
+keyed by the text.
+
+The cached result is a tuple of the Statement fields that scan_statement()
+sets. All its members are immutable (the compiled expressions too), so one
+result can be shared by all the Statements of the same text. phase_one()
+copies the members into the Statement, where the assembler can change its
+own copy of next_pc, for DS and ORG, without affecting the others.
+
+'''
+
+PHASE_ONE_CACHE_SIZE = 8192
+
+ScanResult = Tuple[ bool, Optional[int], str, str, str,
+                    Optional[int], Optional[int], Optional[int],
+                    Tuple, FrozenSet[str] ]
+
+@functools.lru_cache( maxsize=PHASE_ONE_CACHE_SIZE )
+def cached_scan( statement_text: str ) -> ScanResult :
+    S = Statement()
+    scan_statement( statement_text, S )
+    return ( S.text_error, S.error_pos, S.error_msg, S.form, S.defined_name,
+             S.reg_1, S.reg_2, S.next_pc, tuple( S.expressions ), S.references )
+
+'''
+The entry point from the syntax highlighter: clear the Statement fields that
+phase 1 sets, note the text that they describe, and set them from the
+scan of that text.
+'''
+
+def phase_one( statement_text: str, S : Statement ) :
+    S.init_static()
+    S.text = statement_text
+    ( S.text_error, error_pos, error_msg, S.form, S.defined_name,
+      S.reg_1, S.reg_2, S.next_pc, expressions, S.references
+      ) = cached_scan( statement_text )
+    S.expressions = list( expressions )
+    if S.text_error :
+        S.error_pos = error_pos
+        S.error_msg = error_msg
+
 
 '''
 Aaaaand we hack up some tests. Lasciate ogne speranza...
@@ -927,3 +934,25 @@ if __name__ == '__main__' :
     stmt = '  LD V7,07'
     phase_one( stmt, S )
     print_S( stmt, S )
+    stmt = 'TOP: LD I, TABLE + ( ROW * 8 ) + ROW'
+    phase_one( stmt, S )
+    assert S.references == { 'TABLE', 'ROW' } and S.text == stmt and S.changed
+    '''
+    A second Statement of the same text is set from the cache, sharing the
+    code objects, and an error is reported the same way every time.
+    '''
+    hits = cached_scan.cache_info().hits
+    S2 = Statement()
+    phase_one( stmt, S2 )
+    assert cached_scan.cache_info().hits == hits + 1
+    assert S2.form == S.form and S2.expressions[0] is S.expressions[0]
+    '''
+    Literal expressions are compiled to their values.
+    '''
+    phase_one( "  DB #F0, $1..1, 2+3*4", S )
+    assert S.expressions == [ 0xF0, 0x09, 14 ] and not S.references
+    phase_one( "  DA 'Ok'", S )
+    assert S.expressions == [ b'OK' ]
+    for T in ( S, S2 ) :
+        phase_one( '  LD V7,', T )
+        assert T.text_error and T.error_msg == 'Statement does not make sense'
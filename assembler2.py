@@ -47,32 +47,57 @@ action to inform the user.
 
 '''
 import logging
-from typing import List, Dict
+import os
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
 
-__all__ = [ 'assemble' ]
+__all__ = [ 'assemble', 'assemble_lines', 'assemble_statements', 'block_statements',
+            'restore_assembly' ]
 
 '''
 Import the Statement class.
 '''
 from statement_class import Statement
 
+'''
+Import the expression evaluator.
+'''
+from expression import evaluate
+
+'''
+Import the linker, which implements INCLUDE.
+'''
+import linker
+
 '''
 
 Symbol table:
 
 On our first pass through the statements we note the values of defined names
-in this dict. The LOOKUP() function returns the value of a name if it is
-defined, or it raises an IndexError with an appropriate message.
+in this dict. The evaluate() function looks names up in it, and raises an
+IndexError with an appropriate message for a name that is not defined.
 
 '''
 
 SYMBOLS = dict() # type: Dict[ str, int ]
 
-def LOOKUP( name:str ) -> int :
-    try :
-        return SYMBOLS[ name ]
-    except KeyError as K :
-        raise IndexError( 'Symbol {} is undefined'.format( str(K) ) )
+'''
+For incremental assembly (see below) we keep two more tables between one
+assembly and the next: the symbol table as it was when the second pass last
+ran to the end, and an index from each name to the Statements that refer to
+it.
+'''
+
+ASSEMBLED_SYMBOLS = dict() # type: Dict[ str, int ]
+DEPENDENTS = dict() # type: Dict[ str, List[Statement] ]
+
+'''
+The results of assembly can be saved and restored; see asmcache.py. Saved
+results are good only for the assembler that made them. Increment this
+whenever a change to assembler1, assembler2 or expression could change the
+value of any statement, or the message of any error.
+'''
+
+ASSEMBLER_VERSION = 2
 
 '''
 About expressions: Certain opcodes and all Directives have expression
@@ -98,22 +123,20 @@ binary arithmetic, but because of a coding error many statements distant from
 the expression, and strict application of the limits will help the user find
 such a bug faster.
 
-The following function evaluates an expression in the form of a Python
-code-object and checks that is value is in a certain range. It throws an
-exception with a helpful message in case of an error.
+The following function evaluates an expression as compiled by phase_one
+(see expression.py) and checks that is value is in a certain range. It throws
+an exception with a helpful message in case of an error.
 
 Possible exceptions:
-    IndexError( "Symbol X is undefined") from LOOKUP
-    ZeroDivisionError( "division by zero" ) from eval
+    IndexError( "Symbol X is undefined") from evaluate
+    ZeroDivisionError( "division by zero" ) from evaluate
     ValueError( "Inappropriate expression value N" )
-    Something else? raised by eval()
+    Something else? raised by an operator in evaluate()
 
 '''
 
-def check_value( code_object, low:int, high:int ) -> int :
-    global LOOKUP
-    value = eval( code_object, globals() )
-    value = int( value )
+def check_value( expression, low:int, high:int ) -> int :
+    value = int( evaluate( expression, SYMBOLS ) )
     if value < low or value > high :
         raise ValueError('Inappropriate expression value {}'.format( value ) )
     return value
@@ -187,12 +210,11 @@ like opcodes: they evaluate expressions and return a list of bytes.
 
 def directive_da( S:Statement ) -> List[int] :
     '''
-    phase_one ensures the argument of DA is a single string which it
-    encodes as bytes("...",encoding="ASCII"). So, it becomes quite easy
-    to process. Probably no error can result except, maybe, if they
-    snuck a non-ASCII char into the string, encoding error.
+    phase_one ensures the argument of DA is a single string, which it
+    has already encoded as ASCII bytes. So, it becomes quite easy to
+    process.
     '''
-    byte_list = list( eval( S.expressions[0], globals() ) )
+    byte_list = list( evaluate( S.expressions[0], SYMBOLS ) )
     return byte_list
 
 def directive_db( S: Statement ) -> List[int] :
@@ -202,8 +224,8 @@ def directive_db( S: Statement ) -> List[int] :
     everything is defined.
     '''
     byte_list = []
-    for code_object in S.expressions :
-        byte_list.append( check_value( code_object, 0, 255 ) )
+    for expression in S.expressions :
+        byte_list.append( check_value( expression, 0, 255 ) )
     return byte_list
 
 def directive_dw( S:  Statement ) -> List[int] :
@@ -214,8 +236,8 @@ def directive_dw( S:  Statement ) -> List[int] :
     emulator will barf on an address out of range anyway).
     '''
     byte_list = []
-    for code_object in S.expressions :
-        word = check_value( code_object, 0, 65535 )
+    for expression in S.expressions :
+        word = check_value( expression, 0, 65535 )
         byte_list.append( word >> 8 )
         byte_list.append( word & 0xFF )
     return byte_list
@@ -366,17 +388,23 @@ the way ORG and DS do. But names defined by EQU can be used in an ORG
 or DS expression, and that would potentially sneak forward references into
 ORG or DS again.
 
-So I am giving EQU statements special treatment. If an EQU expression
-evaluates correctly in the first pass, fine. Set its S.defined_value and move
-on. If it does not evaluate because of an undefined name, save that text
-block on a list. At the end of the first pass, when all statement labels are
-resolved, re-try the EQU's in the list. If they depended only on forward
-references, they will now evaluate.
+So I am giving EQU statements special treatment. Before the first pass,
+they are sorted so that each comes after every EQU its expression refers
+to (a topological sort of the graph of references among them). An EQU
+that, by way of other EQUs, refers to itself can never be evaluated, and
+is tagged with the whole circle, e.g. "Circular definition: A -> B -> A".
+Then, in that order, every EQU that depends only on other EQUs is defined,
+however long the chain of them.
+
+An EQU that refers to a label waits until the first pass defines that
+label, and is defined at that moment, as is any EQU waiting for it in
+turn. So each EQU is evaluated exactly once, as soon as it can be.
 
 However, ORG and DS are processed during the first pass, and their
 expressions must resolve at that time. If they fail because a name is
-undefined -- which could be either a forward label or an EQU that has not
-been resolved because it depends on a forward label -- they are in error.
+undefined -- which could be either a forward label or an EQU that depends
+on a forward label -- they are in error. An EQU that depends only on other
+EQUs is always usable, wherever it is written.
 
 These rules permit code like this, a reasonable use of EQU, DS and ORG:
 
@@ -390,35 +418,238 @@ These rules permit code like this, a reasonable use of EQU, DS and ORG:
 
 '''
 
-from PyQt5.QtGui import QTextBlock
+'''
 
-def assemble( first_text_block: QTextBlock ) -> List[int] :
-    global SYMBOLS, LOOKUP
+    Incremental assembly
 
-    '''
+The user clicks Check or Load after editing a few lines, and most of the
+Statements are just as they were at the last assembly. Evaluating their
+expressions again would give the same bytes. A Statement's bytes can change
+only when its text changes, in which case phase_one has scanned it again and
+set S.changed, or when the value of a name it refers to changes.
 
-    The argument to assemble() is the first QTextBlock of the source
-    document, which can be used as the basis of an iterator over lines in
-    sequence. We iterate over all the text blocks using the .next_block() method
-    of QTextBlock. A returned block with is_valid() false indicates the end.
+The first pass is done in full every time. It is just counting bytes for
+most statements, and it is where the value of every name is found. While
+doing it, we build DEPENDENTS, the index from each name to the Statements
+whose expressions refer to it (phase_one collects the names of a Statement
+in S.references).
 
-    In this first pass, define all labels; count any text_errors; and
-    implement EQU, ORG and DS.
+Then we compare the new symbol table to ASSEMBLED_SYMBOLS, the one used in
+the last second pass. Any name that is new, gone, or has a new value makes
+its dependents stale. The second pass evaluates only the changed and the
+stale Statements. The rest keep their S.value, which is only copied into the
+memory image at the statement's PC, which may have moved.
 
-    Note that the PC starts at 0x0200; this is a historical convention. The
-    original CHIP-8 had the actual emulator code below that address, so
-    programs could not use it. Now we store font patterns there and still do
-    not allow its use.
+A Statement whose evaluation fails keeps S.changed set, so it is tried again
+next time. So is one that had an error in the first pass. When the second
+pass is done, every other Statement is right for the new symbol table, which
+becomes ASSEMBLED_SYMBOLS.
+
+'''
+
+'''
+Put the equates in the order they must be evaluated: every equate after
+all the equates its expression refers to. This is a depth-first search of
+the references from equate to equate, in which an equate goes in the order
+only after all the equates it refers to are in it.
+
+Because an equated value can be used in an ORG or DS, the equates can
+nest as deep as the user likes, so the search keeps its own stack of
+(name, iterator over the names it refers to) instead of recursing. The
+names on the stack are the path from the root of the search to the
+current equate. Meeting one of them again means a circle, which is
+returned as the list of names around it, starting and ending with the
+same name.
+
+Returns the ordered list of EQU Statements, and the list of circles.
+'''
+
+def order_equates( equates : Dict[ str, Statement ] ) -> Tuple[ List[Statement], List[List[str]] ] :
+    order = [] # type: List[Statement]
+    cycles = [] # type: List[List[str]]
+    on_path = set()
+    done = set()
+    for root in equates :
+        if root in done :
+            continue
+        stack = [ ( root, iter( sorted( equates[ root ].references ) ) ) ]
+        on_path.add( root )
+        while stack :
+            ( name, refs ) = stack[-1]
+            for ref in refs :
+                if ref not in equates or ref in done :
+                    continue
+                if ref in on_path :
+                    path = [ entry[0] for entry in stack ]
+                    cycles.append( path[ path.index( ref ) : ] + [ ref ] )
+                    continue
+                on_path.add( ref )
+                stack.append( ( ref, iter( sorted( equates[ ref ].references ) ) ) )
+                break
+            else :
+                '''
+                All the names this one refers to are done (or are in a
+                circle), so it is done.
+                '''
+                stack.pop()
+                on_path.discard( name )
+                done.add( name )
+                order.append( equates[ name ] )
+    return ( order, cycles )
+
+'''
+Define a name in SYMBOLS, and then any equates that were waiting for it.
+
+An equate that could not be evaluated when the first pass began is in the
+waiting dict under each name it still needed, and its count of those names
+is in the missing dict. When the last one is defined, the equate can be
+evaluated, which defines another name, for which other equates may be
+waiting, and so on. The names yet to be defined are kept in a list, so a
+long chain of equates is resolved without recursion.
+
+Returns the count of equates that failed to evaluate. Each is marked with
+its error.
+'''
+
+def define_name( name : str, value : int,
+                 waiting : Dict[ str, List[Statement] ],
+                 missing : Dict[ Statement, int ] ) -> int :
+    errors = 0
+    definitions = [ ( name, value ) ]
+    while definitions :
+        ( name, value ) = definitions.pop()
+        SYMBOLS[ name ] = value
+        for S in waiting.pop( name, [] ) :
+            missing[ S ] -= 1
+            if missing[ S ] == 0 :
+                try :
+                    value = check_value( S.expressions[0], 0, 65535 )
+                    definitions.append( ( S.defined_name, value ) )
+                except Exception as E :
+                    S.expr_error = True
+                    errors += 1
+                    S.error_pos = 0
+                    S.error_msg = str(E)
+    return errors
+
+'''
+The assembler is driven in two ways. The Source window passes the first
+QTextBlock of its document to assemble(), and each block's user data holds
+the Statement for its line. Those Statements persist from one assembly to
+the next, which is what makes incremental assembly possible.
+
+Or a program with no Qt at all (see chip8asm.py) passes lines of text to
+assemble_lines(), which scans each into a new Statement. Those Statements
+are not the document's, so that assembly must not replace the
+ASSEMBLED_SYMBOLS that the next assembly of the document relies on.
+
+Both come down to assemble_statements(), which takes a list of Statements.
+Its directory argument is the folder that the file names of INCLUDE
+statements are relative to (see linker.py), by default the current one. Its
+origin argument is the address of the first statement; only linker.py
+changes it from 0x0200, to find what in an included file must be relocated.
+'''
+
+if TYPE_CHECKING :
+    from PyQt5.QtGui import QTextBlock
+
+def assemble( first_text_block: 'QTextBlock' ) -> List[int] :
+    return assemble_statements( block_statements( first_text_block ) )
+
+'''
+The argument to block_statements() is the first QTextBlock of the source
+document, which can be used as the basis of an iterator over lines in
+sequence. We iterate over all the text blocks using the .next_block() method
+of QTextBlock. A returned block with is_valid() false indicates the end.
+'''
+
+def block_statements( first_text_block: 'QTextBlock' ) -> List[Statement] :
+    statements = [] # type: List[Statement]
+    this_block = first_text_block
+    while this_block.isValid() :
+        statements.append( this_block.userData().statement )
+        this_block = this_block.next()
+    return statements
+
+'''
+Assemble lines of source text, which may end in newlines. Return the result
+of assemble_statements() and the list of Statements, one per line, which
+has the error flags and messages for reporting.
+'''
+
+def assemble_lines( lines : Iterable[str], directory : Optional[str] = None ) -> Tuple[ List[int], List[Statement] ] :
+    from assembler1 import phase_one
+    statements = [] # type: List[Statement]
+    for text in lines :
+        S = Statement()
+        phase_one( text.rstrip( '\r\n' ), S )
+        statements.append( S )
+    return ( assemble_statements( statements, incremental=False, directory=directory ), statements )
+
+'''
+Put the Statements of the document in the state a successful assembly
+would leave them in, from saved results (see asmcache.py): the symbol
+table, and for each Statement that has a value, its index in the list, its
+PC and its value. The symbol table becomes ASSEMBLED_SYMBOLS, so the next
+assembly after an edit is incremental from here, just as after a real
+assembly. The caller must be sure the results were saved from the same
+text, that is, from the same Statements.
+'''
+
+def restore_assembly( statements : List[Statement], symbols : Dict[ str, int ],
+                      values : List[ Tuple[ int, int, List[int] ] ] ) -> None :
+    global SYMBOLS, ASSEMBLED_SYMBOLS
+    for S in statements :
+        S.init_assembly()
+        S.error_pos = None
+        S.error_msg = ''
+        S.changed = False
+    for ( index, PC, value ) in values :
+        S = statements[ index ]
+        S.PC = PC
+        S.value = value
+    SYMBOLS = dict( symbols )
+    ASSEMBLED_SYMBOLS = SYMBOLS
+
+def assemble_statements( statements : List[Statement], incremental : bool = True,
+                         origin : int = 0x0200, directory : Optional[str] = None ) -> List[int] :
+    global SYMBOLS, ASSEMBLED_SYMBOLS, DEPENDENTS
+
+    '''
+    Before anything else, get the object module of each included file.
+    Making a module assembles its file, which replaces SYMBOLS and
+    DEPENDENTS, so it has to be done before this assembly sets them up.
+    Modules are cached by their text, so a file included more than once,
+    under whatever name, or two files with the same text, give the same
+    module. It is included once, at its first INCLUDE; all of the INCLUDEs
+    of it are kept in includes, for their labels.
+    '''
+    includes = [] # type: List[ Tuple[ Statement, linker.ObjectModule ] ]
+    modules = [] # type: List[ Tuple[ Statement, linker.ObjectModule ] ]
+    for S in statements :
+        if S.form == 'INCLUDE' and not S.text_error :
+            module = linker.load_module( S.expressions[0], directory or os.curdir )
+            if not any( module is M for ( _, M ) in includes ) :
+                modules.append( ( S, module ) )
+            includes.append( ( S, module ) )
+
+    '''
+    In the first pass, define all labels and equates; count any
+    text_errors; implement ORG and DS; and index the references to names.
     '''
     SYMBOLS = dict()
+    DEPENDENTS = dict()
     text_errors = 0
     expr_errors = 0
-    PC = 0x0200
-    list_of_deferred_equates = []
-    this_block = first_text_block
-    while this_block.isValid() :
-        U = this_block.userData()
-        S = U.statement
+    '''
+    First, go over the Statements to count text_errors, ready each one for
+    assembly, and index its references. Also catch duplicate definitions
+    here: the first definition of a name stands and any later one is an
+    error. Collect the EQU statements under the names they define.
+    '''
+    defined_names = set()
+    equates = dict() # type: Dict[ str, Statement ]
+    for S in statements :
         '''
         If it is an uncorrected syntax error, just count it.
         '''
@@ -426,55 +657,124 @@ def assemble( first_text_block: QTextBlock ) -> List[int] :
             text_errors += 1
         else :
             '''
-            Clear the Statement fields used by assembly.
+            If the statement was in error at the last assembly, or it has
+            been scanned since then, clear the Statement fields used by
+            assembly, and the error, if any. It will have to be evaluated in
+            the second pass.
             '''
-            S.init_assembly()
+            if S.expr_error or S.changed :
+                S.init_assembly()
+                S.error_pos = None
+                S.error_msg = ''
+                S.changed = True
             '''
-            If this defines a name, try to define that name.
+            Note it as a dependent of each name it refers to.
             '''
+            for name in S.references :
+                DEPENDENTS.setdefault( name, [] ).append( S )
             if S.defined_name : # is not null,
-                '''
-                If the name is already in the symbol table, we have a
-                duplicate definition error.
-                '''
-                if S.defined_name in SYMBOLS :
+                if S.defined_name in defined_names :
                     S.expr_error = True
                     expr_errors += 1
                     S.error_pos = 0
                     S.error_msg = '{} defined multiple times'.format(S.defined_name)
                 else :
-                    '''
-                    If the name is a simple label, define it with the
-                    current PC as its value.
-                    '''
-                    if S.form != 'EQU' :
-                        SYMBOLS[ S.defined_name ] = PC
-                    else:
-                        '''
-                        An equate: try to evaluate its expression and if that
-                        works, bonzer, define it. If it fails for IndexError,
-                        save it to try again later. Any other failure, quit.
-                        '''
-                        try :
-                            value = check_value( S.expressions[0], 0, 65535 )
-                            SYMBOLS[ S.defined_name ] = value
-                        except IndexError as I :
-                            list_of_deferred_equates.append( this_block )
-                        except Exception as E :
-                            S.expr_error = True
-                            expr_errors += 1
-                            S.error_pos = 0
-                            S.error_msg = str(E)
-            # endif S.defined_name
+                    defined_names.add( S.defined_name )
+                    if S.form == 'EQU' :
+                        equates[ S.defined_name ] = S
+    # end for S in statements
+    '''
+    An INCLUDE whose module has errors is in error, showing the first.
+    Otherwise, the names of the module become names of the program, and
+    must not be defined in it or in another module. Define the absolute
+    ones now; the relocatable ones must wait until the modules are placed,
+    after the first pass.
+    '''
+    for ( S, module ) in modules :
+        errors = module.errors
+        if not errors :
+            clashes = sorted( name for name in module.symbols if name in defined_names )
+            if clashes :
+                errors = [ '{} is defined in {} and elsewhere'.format( clashes[0], S.expressions[0] ) ]
+        if errors :
+            S.expr_error = True
+            expr_errors += 1
+            S.error_pos = 0
+            S.error_msg = errors[0]
+            continue
+        for ( name, ( value, relocatable ) ) in module.symbols.items() :
+            defined_names.add( name )
+            if not relocatable :
+                SYMBOLS[ name ] = value
+    modules = [ ( S, module ) for ( S, module ) in modules if not S.expr_error ]
+    '''
+    Put the equates in dependency order, and tag every equate that is part
+    of a circular definition with the whole circle.
+    '''
+    ( equate_order, cycles ) = order_equates( equates )
+    for cycle in cycles :
+        message = 'Circular definition: ' + ' -> '.join( cycle )
+        for name in cycle[ : -1 ] :
+            S = equates[ name ]
+            if not S.expr_error :
+                S.expr_error = True
+                expr_errors += 1
+                S.error_pos = 0
+                S.error_msg = message
+    '''
+    In that order, define every equate that depends only on other equates;
+    those it needs have been defined before it. The rest need labels (or
+    names that are not defined at all). Each of those waits under every
+    name it still needs, with a count of them in missing, until
+    define_name() has defined them all.
+    '''
+    waiting = dict() # type: Dict[ str, List[Statement] ]
+    missing = dict() # type: Dict[ Statement, int ]
+    for S in equate_order :
+        if S.expr_error :
+            continue
+        needs = [ name for name in S.references if name not in SYMBOLS ]
+        if needs :
+            for name in needs :
+                waiting.setdefault( name, [] ).append( S )
+            missing[ S ] = len( needs )
+        else :
+            try :
+                value = check_value( S.expressions[0], 0, 65535 )
+                expr_errors += define_name( S.defined_name, value, waiting, missing )
+            except Exception as E :
+                S.expr_error = True
+                expr_errors += 1
+                S.error_pos = 0
+                S.error_msg = str(E)
+    '''
+    Now the first pass proper: define all labels, implementing ORG and DS.
+    Defining a label completes any equates that were waiting only for it,
+    so by the time an ORG or DS is seen, every equate that can be known at
+    that point, is.
+
+    Note that the PC starts at 0x0200; this is a historical convention. The
+    original CHIP-8 had the actual emulator code below that address, so
+    programs could not use it. Now we store font patterns there and still do
+    not allow its use.
+    '''
+    PC = origin
+    top = PC
+    for S in statements :
+        if not S.text_error :
             '''
-            phase_one leaves S.next_pc an integer except for ORG and DS.
+            If this is a label (and not a duplicate), define it with the
+            current PC as its value. A label on an INCLUDE labels the
+            included code, so it is defined when the module is placed.
             '''
-            if S.next_pc is not None :
-                '''
-                For all normal statements, just advance the PC by S.next_pc.
-                '''
-                PC += S.next_pc
-            elif S.form == 'DS' :
+            if S.defined_name and S.form not in ( 'EQU', 'INCLUDE' ) and not S.expr_error :
+                expr_errors += define_name( S.defined_name, PC, waiting, missing )
+            '''
+            phase_one leaves S.next_pc an integer except for ORG and DS,
+            which get their values here. Those values stay in S.next_pc
+            until the line is scanned again, so test the form first.
+            '''
+            if S.form == 'DS' :
                 '''
                 For DS, evaluate its expression, making sure it does not
                 push PC off the end of memory. Then just advance PC over
@@ -503,6 +803,11 @@ def assemble( first_text_block: QTextBlock ) -> List[int] :
                     expr_errors += 1
                     S.error_pos = 0
                     S.error_msg = str(E)
+            elif S.next_pc is not None :
+                '''
+                For all normal statements, just advance the PC by S.next_pc.
+                '''
+                PC += S.next_pc
             else :
                 S.expr_error = True
                 expr_errors += 1
@@ -521,28 +826,49 @@ def assemble( first_text_block: QTextBlock ) -> List[int] :
             S.error_pos = 0
             S.error_msg = 'Assembly too large, off the end of memory'
             break
-        '''
-        Advance to the next text line.
-        '''
-        this_block = this_block.next()
-    # end while this_block.isValid()
+        top = max( top, PC )
+    # end for S in statements
+    '''
+    Now the size of the program is known, place the included modules after
+    it, in order, and define their relocatable names at their places. Then
+    define the label of each INCLUDE statement that has one as the place of
+    its module.
+    '''
+    placed = [] # type: List[ Tuple[ linker.ObjectModule, int ] ]
+    for ( S, module ) in modules :
+        if top + len( module.code ) > 4096 :
+            S.expr_error = True
+            expr_errors += 1
+            S.error_pos = 0
+            S.error_msg = 'No room in memory for {}'.format( S.expressions[0] )
+            continue
+        for ( name, ( value, relocatable ) ) in module.symbols.items() :
+            if relocatable :
+                expr_errors += define_name( name, value - linker.BASE_ADDRESS + top, waiting, missing )
+        placed.append( ( module, top ) )
+        top += len( module.code )
+    for ( S, module ) in includes :
+        if S.defined_name and not S.expr_error :
+            for ( M, base ) in placed :
+                if M is module :
+                    expr_errors += define_name( S.defined_name, base, waiting, missing )
     '''
-    Pass one is complete. If no errors were noted, try to process any
-    remaining EQU statements. Do them in reversed order, so that if an
-    earlier one depends on a later one, it will resolve.
+    Pass one is complete. If no errors were noted, any equate still not
+    defined is waiting for a name that is not defined anywhere, or that
+    belongs to an equate in error. Say which. (When there were other errors,
+    a label might be missing only because of them, so leave it be.)
     '''
     if 0 == ( expr_errors + text_errors ) :
-        for this_block in reversed( list_of_deferred_equates ) :
-            U = this_block.userData()
-            S = U.statement
-            try :
-                value = check_value( S.expressions[0], 0, 65535 )
-                SYMBOLS[ S.defined_name ] = value
-            except Exception as E :
+        for S in equate_order :
+            if S.defined_name not in SYMBOLS and not S.expr_error :
                 S.expr_error = True
                 expr_errors += 1
                 S.error_pos = 0
-                S.error_msg = str(E)
+                needs = sorted( name for name in S.references if name not in SYMBOLS )
+                if needs[0] in equates :
+                    S.error_msg = 'Depends on {}, which is in error'.format(needs[0])
+                else :
+                    S.error_msg = "Symbol '{}' is undefined".format(needs[0])
 
     '''
     If we have noted any errors in the first pass, just bail returning
@@ -553,12 +879,25 @@ def assemble( first_text_block: QTextBlock ) -> List[int] :
     if ( expr_errors + text_errors ) :
         return [ -1, text_errors, expr_errors ]
 
+    '''
+    Find the Statements made stale by a change in the value of a name since
+    the last second pass. When not assembling incrementally, they all are.
+    '''
+    stale = set()
+    if not incremental :
+        stale = set( statements )
+    elif SYMBOLS != ASSEMBLED_SYMBOLS :
+        for name in SYMBOLS.keys() | ASSEMBLED_SYMBOLS.keys() :
+            if SYMBOLS.get( name ) != ASSEMBLED_SYMBOLS.get( name ) :
+                stale.update( DEPENDENTS.get( name, [] ) )
+
     '''
     All DS, EQU and ORG statements have been processed. Now iterate once more
-    over all text blocks. This time, generate the byte values of each
-    statement and store them in a big array of bytes which we will return.
-    Also, store each normal statement's byte value and PC offset into its
-    Statement structure, so they can be displayed by the editor.
+    over all statements. This time, generate the byte values of each changed
+    or stale statement, and store the byte values of every statement in a big
+    array of bytes which we will return. Also, store each normal statement's
+    byte value and PC offset into its Statement structure, so they can be
+    displayed by the editor.
 
     It is still possible to get errors because it is only now that we try to
     evaluate expressions in opcodes. When exceptions occur in the subordinate
@@ -568,34 +907,41 @@ def assemble( first_text_block: QTextBlock ) -> List[int] :
     at a time.
     '''
     memory_image = [0] * 4096
-    PC = 0x200
+    PC = origin
     top_address = 0
-    this_block = first_text_block
-    while this_block.isValid() :
-        U = this_block.userData()
-        S = U.statement
+    for S in statements :
         if S.form in opcode_dict :
-            try :
-                byte_list = opcode_dict[ S.form ]( S )
-                memory_image[ PC : PC + len( byte_list ) ] = byte_list
-                S.value = list( byte_list )
-                S.PC = PC
-            except Exception as E :
-                expr_errors += 1
-                S.expr_error = True
-                S.error_pos = 0
-                S.error_msg = str( E )
+            if S.changed or S in stale :
+                S.init_assembly()
+                try :
+                    S.value = list( opcode_dict[ S.form ]( S ) )
+                    S.changed = False
+                except Exception as E :
+                    expr_errors += 1
+                    S.expr_error = True
+                    S.error_pos = 0
+                    S.error_msg = str( E )
+            if not S.changed :
+                '''
+                The value is good, new or old. Store it, and its PC, which
+                invalidates the display form if the PC has moved.
+                '''
+                memory_image[ PC : PC + len( S.value ) ] = S.value
+                if S.PC != PC :
+                    S.PC = PC
+                    S.value_dump = ''
             PC += S.next_pc
         else :
             '''
             The only statements not in opcode_dict are DS, EQU and ORG
             and null (comment-only) lines. Increment PC appropriately.
             '''
+            S.changed = False
             if S.form == 'ORG' :
                 PC = S.next_pc
             elif S.form == 'DS' :
                 PC += S.next_pc
-            elif S.form == 'EQU' :
+            elif S.form == 'EQU' or S.form == 'INCLUDE' :
                 pass
             elif S.form == '' :
                 pass
@@ -603,13 +949,21 @@ def assemble( first_text_block: QTextBlock ) -> List[int] :
                 expr_errors += 1
                 S.expr_error = True
                 S.error_pos = 0
+                S.changed = True
                 S.error_msg = 'assembler error S.form{} unexpected'.format(S.form)
                 logging.error( S.error_msg )
 
         # endif S.form in opcode_dict
         top_address = max( top_address, PC )
-        this_block = this_block.next()
     # end loop over statements
+    '''
+    Copy the code of each module, relocated, to its place.
+    '''
+    for ( module, base ) in placed :
+        memory_image[ base : base + len( module.code ) ] = linker.relocate( module, base )
+        top_address = max( top_address, base + len( module.code ) )
+    if incremental :
+        ASSEMBLED_SYMBOLS = SYMBOLS
 
     '''
     If we found any errors on that pass, return [-1, yadda yadda]
@@ -618,7 +972,130 @@ def assemble( first_text_block: QTextBlock ) -> List[int] :
         return [ -1, text_errors, expr_errors ]
 
     '''
-    Successful assembly; return the slice of the memory image from 0x0200
-    through the last byte generated.
+    Successful assembly; return the slice of the memory image from the
+    origin through the last byte generated.
+    '''
+    return memory_image[ origin : top_address ]
+
+if __name__ == '__main__' :
+
+    '''
+    Test the incremental assembly on a list of lines, standing in for the
+    QTextBlocks of a document.
+    '''
+    from assembler1 import phase_one
+
+    class Line() :
+        def __init__( self, lines, index ) :
+            self.lines = lines
+            self.index = index
+        def isValid( self ) :
+            return self.index < len( self.lines )
+        def next( self ) :
+            return Line( self.lines, self.index + 1 )
+        def userData( self ) :
+            return self.lines[ self.index ]
+
+    class Wrapper() :
+        def __init__( self, text ) :
+            self.statement = Statement()
+            phase_one( text, self.statement )
+
+    lines = [ Wrapper( text ) for text in [
+        'SIZE EQU 2',
+        'START: JP LATER',
+        '       LD V0, SIZE',
+        '       ORG START + 8',
+        'LATER: JP START'
+        ] ]
+    assert assemble( Line( lines, 0 ) ) == [ 0x12, 0x08, 0x60, 0x02, 0, 0, 0, 0, 0x12, 0x00 ]
+    assert not any( W.statement.changed for W in lines )
+    '''
+    Nothing changed: the same load, and the ORG is still an ORG.
+    '''
+    assert assemble( Line( lines, 0 ) ) == [ 0x12, 0x08, 0x60, 0x02, 0, 0, 0, 0, 0x12, 0x00 ]
+    '''
+    Change the EQU: only the LD is evaluated again, but its value changes.
     '''
-    return memory_image[ 0x0200 : top_address ]
+    phase_one( 'SIZE EQU 3', lines[0].statement )
+    assert assemble( Line( lines, 0 ) )[ 2 : 4 ] == [ 0x60, 0x03 ]
+    '''
+    Insert a line before START: everything moves, and both jumps change.
+    '''
+    lines.insert( 0, Wrapper( '       CLS' ) )
+    assert assemble( Line( lines, 0 ) ) == [ 0x00, 0xE0, 0x12, 0x0A, 0x60, 0x03, 0, 0, 0, 0, 0x12, 0x02 ]
+    assert lines[1].statement.PC is None and lines[2].statement.PC == 0x202
+    '''
+    A chain of equates written in reverse order, the last of which is used
+    by a DS, and one that waits for a label.
+    '''
+    lines = [ Wrapper( text ) for text in [
+        'A EQU B + 1',
+        'B EQU C * 2',
+        'C EQU D - 1',
+        'D EQU 3',
+        'E EQU THERE - 512',
+        '  DS A',
+        'THERE: LD V1, E'
+        ] ]
+    assert assemble( Line( lines, 0 ) ) == [ 0, 0, 0, 0, 0, 0x61, 0x05 ]
+    assert SYMBOLS[ 'A' ] == 5 and SYMBOLS[ 'E' ] == 5
+    '''
+    A circular definition is reported, with the whole circle, on each of
+    its equates, but not on one that merely uses it.
+    '''
+    lines = [ Wrapper( text ) for text in [
+        'P EQU Q + 1',
+        'Q EQU R',
+        'R EQU P',
+        'T EQU P',
+        '  LD V0, 1'
+        ] ]
+    assert assemble( Line( lines, 0 ) ) == [ -1, 0, 3 ]
+    messages = [ W.statement.error_msg for W in lines ]
+    assert messages[0] == 'Circular definition: P -> Q -> R -> P'
+    assert messages[1] == messages[2] == messages[0]
+    assert messages[3] == ''
+    '''
+    An included file is placed after the program and relocated there, and
+    the program can use its names.
+    '''
+    import shutil, tempfile
+    with tempfile.TemporaryDirectory() as directory :
+        with open( os.path.join( directory, 'lib.asm' ), 'w' ) as file :
+            file.write( '\n'.join( [
+                'FIVE EQU 5',
+                'SHOW:   LD I, SPRITE',
+                '        CALL HELPER',
+                '        RET',
+                'HELPER: LD V0, FIVE',
+                '        RET',
+                'SPRITE: DB #F0, #90',
+                'TABLE:  DW SPRITE, 1234'
+                ] ) )
+        ( image, statements ) = assemble_lines( [
+            "       INCLUDE 'lib.asm'",
+            'MAIN:  CALL SHOW',
+            '       LD V1, FIVE',
+            '       JP MAIN'
+            ], directory )
+        assert image == [ 0x22, 0x06, 0x61, 0x05, 0x12, 0x00,
+                          0xA2, 0x10, 0x22, 0x0C, 0x00, 0xEE, 0x60, 0x05, 0x00, 0xEE,
+                          0xF0, 0x90, 0x02, 0x10, 0x04, 0xD2 ]
+        assert SYMBOLS[ 'TABLE' ] == 0x212 and SYMBOLS[ 'FIVE' ] == 5
+        ( image, statements ) = assemble_lines( [ '  CLS', "LIB: INCLUDE 'lib.asm'", '  JP LIB' ], directory )
+        assert SYMBOLS[ 'LIB' ] == SYMBOLS[ 'SHOW' ] == 0x204 and image[ 2 : 4 ] == [ 0x12, 0x04 ]
+        '''
+        The same text, under another name or from another file, is the same
+        module: included once, and each label on an INCLUDE of it is its place.
+        '''
+        shutil.copy( os.path.join( directory, 'lib.asm' ), os.path.join( directory, 'copy.asm' ) )
+        ( image, statements ) = assemble_lines( [
+            "A: INCLUDE './lib.asm'", "B: INCLUDE 'copy.asm'", "C: INCLUDE 'lib.asm'", '  JP A' ], directory )
+        assert image[0] != -1 and len( image ) == 18
+        assert SYMBOLS[ 'A' ] == SYMBOLS[ 'B' ] == SYMBOLS[ 'C' ] == SYMBOLS[ 'SHOW' ] == 0x202
+        ( image, statements ) = assemble_lines( [ "  INCLUDE 'lib.asm'", 'FIVE: CLS' ], directory )
+        assert image == [ -1, 0, 1 ]
+        assert statements[0].error_msg == 'FIVE is defined in lib.asm and elsewhere'
+        ( image, statements ) = assemble_lines( [ "  INCLUDE 'nothing.asm'" ], directory )
+        assert image == [ -1, 0, 1 ] and statements[0].error_msg.startswith( 'nothing.asm: ' )
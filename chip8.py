@@ -23,12 +23,14 @@ __maintainer__ = "David Cortesi"
 __email__ = "davecortesi@gmail.com"
 
 import logging
-from typing import List
+from typing import List, Tuple
 
 '''
-Get access to display.py methods such as sound() and key_read().
+Get access to the emulated I/O state in chip8io.py: the screen, the tone and
+the keypad. That module has no Qt content, so neither does the emulator, which
+can run on a thread that never touches a Qt object.
 '''
-import display
+import chip8io
 
 '''
 Define the names that comprise the public API to this module. No other names
@@ -49,6 +51,8 @@ __all__ = [
     'reset_anticipation', # register to anticipate reset
     'reset_notify', # register a callback for memory reset
     'memory_notify', # register a callback for memory change
+    'mark_dirty',   # note a range of memory changed
+    'take_dirty',   # get and clear the changed ranges of memory
     'initialize',   # do some startup TBS
     'shutdown'      # do some shutdown TBS
 ]
@@ -162,6 +166,34 @@ def memory_notify( callback : Callable ) -> None :
     global MEMORY_NOTIFY_LIST
     MEMORY_NOTIFY_LIST.append( callback )
 
+'''
+Keep a list of the ranges of memory changed by the emulator since anyone
+last asked, so the Memory window can update only those cells, not all 4096.
+Each range is a tuple ( start, end ) with end exclusive. STM and STD add a
+range; reset_vm() marks all of memory. A long run of stores can add a great
+many small ranges, so past DIRTY_LIMIT of them the list is collapsed into one
+range that spans them all.
+
+take_dirty() returns the list and clears it. mark_dirty() is also called from
+chip8proc.py, to pass on the stores made in the emulator process.
+'''
+
+DIRTY_RANGES = [] # type: List[Tuple[int,int]]
+DIRTY_LIMIT = 64
+
+def mark_dirty( start : int, end : int ) -> None :
+    global DIRTY_RANGES
+    DIRTY_RANGES.append( ( start, end ) )
+    if len( DIRTY_RANGES ) > DIRTY_LIMIT :
+        DIRTY_RANGES = [ ( min( r[0] for r in DIRTY_RANGES ),
+                           max( r[1] for r in DIRTY_RANGES ) ) ]
+
+def take_dirty( ) -> List[Tuple[int,int]] :
+    global DIRTY_RANGES
+    ranges = DIRTY_RANGES
+    DIRTY_RANGES = []
+    return ranges
+
 '''
 Store a list of 0 or more callables to be called when the emulated
 machine is about to reset. In case, you know, you want to stop a
@@ -207,7 +239,7 @@ Reset the virtual machine to starting condition:
 * Sound turned off
 * Latched keypad key unlatched
 * Memory cleared
-* MEMORY_CHANGED flag set True
+* All of memory marked as changed
 * 5x4 font sprites loaded in 0x0000..0x004F (5*16 == 80 == 0x50)
 * 10x8 SCHIP font sprites loaded in 0x0050..0x00EF (10*16 == 160 == 0xA0)
 * Optionally, memory from 0x0200 loaded with a program
@@ -255,7 +287,7 @@ def reset_vm( memload : List[int] = None ) -> None :
     '''
     Reset the display to CHIP-8 mode, sound off, latched key cleared
     '''
-    display.reset_io()
+    chip8io.reset_io()
 
     '''
     Clear memory, load font sprites
@@ -271,7 +303,13 @@ def reset_vm( memload : List[int] = None ) -> None :
     '''
     if memload is not None :
         assert len( memload ) <= (4096-0x0200)
-        MEMORY[ 0x0200 : 0x01FF + len( memload ) ] = memload
+        MEMORY[ 0x0200 : 0x0200 + len( memload ) ] = memload
+
+    '''
+    All of memory is new, whoever displays it must show all of it.
+    '''
+    take_dirty()
+    mark_dirty( 0, 4096 )
 
     '''
     If anyone cares, let them know we are done changing.
@@ -303,11 +341,16 @@ def bp_rem( bp : int ) -> bool :
 '''
 Initialize the module on first load. We get a settings object
 and save it.
+
+QSettings is imported only for the type checker. The assembler imports this
+module for the register names, and it can run where Qt is not installed.
 '''
 
-from PyQt5.QtCore import QSettings
+from typing import TYPE_CHECKING
+if TYPE_CHECKING :
+    from PyQt5.QtCore import QSettings
 
-def initialize( settings : QSettings ) -> None :
+def initialize( settings : 'QSettings' ) -> None :
     global SETTINGS
     SETTINGS = settings
     reset_vm( )
@@ -322,17 +365,19 @@ def closeEvent( ) -> None :
 
 '''
 Note passage of 1/60th of second by decrementing the T and S regs.
-If the sound was on and goes to 0, turn the sound off.
+If the sound was on and goes to 0, turn the sound off. The tick is also
+counted in chip8io, which stamps the tone changes with the count.
 '''
 
 def tick( ) -> None :
     global REGS
+    chip8io.tick()
     if REGS[R.T] :
         REGS[R.T] -= 1
     if REGS[R.S] :
         REGS[R.S] -= 1
         if REGS[R.S] == 0 :
-            display.sound( False )
+            chip8io.sound( False )
 
 
 '''
@@ -406,11 +451,11 @@ See also do_wait_key() for a special case.
 
 '''
 00Cx scroll down x lines. This is an SCHIP instruction. However
-we leave it to the display module to decide whether it can be
+we leave it to the chip8io module to decide whether it can be
 executed, or how.
 '''
 def do_scroll_down( INST : int, PC : int ) -> int :
-    display.scroll_down( INST & 0x000F )
+    chip8io.scroll_down( INST & 0x000F )
     return PC+2
 
 '''
@@ -418,7 +463,7 @@ def do_scroll_down( INST : int, PC : int ) -> int :
 '''
 def do_clear( INST : int, PC : int ) -> int :
 
-    display.clear()
+    chip8io.clear()
     return PC+2
 
 '''
@@ -437,7 +482,7 @@ def do_sub_return( INST : int, PC : int ) -> int :
 '''
 def do_scroll_right( INST : int, PC : int ) -> int :
 
-    display.scroll_right()
+    chip8io.scroll_right()
     return PC+2
 
 '''
@@ -445,7 +490,7 @@ def do_scroll_right( INST : int, PC : int ) -> int :
 '''
 def do_scroll_left( INST: int, PC: int ) -> int :
 
-    display.scroll_left()
+    chip8io.scroll_left()
     return PC+2
 
 '''
@@ -460,7 +505,7 @@ def do_exit( INST: int, PC: int ) -> int :
 '''
 def do_small_screen( INST: int, PC: int ) -> int :
 
-    display.set_mode( False )
+    chip8io.set_mode( False )
     return PC+2
 
 '''
@@ -468,7 +513,7 @@ def do_small_screen( INST: int, PC: int ) -> int :
 '''
 def do_big_screen( INST: int, PC: int ) -> int :
 
-    display.set_mode( True )
+    chip8io.set_mode( True )
     return PC+2
 
 '''
@@ -735,7 +780,7 @@ remotely possible and we check for it.
 
 We support the SCHIP feature that sprite length of 0 means a 16-bit x 16-bit (32-byte)
 sprite. The whole sprite as a list of bytes is passed to
-display.draw_sprite() for drawing. It returns True if any white pixel matched
+chip8io.draw_sprite() for drawing. It returns True if any white pixel matched
 an existing white pixel, erasing it.
 '''
 def do_draw_sprite( INST: int, PC: int ) -> int :
@@ -757,7 +802,7 @@ def do_draw_sprite( INST: int, PC: int ) -> int :
         raise ValueError( emsg_format( EMSG_BAD_ADDRESS, INST, PC ) )
 
     sprite = MEMORY[ address : address+count ]
-    hit = display.draw_sprite( x_coord, y_coord, sprite )
+    hit = chip8io.draw_sprite( x_coord, y_coord, sprite )
     REGS[ R.vF ] = 1 if hit else 0
     return PC+2
 
@@ -771,7 +816,7 @@ def decode_Exxx( INST: int, PC: int ) -> int :
 
     reg = (INST & 0x0F00) >> 8
     key = REGS[ reg ] & 0x0F
-    down_key = display.key_test() # a down key or None
+    down_key = chip8io.key_test() # a down key or None
 
     instruction = INST & 0xF0FF
     if instruction == 0xE09E :
@@ -806,9 +851,9 @@ def do_read_timer( INST: int, PC: int ) -> int :
 
 So this instruction locks up the virtual machine until a key is pressed AND
 released. However, we do not want to enter a solid loop testing for a key
-(and then testing for its release) because that would prevent Qt events from
-being processed, which would mean the display window could never register the
-key-press! Also, we want to let the user break out of this instruction by
+(and then testing for its release) because that would prevent the run thread
+from taking in the key commands sent by the display window, so it could never
+register the key-press! Also, we want to let the user break out of this instruction by
 clicking off the Run button in the Memory window.
 
 So we play a trick: until a key has been pressed and released, we return
@@ -827,7 +872,7 @@ def do_wait_key( INST: int, PC: int ) -> int :
         '''
         We have not as yet seen a key go down.
         '''
-        key = display.key_read()
+        key = chip8io.key_read()
         if key >= 0 :
             '''
             A key is down. Note it, but in any case return PC+0 so we retry.
@@ -838,7 +883,7 @@ def do_wait_key( INST: int, PC: int ) -> int :
         A key has made contact; is it still down?
         Note: use key_test so a not to "consume" the next key.
         '''
-        if KEY_STATE != display.key_test() :
+        if KEY_STATE != chip8io.key_test() :
             '''
             Either the key has been released so that key_test() returns -1,
             or a different key has been pressed; either way this instruction
@@ -871,7 +916,7 @@ def do_set_tone( INST: int, PC: int ) -> int :
 
     val = REGS[ (INST & 0x0F00) >> 8 ]
     REGS[ R.S ] = val
-    display.sound( val != 0 )
+    chip8io.sound( val != 0 )
 
     return PC+2
 
@@ -942,6 +987,7 @@ def do_store_decimal( INST: int, PC: int ) -> int :
     MEMORY[ I_reg ] = int( vx/100 ) # high digit
     MEMORY[ I_reg + 1 ] = int( vx % 100 / 10 )
     MEMORY[ I_reg + 2 ] = int( vx % 10 )
+    mark_dirty( I_reg, I_reg + 3 )
     do_notify( MEMORY_NOTIFY_LIST )
     return PC+2
 
@@ -980,6 +1026,7 @@ def do_store_regs( INST: int, PC: int ) -> int :
         MEMORY[ I_reg ] = REGS[ i ]
         I_reg += 1
 
+    mark_dirty( REGS[R.I], I_reg )
     REGS[R.I] = I_reg # "I = I + X + 1" as per COSMAC manual
     do_notify( MEMORY_NOTIFY_LIST )
     return PC+2
@@ -1290,3 +1337,13 @@ if __name__ == '__main__' :
     assert REGS[R.v9] == 0
 
 
+
+    # test dirty ranges from STM and STBCD
+    simprog = binasm( 'A300 62FF F255 F233 ' )
+    reset_vm( simprog )
+    assert take_dirty() == [ ( 0, 4096 ) ]
+    step( ) ; step( ) ; step( )
+    assert take_dirty() == [ ( 0x300, 0x303 ) ]
+    step( )
+    assert take_dirty() == [ ( 0x303, 0x306 ) ]
+    assert MEMORY[ 0x303 : 0x306 ] == [ 2, 5, 5 ]
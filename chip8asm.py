@@ -0,0 +1,190 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 Command-line Assembler
+
+This module has no Qt content. It assembles source files to CHIP-8 binary
+files without the IDE, for example from a build script:
+
+    python -m chip8asm [-o OUTDIR] [--optimize] PATH...
+
+Each PATH is a source file, or a directory, all of whose files (in it and
+in any folders below it) are assembled. The binary of a file goes next to
+it, or in OUTDIR if one is given, with the same name but the suffix .ch8.
+When a directory is named, its folder structure is repeated under OUTDIR.
+For example, this assembles all the sample programs into a build folder:
+
+    python -m chip8asm -o build extras/source
+
+A file is treated as source the way File>Open treats it: if its bytes
+decode as ASCII. Other files in a directory are assumed to be binaries
+and skipped. (A binary named explicitly is an error.)
+
+Errors are reported one per line as path:line: message, the form most
+editors can jump to. The exit status is 0 when every file assembled, and 1
+when any did not; the binaries of the good ones are still written.
+
+With --optimize, each program is improved by the peephole optimizer
+(peephole.py) and each rewrite it makes is listed, in the same form.
+
+The lines of each file go to assembler2.assemble_lines(), which scans and
+assembles them exactly as the Source window would.
+
+'''
+
+import argparse
+import os
+import sys
+
+from typing import List, Optional, Tuple
+
+from assembler2 import assemble_lines
+
+__all__ = [ 'read_source', 'source_files', 'assemble_file', 'main' ]
+
+BINARY_SUFFIX = '.ch8'
+
+'''
+Read a file and return its text if it is an assembler source, or None if it
+appears to be a binary; see source.py file_open(). An error reading the
+file, e.g. a missing file, raises OSError.
+'''
+
+def read_source( path : str ) -> Optional[str] :
+    with open( path, 'rb' ) as file :
+        byte_string = file.read()
+    try :
+        return byte_string.decode( 'ASCII', errors='strict' )
+    except UnicodeDecodeError :
+        return None
+
+'''
+Form the output path for an input path: the same name with a new suffix,
+beside it, or in out_dir at the same place relative to out_dir as the input
+is relative to root.
+'''
+
+def output_path( path : str, root : str, out_dir : Optional[str], suffix : str ) -> str :
+    stem = os.path.splitext( path )[0]
+    if out_dir is None :
+        return stem + suffix
+    return os.path.join( out_dir, os.path.relpath( stem, root ) + suffix )
+
+'''
+Expand the PATH arguments to a list of (input path, output path) pairs.
+A file is paired with its output path; a directory contributes all the
+files below it, in sorted order so the output is the same on every
+platform.
+'''
+
+def source_files( paths : List[str], out_dir : Optional[str], suffix : str = BINARY_SUFFIX ) -> List[Tuple[str,str]] :
+    pairs = [] # type: List[Tuple[str,str]]
+    for path in paths :
+        if os.path.isdir( path ) :
+            for ( folder, subfolders, names ) in os.walk( path ) :
+                subfolders.sort()
+                for name in sorted( names ) :
+                    file_path = os.path.join( folder, name )
+                    pairs.append( ( file_path, output_path( file_path, path, out_dir, suffix ) ) )
+        else :
+            pairs.append( ( path, output_path( path, os.path.dirname( path ) or os.curdir, out_dir, suffix ) ) )
+    return pairs
+
+'''
+Assemble one source text. Return the binary as bytes, or None if there were
+errors, and a list of messages in path:line: message form: the errors, or
+when optimizing (see peephole.py), the rewrites the optimizer made.
+'''
+
+def assemble_file( path : str, text : str, optimize : bool = False ) -> Tuple[ Optional[bytes], List[str] ] :
+    directory = os.path.dirname( path ) or os.curdir
+    ( result, statements ) = assemble_lines( text.splitlines(), directory )
+    messages = [] # type: List[str]
+    if result and result[0] < 0 :
+        for ( number, S ) in enumerate( statements, 1 ) :
+            if S.text_error or S.expr_error :
+                messages.append( '{}:{}: {}'.format( path, number, S.error_msg ) )
+        return ( None, messages )
+    if optimize :
+        from peephole import optimize as optimize_statements
+        ( result, rewrites ) = optimize_statements( statements, result, directory )
+        for ( index, message, saved_bytes, saved_instructions ) in rewrites :
+            messages.append( '{}:{}: {} (saves {} bytes, {} instructions each time)'.format(
+                path, index + 1, message, saved_bytes, saved_instructions ) )
+    return ( bytes( result ), messages )
+
+'''
+Run the command. Each file is reported as it is done, so a long build shows
+its progress. Return the exit status.
+'''
+
+def main( argv : Optional[List[str]] = None ) -> int :
+    parser = argparse.ArgumentParser(
+        prog='chip8asm',
+        description='Assemble CHIP-8 source files to binary ({}) files.'.format( BINARY_SUFFIX ) )
+    parser.add_argument( 'paths', metavar='PATH', nargs='+',
+                         help='a source file, or a directory of them' )
+    parser.add_argument( '-o', '--output', metavar='OUTDIR', default=None,
+                         help='write binaries here instead of beside their sources' )
+    parser.add_argument( '--optimize', action='store_true',
+                         help='rewrite instruction sequences into cheaper ones, and list the rewrites' )
+    args = parser.parse_args( argv )
+
+    failures = 0
+    for ( in_path, out_path ) in source_files( args.paths, args.output ) :
+        named = in_path in args.paths
+        try :
+            text = read_source( in_path )
+        except OSError as E :
+            print( '{}: {}'.format( in_path, E ), file=sys.stderr )
+            failures += 1
+            continue
+        if text is None :
+            if named :
+                print( '{}: not an assembler source'.format( in_path ), file=sys.stderr )
+                failures += 1
+            continue
+        ( binary, messages ) = assemble_file( in_path, text, args.optimize )
+        if binary is None :
+            for message in messages :
+                print( message, file=sys.stderr )
+            failures += 1
+            continue
+        try :
+            os.makedirs( os.path.dirname( out_path ) or '.', exist_ok=True )
+            with open( out_path, 'wb' ) as file :
+                file.write( binary )
+        except OSError as E :
+            print( '{}: {}'.format( out_path, E ), file=sys.stderr )
+            failures += 1
+            continue
+        print( '{} -> {} ({} bytes)'.format( in_path, out_path, len( binary ) ) )
+        for message in messages :
+            print( message )
+    return 1 if failures else 0
+
+if __name__ == '__main__' :
+    sys.exit( main() )
@@ -0,0 +1,247 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 Batch Assembly and Disassembly
+
+This module has no Qt content. It processes whole trees of CHIP-8 programs
+at once, using all the CPU cores:
+
+    python -m chip8batch [-o OUTDIR] [-j JOBS] [--summary FILE] PATH...
+
+Every file in or below each PATH (or a file named as a PATH) is looked at.
+As with File>Open, a file whose bytes decode as ASCII is a source, and is
+assembled to a binary with the suffix .ch8. Any other file is taken to be a
+binary, and is disassembled to a source with the suffix .dis.asm. Outputs go
+beside their inputs, or into the same folder structure under OUTDIR.
+
+A file that is the output of another file in the batch is not an input.
+So a tree can be built in place again and again: foo.ch8, made from foo.asm,
+is not disassembled, and bar.dis.asm, made from bar, is not assembled.
+
+The files are divided among JOBS worker processes (by default, one per CPU
+core) with a concurrent.futures.ProcessPoolExecutor. Each worker imports the
+assembler once and then handles many files, so the time to start a process
+is spread over them. With -j 1 everything is done in this process.
+
+As each file is finished its result is reported; errors go to stderr in
+path:line: message form as for chip8asm. With --summary, a JSON summary is
+also written to FILE (or to stdout, if FILE is -). It is an object with
+
+    "files": a list, in order of the paths, of one object per file:
+        "path": the input path,
+        "action": "assemble" or "disassemble",
+        "output": the output path, or null if there was an error,
+        "ok": true or false,
+        "input_bytes", "output_bytes": the sizes of input and output,
+        "errors": a list of error messages, empty when ok,
+        "seconds": the time spent on the file;
+    "assembled", "disassembled", "failed": counts of files,
+    "jobs": the number of worker processes,
+    "seconds": the elapsed time of the whole batch.
+
+The exit status is 0 when every file succeeded and 1 otherwise.
+
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from chip8asm import BINARY_SUFFIX, source_files
+
+__all__ = [ 'batch_files', 'process_file', 'run_batch', 'main' ]
+
+SOURCE_SUFFIX = '.dis.asm'
+
+'''
+A disassembly is refused for a file larger than the memory of the machine
+above 0x200; see disassemble.py.
+'''
+MAX_BINARY_SIZE = 3584
+
+'''
+Expand the PATH arguments to a list of (input path, output stem) pairs,
+where the output stem is the output path without its suffix. Drop the
+inputs that are outputs of other inputs. An input can be its own output,
+as game.ch8 is when built in place (its stem is game), and that does not
+drop it.
+'''
+
+def batch_files( paths : List[str], out_dir : Optional[str] ) -> List[Tuple[str,str]] :
+    pairs = source_files( paths, out_dir, suffix='' )
+    producers = dict() # type: Dict[ str, Set[str] ]
+    for ( in_path, stem ) in pairs :
+        for suffix in ( BINARY_SUFFIX, SOURCE_SUFFIX ) :
+            producers.setdefault( os.path.normpath( stem + suffix ), set() ).add( os.path.normpath( in_path ) )
+    return [ ( in_path, stem ) for ( in_path, stem ) in pairs
+             if not producers.get( os.path.normpath( in_path ), set() ) - { os.path.normpath( in_path ) } ]
+
+'''
+Assemble or disassemble one file, writing its output, and return its entry
+for the summary. This runs in a worker process, so it does not print; it
+returns everything the parent needs to report. Any error reading or writing
+is reported in the entry, not raised, so one bad file does not stop the
+batch.
+'''
+
+def process_file( pair : Tuple[str,str] ) -> Dict :
+    ( in_path, stem ) = pair
+    started = time.perf_counter()
+    entry = { 'path' : in_path, 'action' : 'assemble', 'output' : None,
+              'ok' : False, 'input_bytes' : 0, 'output_bytes' : 0,
+              'errors' : [], 'seconds' : 0.0 }
+    try :
+        with open( in_path, 'rb' ) as file :
+            byte_string = file.read()
+        entry[ 'input_bytes' ] = len( byte_string )
+        try :
+            text = byte_string.decode( 'ASCII', errors='strict' )
+        except UnicodeDecodeError :
+            text = None
+        if text is not None :
+            from chip8asm import assemble_file
+            out_path = stem + BINARY_SUFFIX
+            ( output, messages ) = assemble_file( in_path, text )
+            entry[ 'errors' ] = messages
+        else :
+            from disassemble import disassemble
+            entry[ 'action' ] = 'disassemble'
+            out_path = stem + SOURCE_SUFFIX
+            output = None
+            if len( byte_string ) > MAX_BINARY_SIZE :
+                entry[ 'errors' ] = [ '{}: too long to be a CHIP-8 program'.format( in_path ) ]
+            else :
+                output = ( disassemble( byte_string ) + '\n' ).encode( 'ASCII' )
+        if output is not None :
+            os.makedirs( os.path.dirname( out_path ) or os.curdir, exist_ok=True )
+            with open( out_path, 'wb' ) as file :
+                file.write( output )
+            entry[ 'output' ] = out_path
+            entry[ 'output_bytes' ] = len( output )
+            entry[ 'ok' ] = True
+    except OSError as E :
+        entry[ 'errors' ] = [ '{}: {}'.format( in_path, E ) ]
+    entry[ 'seconds' ] = round( time.perf_counter() - started, 6 )
+    return entry
+
+'''
+Process all the files, in jobs worker processes, and return the summary.
+The results come back in the order of the files, each as soon as it and the
+ones before it are done, and report(), if given, is called with each.
+
+The files are handed to the workers in chunks, so that each trip to a
+worker carries enough work to be worth it, while still giving every worker
+several chunks to even out the load.
+'''
+
+def run_batch( pairs : List[Tuple[str,str]], jobs : int, report=None ) -> Dict :
+    started = time.perf_counter()
+    entries = [] # type: List[Dict]
+    if jobs <= 1 or len( pairs ) <= 1 :
+        jobs = 1
+        results = map( process_file, pairs )
+        for entry in results :
+            entries.append( entry )
+            if report : report( entry )
+    else :
+        from concurrent.futures import ProcessPoolExecutor
+        chunk = max( 1, len( pairs ) // ( jobs * 4 ) )
+        with ProcessPoolExecutor( max_workers=jobs ) as executor :
+            for entry in executor.map( process_file, pairs, chunksize=chunk ) :
+                entries.append( entry )
+                if report : report( entry )
+    return {
+        'files' : entries,
+        'assembled' : sum( 1 for E in entries if E[ 'ok' ] and E[ 'action' ] == 'assemble' ),
+        'disassembled' : sum( 1 for E in entries if E[ 'ok' ] and E[ 'action' ] == 'disassemble' ),
+        'failed' : sum( 1 for E in entries if not E[ 'ok' ] ),
+        'jobs' : jobs,
+        'seconds' : round( time.perf_counter() - started, 6 )
+        }
+
+'''
+Report one file as it is finished: its errors, and unless the summary is
+going to stdout, its output.
+'''
+
+def report_entry( entry : Dict, progress : bool = True ) -> None :
+    for message in entry[ 'errors' ] :
+        print( message, file=sys.stderr )
+    if entry[ 'ok' ] and progress :
+        print( '{} -> {} ({} bytes)'.format( entry[ 'path' ], entry[ 'output' ], entry[ 'output_bytes' ] ) )
+
+'''
+Run the command and return the exit status.
+'''
+
+def main( argv : Optional[List[str]] = None ) -> int :
+    parser = argparse.ArgumentParser(
+        prog='chip8batch',
+        description='Assemble every CHIP-8 source and disassemble every binary in a tree.' )
+    parser.add_argument( 'paths', metavar='PATH', nargs='+',
+                         help='a file, or a directory of them' )
+    parser.add_argument( '-o', '--output', metavar='OUTDIR', default=None,
+                         help='write outputs here instead of beside their inputs' )
+    parser.add_argument( '-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                         help='number of worker processes (default: one per CPU)' )
+    parser.add_argument( '--summary', metavar='FILE', default=None,
+                         help='write a JSON summary to FILE, or to stdout if FILE is -' )
+    args = parser.parse_args( argv )
+
+    pairs = batch_files( args.paths, args.output )
+    to_stdout = args.summary == '-'
+    summary = run_batch( pairs, args.jobs,
+                         lambda entry : report_entry( entry, progress=not to_stdout ) )
+    if args.summary is not None :
+        if to_stdout :
+            json.dump( summary, sys.stdout, indent=1 )
+            print()
+        else :
+            with open( args.summary, 'w' ) as file :
+                json.dump( summary, file, indent=1 )
+    if not to_stdout :
+        print( '{} assembled, {} disassembled, {} failed in {:.2f} seconds'.format(
+            summary[ 'assembled' ], summary[ 'disassembled' ], summary[ 'failed' ], summary[ 'seconds' ] ) )
+    return 1 if summary[ 'failed' ] else 0
+
+if __name__ == '__main__' :
+    if len( sys.argv ) > 1 :
+        sys.exit( main() )
+    '''
+    With no arguments, test batch_files(). A binary is kept even though it
+    is its own output; a binary or disassembly made from another input is
+    dropped.
+    '''
+    def inputs( paths ) :
+        return [ in_path for ( in_path, stem ) in batch_files( paths, None ) ]
+    assert inputs( [ 'roms/game.ch8' ] ) == [ 'roms/game.ch8' ]
+    assert inputs( [ 'roms/game.asm', 'roms/game.ch8' ] ) == [ 'roms/game.asm' ]
+    assert inputs( [ 'roms/game.ch8', 'roms/game.dis.asm' ] ) == [ 'roms/game.ch8' ]
+    assert inputs( [ 'roms/game.ch8', 'roms/other.ch8' ] ) == [ 'roms/game.ch8', 'roms/other.ch8' ]
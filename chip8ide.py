@@ -32,197 +32,250 @@ We use the name of the app in a couple of places so define it once.
 APPNAME = 'CHIP8IDE'
 
 '''
-Determine the platform. Based on that, work out the path to a writable
-location for our log files.
+Everything from here on is done only when this file is run as the program.
+When the emulator runs in a child process started by "spawn" (see
+chip8proc.py), the child imports this file again, and must not start a
+second copy of the app.
 '''
 
-import sys
-import os
+if __name__ == '__main__' :
 
-if sys.platform == 'darwin' : # Mac OS
-    log_path = os.path.expanduser( '~/Library/Logs' )
+    '''
+    Determine the platform. Based on that, work out the path to a writable
+    location for our log files.
+    '''
 
-elif hasattr( sys, 'getwindowsversion' ) : # Some level of Windows
-    if 'TMP' in os.environ :
-        log_path = os.environ['TMP']
-    elif 'TEMP' in os.environ :
-        log_path = os.environ['TEMP']
-    elif 'WINDIR' in os.environ :
-        log_path = os.path.join( os.environ['WINDIR'], 'TEMP' )
-    else :
-        log_path = '/Windows/Temp'
+    import sys
+    import os
 
-else: # Assuming Linux; could be BSD
-    log_path = '/var/tmp'
+    if sys.platform == 'darwin' : # Mac OS
+        log_path = os.path.expanduser( '~/Library/Logs' )
 
-log_path = os.path.join( log_path, 'CHIP8IDE.log' )
+    elif hasattr( sys, 'getwindowsversion' ) : # Some level of Windows
+        if 'TMP' in os.environ :
+            log_path = os.environ['TMP']
+        elif 'TEMP' in os.environ :
+            log_path = os.environ['TEMP']
+        elif 'WINDIR' in os.environ :
+            log_path = os.path.join( os.environ['WINDIR'], 'TEMP' )
+        else :
+            log_path = '/Windows/Temp'
 
-'''
-Prepare logging to a rotating set of log files located on that path.
-'''
+    else: # Assuming Linux; could be BSD
+        log_path = '/var/tmp'
 
-import logging, logging.handlers
-log_handler = logging.handlers.RotatingFileHandler(
-    log_path, mode='a', encoding='UTF-8', maxBytes=100000, backupCount=5
-)
+    log_path = os.path.join( log_path, 'CHIP8IDE.log' )
 
-'''
-Check for an environment variable CHIP8_LOG_LEVEL and if it
-is present, use it to set the log-level.
-'''
-log_levels = {
-    'CRITICAL':logging.CRITICAL,
-    'DEBUG':logging.DEBUG,
-    'ERROR':logging.ERROR,
-    'FATAL':logging.FATAL,
-    'INFO':logging.INFO
-}
-choice = 'INFO'
-desired_level = log_levels[ choice ]
-
-if 'CHIP8_LOG_LEVEL' in os.environ :
-    choice = os.environ['CHIP8_LOG_LEVEL'].upper()
-    if choice in log_levels :
-        desired_level = log_levels[ choice ]
-
-logging.basicConfig( handlers=[log_handler], level=desired_level )
+    '''
+    Prepare logging to a rotating set of log files located on that path.
+    '''
 
-'''
-Write startup lines to the log
-'''
-import datetime
-now = datetime.datetime.now()
-
-from PyQt5.QtCore import PYQT_VERSION_STR
-from PyQt5.QtCore import QT_VERSION_STR
-
-logging.info( '==========================================' )
-logging.info(
-    '{} starting up on {} with Qt {} and PyQt {}'.format(
-        APPNAME,
-        now.ctime(),
-        QT_VERSION_STR,
-        PYQT_VERSION_STR
+    import logging, logging.handlers
+    log_handler = logging.handlers.RotatingFileHandler(
+        log_path, mode='a', encoding='UTF-8', maxBytes=100000, backupCount=5
     )
-)
-if choice not in log_levels :
-    logging.error( 'Unknown value for CHIP8_LOG_LEVEL: {}'.format(choice) )
-    logging.error( 'Logging at INFO level' )
-
-'''
-Create the QApplication. This does a ton of Qt setup stuff.
-'''
-
-from PyQt5.QtWidgets import QApplication
-args = []
-the_app = QApplication( args )
-
-'''
-With the application started, set the constants that define where
-the settings file is stored and what it is called. Then open the settings.
-
-Locations for Qt settings values:
-Linux: $HOME/.config/TassoSoft/CHIP8IDE.conf
-Mac OSX: $HOME/Library/Preferences/com.TassoSoft.CHIP8IDE.plist
-Windows (registry): HKEY_CURRENT_USER\Software\TassoSoft\CHIP8IDE
-
-'''
-
-the_app.setOrganizationName( "TassoSoft" )
-the_app.setOrganizationDomain( "tassos-oak.com" )
-the_app.setApplicationName( APPNAME )
-
-from PyQt5.QtCore import QSettings
-the_settings = QSettings()
-
-'''
-Uncomment the following to wipe all settings forcing windows
-back to their defaults.
-'''
-#the_settings.clear()
-
-'''
-Import all the modules. This lets Python create their namespaces.
-Call the .initialize() entry of each, passing the QSettings object.
-Each saves a reference to that object to use when it receives the
-QcloseEvent.
-
-Import in the following order:
-
-   chip8util and initialize the mono font.
-'''
-import chip8util
-chip8util.initialize_mono_font()
-
-'''
-   display.py has no dependencies
-'''
-
-import display
-
-display.initialize( the_settings )
-
-'''
-   chip8.py refers to display entry points
-'''
 
-import chip8
-
-chip8.initialize( the_settings )
-
-
-'''
-   memory.py refers to chip8 and display entry points
-'''
-
-import memory
-
-memory.initialize( the_settings )
-
-'''
-   source.py refers to chip8 and display entry points
-'''
-
-import source
-
-source.initialize( the_settings )
-
-'''
-All the windows are visible.
-
-Start the application event loop. This does not return until the
-application ends, e.g. File > Quit.
-
-Each window traps the close event and saves its geometry in the settings.
-'''
-
-the_app.exec_()
-
-'''
-The app has terminated, probably due to File>Quit. It delivered a
-QCloseEvent to each of the three windows, which should have saved their
-geometry in the settings. The chip8 module doesn't have a QWidget so it
-won't have gotten the word. (Always that 10%...) Just in case it wants to
-save something, call it.
-'''
-
-chip8.closeEvent()
-
-'''
-Annotate the log file for shutdown.
-'''
-
-now = datetime.datetime.now()
-logging.info( '{} shutting down at {}'.format( APPNAME, now.ctime() ) )
-logging.info( '==========================================' )
-
-'''
-Delay for just a little while to make sure all the garbage is picked
-up and Qt has really shut itself down.
-'''
-import time
-time.sleep( 0.1 )
-
-'''
-And that's that.
-'''
\ No newline at end of file
+    '''
+    Check for an environment variable CHIP8_LOG_LEVEL and if it
+    is present, use it to set the log-level.
+    '''
+    log_levels = {
+        'CRITICAL':logging.CRITICAL,
+        'DEBUG':logging.DEBUG,
+        'ERROR':logging.ERROR,
+        'FATAL':logging.FATAL,
+        'INFO':logging.INFO
+    }
+    choice = 'INFO'
+    desired_level = log_levels[ choice ]
+
+    if 'CHIP8_LOG_LEVEL' in os.environ :
+        choice = os.environ['CHIP8_LOG_LEVEL'].upper()
+        if choice in log_levels :
+            desired_level = log_levels[ choice ]
+
+    logging.basicConfig( handlers=[log_handler], level=desired_level )
+
+    '''
+    Write startup lines to the log
+    '''
+    import datetime
+    now = datetime.datetime.now()
+
+    from PyQt5.QtCore import PYQT_VERSION_STR
+    from PyQt5.QtCore import QT_VERSION_STR
+
+    logging.info( '==========================================' )
+    logging.info(
+        '{} starting up on {} with Qt {} and PyQt {}'.format(
+            APPNAME,
+            now.ctime(),
+            QT_VERSION_STR,
+            PYQT_VERSION_STR
+        )
+    )
+    if choice not in log_levels :
+        logging.error( 'Unknown value for CHIP8_LOG_LEVEL: {}'.format(choice) )
+        logging.error( 'Logging at INFO level' )
+
+    '''
+    Check for an environment variable CHIP8_STARTUP_PROFILE and if it is
+    present, log the time taken by each phase of startup, in milliseconds: the
+    QApplication, the font, and the import and the initialize() of each module.
+    These are logged at INFO level, the default.
+    '''
+    import time
+    PROFILE_STARTUP = 'CHIP8_STARTUP_PROFILE' in os.environ
+    startup_clock = [ time.perf_counter() ]
+
+    def startup_phase( phase:str ) -> None :
+        now = time.perf_counter()
+        if PROFILE_STARTUP :
+            logging.info( 'startup: {} took {:.1f} ms'.format(
+                phase, 1000 * ( now - startup_clock[0] ) ) )
+        startup_clock[0] = now
+
+    startup_total = time.perf_counter()
+
+    '''
+    Create the QApplication. This does a ton of Qt setup stuff.
+    '''
+
+    from PyQt5.QtWidgets import QApplication
+    args = []
+    the_app = QApplication( args )
+    startup_phase( 'QApplication' )
+
+    '''
+    With the application started, set the constants that define where
+    the settings file is stored and what it is called. Then open the settings.
+
+    Locations for Qt settings values:
+    Linux: $HOME/.config/TassoSoft/CHIP8IDE.conf
+    Mac OSX: $HOME/Library/Preferences/com.TassoSoft.CHIP8IDE.plist
+    Windows (registry): HKEY_CURRENT_USER\Software\TassoSoft\CHIP8IDE
+
+    '''
+
+    the_app.setOrganizationName( "TassoSoft" )
+    the_app.setOrganizationDomain( "tassos-oak.com" )
+    the_app.setApplicationName( APPNAME )
+
+    from PyQt5.QtCore import QSettings
+    the_settings = QSettings()
+    startup_phase( 'settings' )
+
+    '''
+    Uncomment the following to wipe all settings forcing windows
+    back to their defaults.
+    '''
+    #the_settings.clear()
+
+    '''
+    Import all the modules. This lets Python create their namespaces.
+    Call the .initialize() entry of each, passing the QSettings object.
+    Each saves a reference to that object to use when it receives the
+    QcloseEvent.
+
+    Only the Source window is built before the event loop starts, so the editor
+    is up and usable as soon as possible. The Display window, with its keypad
+    and tone generator, and the Memory window, with its 4096-cell table and the
+    emulator thread, are built by a zero-time timer, that is, as soon as the
+    event loop is running and has dealt with the events already queued for the
+    Source window. Each restores its saved geometry as it is shown. The
+    startup profile (above) logs the time of each initialize().
+
+    Import and initialize in the following order:
+
+       chip8util and initialize the mono font.
+    '''
+    import chip8util
+    chip8util.initialize_mono_font()
+    startup_phase( 'chip8util and font' )
+
+    '''
+       chip8.py refers to chip8io entry points
+    '''
+
+    import chip8
+
+    startup_phase( 'import chip8' )
+    chip8.initialize( the_settings )
+    startup_phase( 'chip8.initialize' )
+
+    '''
+       source.py refers to chip8, and to display and memory only for quitting.
+       Importing it also imports those two.
+    '''
+
+    import source
+
+    startup_phase( 'import source' )
+    source.initialize( the_settings )
+    startup_phase( 'source.initialize' )
+
+    if PROFILE_STARTUP :
+        logging.info( 'startup: Source window ready in {:.1f} ms'.format(
+            1000 * ( time.perf_counter() - startup_total ) ) )
+
+    '''
+       display.py refers only to chip8io, the Qt-free emulated I/O state, and
+       memory.py refers to chip8 and display entry points, so display goes
+       first. When both are up, give the focus back to the Source window.
+    '''
+
+    import display
+    import memory
+
+    def build_other_windows( ) -> None :
+        startup_phase( 'first event loop pass' )
+        display.initialize( the_settings )
+        startup_phase( 'display.initialize' )
+        memory.initialize( the_settings )
+        startup_phase( 'memory.initialize' )
+        source.OUR_WINDOW.raise_()
+        source.OUR_WINDOW.activateWindow()
+        if PROFILE_STARTUP :
+            logging.info( 'startup: total {:.1f} ms'.format(
+                1000 * ( time.perf_counter() - startup_total ) ) )
+
+    from PyQt5.QtCore import QTimer
+    QTimer.singleShot( 0, build_other_windows )
+
+    '''
+    Start the application event loop. This does not return until the
+    application ends, e.g. File > Quit. Right away it builds the other two
+    windows, and then all the windows are visible.
+
+    Each window traps the close event and saves its geometry in the settings.
+    '''
+
+    the_app.exec_()
+
+    '''
+    The app has terminated, probably due to File>Quit. It delivered a
+    QCloseEvent to each of the three windows, which should have saved their
+    geometry in the settings. The chip8 module doesn't have a QWidget so it
+    won't have gotten the word. (Always that 10%...) Just in case it wants to
+    save something, call it.
+    '''
+
+    chip8.closeEvent()
+
+    '''
+    Annotate the log file for shutdown.
+    '''
+
+    now = datetime.datetime.now()
+    logging.info( '{} shutting down at {}'.format( APPNAME, now.ctime() ) )
+    logging.info( '==========================================' )
+
+    '''
+    Delay for just a little while to make sure all the garbage is picked
+    up and Qt has really shut itself down.
+    '''
+    time.sleep( 0.1 )
+
+    '''
+    And that's that.
+    '''
@@ -0,0 +1,359 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 Emulated I/O State
+
+This module holds the state of the emulated output and input devices: the
+screen, the tone generator, and the keypad. It is plain Python with no
+reference to Qt, so that the emulator can run in a thread (or even a process)
+that never touches a Qt object.
+
+The emulator (chip8.py) calls the functions here to draw sprites, clear and
+scroll the screen, start and stop the tone and test the keypad. The Display
+window (display.py) is only a presenter: it takes a snapshot of this state
+from time to time and shows it, and it reports key presses back to the thread
+that owns this state.
+
+The emulated screen is FRAME, a bytearray with one byte per CHIP-8 pixel, 0
+for black and 1 for white. It is always sized for the larger SCHIP screen of
+64 rows of 128 pixels; in CHIP-8 mode only the upper-left 32x64 corner of it
+is used.
+
+Whoever changes FRAME sets FRAME_CHANGED. The snapshot() function returns a
+copy of the frame only when it has changed since the last snapshot, so the
+presenter does not repaint a screen that is the same as before.
+
+The keypad state is KEY_DOWN, the code of the key that is down, or -1, and
+KEY_LATCHED, True when that key was shift-clicked to latch it down. A latch is
+cleared by the emulator when it reads the keypad with key_read(), and the
+presenter needs to know this so the latched button can be shown released. So
+key_read() sets LATCH_CLEARED, which is also reported in the snapshot.
+
+The tone is TONE, True while it should sound. But the snapshot is taken only
+once a tick, and a beep has to start and stop exactly on time to sound right,
+so each change of the tone is also recorded in TONE_EVENTS, stamped with the
+emulated time: TICK_COUNT, the count of 1/60th-second ticks the emulator has
+seen. The events are passed in the snapshot, and the tone generator plays
+them on the same time scale; see tone.py.
+
+'''
+
+from typing import List, Optional, Tuple
+
+FRAME_WIDTH = 128
+FRAME_HEIGHT = 64
+
+FRAME = bytearray( FRAME_WIDTH * FRAME_HEIGHT )
+FRAME_CHANGED = True
+EXTENDED_MODE = False
+
+TONE = False
+TONE_EVENTS = [] # type: List[Tuple[int,bool]]
+TICK_COUNT = 0
+
+KEY_DOWN = -1
+KEY_LATCHED = False
+LATCH_CLEARED = False
+
+'''
+Return the dimensions of the emulated screen in the current mode, as
+(columns, rows).
+'''
+
+def dimensions( ) -> Tuple[int,int] :
+    return ( 128, 64 ) if EXTENDED_MODE else ( 64, 32 )
+
+'''
+Set the mode of the emulated screen to CHIP-8 (32x64) or SCHIP (64x128) mode.
+The screen is also cleared by this.
+'''
+
+def set_mode( schip : bool ) -> None :
+    global EXTENDED_MODE
+    EXTENDED_MODE = schip
+    clear()
+
+'''
+Return the mode of the emulated screen. The emulator needs to know which
+type of character font it should use.
+'''
+
+def get_mode( ) -> bool :
+    return EXTENDED_MODE
+
+'''
+Clear the emulated screen to all-black.
+'''
+
+def clear( ) -> None :
+    global FRAME_CHANGED
+    FRAME[:] = bytes( len( FRAME ) )
+    FRAME_CHANGED = True
+
+'''
+Draw a CHIP8 sprite on the emulated screen. The sprite is passed as a list of
+ints: 1 to 15 ints for a standard sprite, or 32 for an SCHIP 16x16 sprite.
+Return True if any white pixel of the sprite landed on a white pixel of the
+screen, erasing it.
+
+This means that "black" pixels are not painted. This is in accord with the
+original COSMAC manual (and the BYTE article) which both say that "after a
+pattern is shown on the screen it can be erased by showing the same pattern
+again with the same X and Y coordinates" which is referred to as
+"Exclusive-OR" logic. Consider the XOR truth table:
+
+             Screen
+XOR          0     1
+          |-----|-----|
+Sprite  0 |  0  |  1  |
+          |-----|-----|
+        1 |  1  |  0  |
+          |-----|-----|
+
+In short, if the sprite bit is 0, the screen bit is unchanged (0^0=0, 0^1=1).
+While if the sprite bit is 1, the screen bit always changes. Ergo, we only
+need to flip the pixels where the sprite bits are 1.
+
+The given coordinates need to be wrapped at the screen boundaries.
+
+'''
+
+def draw_sprite( x: int, y:int, sprite_bytes: List[int] ) -> bool :
+    global FRAME_CHANGED
+    hit = False
+    frame = FRAME
+    '''
+    Set bit masks for x and y based on the screen resolution.
+    '''
+    y_mask = 0x003F if EXTENDED_MODE else 0x001F
+    x_mask = 0x007F if EXTENDED_MODE else 0x003F
+
+    bit_mask = 0x0080
+    sprite = sprite_bytes
+    if 32 == len(sprite) :
+        '''
+        To reduce the special-casing, convert an SCHIP 16x16 sprite from
+        a list of 32, 8-bit ints, to a list of 16, 16-bit ints, adjusting
+        the bit_mask accordingly.
+        '''
+        bit_mask = 0x8000
+        sprite = []
+        for i in range(0, 32, 2) :
+            sprite.append( ( sprite_bytes[i] << 8) | sprite_bytes[i+1] )
+    '''
+    Keep the x- and y-coordinates in range, wrapping at the limit, by
+    masking them after each increment.
+    '''
+    y_coord = y & y_mask
+    for word in sprite :
+        '''
+        Sweep the bit_cursor across the current byte (or word),
+        incrementing the x-coordinate at each bit, and flip the pixel
+        under each 1-bit.
+        '''
+        row_base = y_coord * FRAME_WIDTH
+        x_coord = x & x_mask
+        bit_cursor = bit_mask
+        while bit_cursor : # is not zero,
+            if word & bit_cursor :
+                index = row_base + x_coord
+                was_white = frame[ index ]
+                hit = hit or bool( was_white )
+                frame[ index ] = was_white ^ 1
+            bit_cursor >>= 1
+            x_coord = (x_coord + 1) & x_mask
+        '''
+        Increment the y-coordinate for each byte/word.
+        '''
+        y_coord = (y_coord + 1) & y_mask
+
+    FRAME_CHANGED = True
+    return hit
+
+'''
+Implement scrolling. The SCHIP scroll instructions cause the screen to
+scroll by 2 or 4 pixels (depending on mode) left or right, or by a given
+number of rows down. All three move bytes within the frame, filling the
+vacated pixels with black.
+
+Query: what if mode is now CHIP-8, which did not support scroll-down? Force
+SCHIP mode, or ignore?
+
+Decision: just do it. Because most likely, any existing program that uses
+this, has already executed a HIGH to enter SCHIP mode. And if not, well, the
+old mode has a new feature.
+'''
+
+def scroll_down( rows:int ) -> None :
+    global FRAME_CHANGED
+    '''
+    Since rows are stored contiguously, this is one big slice of the frame
+    moved down by rows*FRAME_WIDTH.
+    '''
+    shift = min( rows, FRAME_HEIGHT ) * FRAME_WIDTH
+    FRAME[:] = bytes( shift ) + FRAME[ : len( FRAME ) - shift ]
+    FRAME_CHANGED = True
+
+def scroll_right( ) -> None :
+    global FRAME_CHANGED
+    cols, rows = dimensions()
+    offset = 4 if EXTENDED_MODE else 2
+    for cy in range( rows ) :
+        base = cy * FRAME_WIDTH
+        FRAME[ base : base + cols ] = \
+            bytes( offset ) + FRAME[ base : base + cols - offset ]
+    FRAME_CHANGED = True
+
+def scroll_left( ) -> None :
+    global FRAME_CHANGED
+    cols, rows = dimensions()
+    offset = 4 if EXTENDED_MODE else 2
+    for cy in range( rows ) :
+        base = cy * FRAME_WIDTH
+        FRAME[ base : base + cols ] = \
+            FRAME[ base + offset : base + cols ] + bytes( offset )
+    FRAME_CHANGED = True
+
+'''
+Turn the emulated beeper/tone on or off. This only records the wish, and the
+emulated time of it; the Display window makes the actual sound when it
+presents a snapshot.
+'''
+
+def sound( on : bool ) -> None :
+    global TONE
+    if on != TONE :
+        TONE_EVENTS.append( ( TICK_COUNT, on ) )
+    TONE = on
+
+'''
+Note the passage of one tick of emulated time. Called by chip8.tick().
+'''
+
+def tick( ) -> None :
+    global TICK_COUNT
+    TICK_COUNT += 1
+
+'''
+Record the state of the keypad, as reported by the Display window: the code
+of the key now down, or -1, and whether it is latched.
+'''
+
+def set_key( code : int, latched : bool = False ) -> None :
+    global KEY_DOWN, KEY_LATCHED
+    KEY_DOWN = code
+    KEY_LATCHED = latched
+
+'''
+Return the value of a key that is currently pressed, if any; else return
+-1. This method is called for the key-testing instructions, SKE and SKNE.
+It does not clear a latched key status.
+'''
+
+def key_test( ) -> int :
+    return KEY_DOWN
+
+'''
+Return the value of a key that is currently pressed, if any; else return
+-1. this method is called for the LD Vt, K instruction and it does clear
+a latched value if there is one.
+'''
+
+def key_read( ) -> int :
+    global KEY_DOWN, KEY_LATCHED, LATCH_CLEARED
+    key_code = KEY_DOWN
+    if KEY_LATCHED :
+        KEY_DOWN = -1
+        KEY_LATCHED = False
+        LATCH_CLEARED = True
+    return key_code
+
+'''
+Reset the emulated I/O: called when the emulated machine is reset, for
+example just before starting execution.
+    * set the mode to standard
+    * clear the emulated screen
+    * turn the sound off
+    * clear any latched key on the keypad
+'''
+
+def reset_io( ) -> None :
+    set_mode( False )
+    sound( False )
+    _ = key_read( )
+
+'''
+Return a snapshot of the emulated I/O for presentation, as a tuple of
+
+    * a copy of the frame as bytes, or None when it has not changed since
+      the previous snapshot,
+    * the screen mode, True for SCHIP,
+    * the tone, True when it should sound,
+    * True when a latched key has been released by the emulator,
+    * the list of tone events since the previous snapshot.
+
+The copy is made so the caller can hand the snapshot to another thread
+while the emulator goes on changing FRAME.
+'''
+
+Snapshot = Tuple[ Optional[bytes], bool, bool, bool, List[Tuple[int,bool]] ]
+
+def snapshot( ) -> Snapshot :
+    global FRAME_CHANGED, LATCH_CLEARED, TONE_EVENTS
+    frame = bytes( FRAME ) if FRAME_CHANGED else None
+    latch = LATCH_CLEARED
+    events = TONE_EVENTS
+    FRAME_CHANGED = False
+    LATCH_CLEARED = False
+    TONE_EVENTS = []
+    return ( frame, EXTENDED_MODE, TONE, latch, events )
+
+if __name__ == '__main__' :
+
+    reset_io()
+    assert not draw_sprite( 0, 0, [0xC0] )
+    assert FRAME[0] == 1 and FRAME[1] == 1 and FRAME[2] == 0
+    assert draw_sprite( 1, 0, [0x80] )
+    assert FRAME[1] == 0
+    scroll_right()
+    assert FRAME[2] == 1 and FRAME[0] == 0
+    scroll_down( 1 )
+    assert FRAME[ FRAME_WIDTH + 2 ] == 1
+    ( frame, mode, tone, latch, events ) = snapshot()
+    assert frame is not None and not mode and not tone and not latch
+    assert snapshot()[0] is None
+    set_key( 5, latched=True )
+    assert key_test() == 5
+    assert key_read() == 5
+    assert key_test() == -1
+    assert snapshot()[3]
+    set_mode( True )
+    assert dimensions() == ( 128, 64 ) and sum( FRAME ) == 0
+    sound( True )
+    tick()
+    tick()
+    sound( False )
+    assert snapshot()[4] == [ ( TICK_COUNT - 2, True ), ( TICK_COUNT, False ) ]
@@ -0,0 +1,710 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 Emulator Run Loop and Emulator Process
+
+This module has no Qt content. It contains:
+
+* run_loop(), the loop that runs the emulator in real time, executing a
+  limited number of instructions per 1/60th second tick. It is used by the
+  run thread of the Memory module, and by the emulator process below.
+
+* The emulator process. Even with the emulator in a thread of its own, it
+  competes for the Python GIL with the GUI thread, for example with the
+  syntax highlighter in the Source window as the user types. Optionally (see
+  the memory module's initialize()) the emulator can run in a child process
+  that has a CPU core to itself.
+
+The child process has its own copy of the chip8 and chip8io modules. The
+state of the emulated machine -- memory, registers, call stack, screen, tone
+and keypad -- is passed between the processes in a block of shared memory
+(multiprocessing.shared_memory), and commands and the stopped event go over a
+multiprocessing Pipe.
+
+While the emulator is stopped, the state in the GUI process is the truth: the
+user can step, edit memory or load a new program. When the user clicks RUN,
+the parent stores the whole state into the shared memory and sends a run
+command. The child loads that state and runs. At every tick it publishes the
+emulated I/O into the shared memory, where the parent reads it at frame rate
+to update the Display window. When the child stops, it stores the whole state
+into the shared memory and sends a stopped message, and the parent loads the
+state back into its own chip8 and chip8io modules. The stopped message carries
+the ranges of memory the child changed, so the parent's Memory window can
+update just those cells.
+
+'''
+
+import struct
+import time
+
+from typing import List, Optional, Tuple
+
+import chip8
+import chip8io
+
+'''
+The emulated timers count down at 60Hz. Time is kept in integer nanoseconds
+from time.perf_counter_ns(). The deadline of tick n is computed from the time
+the run started as origin + (n * 10**9) // 60, so that over any number of
+ticks, emulated time is exactly 1/60th second per tick, with no accumulated
+rounding and no drift from the time spent in the loop.
+
+When we fall behind, say because the system was busy, the ticks that are due
+are delivered as soon as possible, catching up. But if we fall more than
+MAX_LATE_TICKS behind (for example the machine was suspended) those ticks are
+dropped, and time starts afresh from now.
+'''
+NS_PER_SECOND = 1000000000
+TICKS_PER_SECOND = 60
+MAX_LATE_TICKS = 5
+
+'''
+Every TELEMETRY_TICKS ticks the run loop reports a measure of how it is
+doing, as a tuple of
+
+    * ips, the instructions actually executed per second,
+    * shortfall, the average count of instructions per tick that were
+      requested (by tick_limit) but could not be executed before the tick
+      deadline -- when >0, you have asked for more than the emulator can do,
+    * idle, the fraction of the time spent sleeping because the requested
+      instructions were done before the deadline -- when >0, the emulator
+      could do more,
+    * tick_limit, the current instructions-per-tick.
+
+In auto mode, at each report the loop also adjusts tick_limit itself. If there
+was a shortfall, it drops to what was actually achieved. If the loop was idle
+more than AUTO_IDLE_HEADROOM of the time, it goes up by a quarter, or doubles
+if it was idle more than half the time. So it settles on the highest rate that
+can be sustained with some time to spare, but never more than AUTO_LIMIT_MAX,
+which acts as the target. There is no tuning in turbo mode (below), where
+there is never any idle time.
+'''
+
+TELEMETRY_TICKS = 30
+AUTO_IDLE_HEADROOM = 0.2
+AUTO_LIMIT_MAX = 5000
+
+Telemetry = Tuple[ int, float, float, int ]
+
+'''
+In live mode, every LIVE_TICKS ticks (10 times a second) the run loop also
+publishes a copy of the machine state for the Memory window to show while the
+emulator runs. The copy is a tuple of
+
+    * the registers, as a tuple of ints in order of chip8.R,
+    * the call stack, as a tuple of return addresses,
+    * the memory, as bytes,
+    * the ranges of memory changed since the last copy, from chip8.take_dirty().
+
+It is a copy so that the GUI never reads the emulator's globals while the
+emulator is changing them, and it is cheap: one bytes() of 4096 ints is the
+most of it, far less than one tick's worth of instructions.
+'''
+
+LIVE_TICKS = 6
+
+MachineState = Tuple[ Tuple[int,...], Tuple[int,...], bytes, List[Tuple[int,int]] ]
+
+def machine_state( ) -> MachineState :
+    return (
+        tuple( chip8.REGS[ r ] for r in chip8.R ),
+        tuple( chip8.CALL_STACK ),
+        bytes( chip8.MEMORY ),
+        chip8.take_dirty() )
+
+def auto_tune( tick_limit:int, per_tick:float, shortfall:float, idle:float ) -> int :
+    if shortfall > 0 :
+        return max( 1, int( per_tick ) )
+    if idle > 0.5 :
+        return min( AUTO_LIMIT_MAX, tick_limit * 2 )
+    if idle > AUTO_IDLE_HEADROOM :
+        return min( AUTO_LIMIT_MAX, tick_limit + 1 + tick_limit // 4 )
+    return tick_limit
+
+'''
+
+Run the emulator until a stop command arrives or the emulator returns an
+error. Return the message for the status line.
+
+The runner argument is an object that supplies:
+
+    runner.tick_limit       instructions to execute per tick
+    runner.auto             True to let the loop tune tick_limit
+    runner.turbo            True to run in turbo mode, see below
+    runner.live             True to publish the machine state, see above
+    runner.running          False when a stop command has been taken in
+    runner.take_commands()  take in any commands that have arrived
+    runner.publish()        publish a snapshot of the emulated I/O
+    runner.report( t )      publish a Telemetry tuple
+    runner.publish_live( m ) publish a MachineState tuple
+    runner.wait_command( s ) wait up to s seconds for a command, apply it
+                            and return it, or return None
+
+Normally, in each tick, execute up to tick_limit instructions, then wait
+until the deadline of the tick. At each deadline,
+* notify the emulator of one tick passing
+* publish a snapshot of the emulated I/O
+* take in any commands that have arrived
+* every LIVE_TICKS in live mode, publish the machine state
+* every TELEMETRY_TICKS, report and possibly auto-tune
+* clear the inst_count and work out the next deadline
+
+In turbo mode we ignore the wall clock as far as the emulated machine is
+concerned. Emulated time is virtual: the emulator is notified of a tick after
+every tick_limit instructions, so the delay and sound timers run at 60 virtual
+ticks per emulated second, and a program behaves exactly as it would at that
+rate -- only faster. We never sleep. The real-time deadlines are still kept,
+but only to publish the I/O, take in commands and report, so the display is
+sampled at 60 frames per real second however fast the emulator goes. This is
+good for skipping a long attract mode, or running a test scenario quickly.
+
+'''
+
+def run_loop( runner ) -> str :
+    inst_count = 0
+    executed = 0
+    origin = time.perf_counter_ns()
+    tick_number = 1
+    deadline = origin + NS_PER_SECOND // TICKS_PER_SECOND
+    '''
+    Accumulators for telemetry.
+    '''
+    window_start = origin
+    window_ticks = 0
+    window_short = 0
+    window_sleep = 0
+    key_taken = False
+    while True :
+        now = time.perf_counter_ns()
+        if now >= deadline :
+            if not runner.turbo :
+                chip8.tick()
+                window_short += max( 0, runner.tick_limit - inst_count )
+                inst_count = 0
+            runner.publish()
+            if not key_taken :
+                runner.take_commands()
+            if not runner.running :
+                return 'Stopped'
+            key_taken = False
+            window_ticks += 1
+            if runner.live and window_ticks % LIVE_TICKS == 0 :
+                runner.publish_live( machine_state() )
+            if window_ticks >= TELEMETRY_TICKS :
+                elapsed = max( 1, now - window_start )
+                per_tick = executed / window_ticks
+                shortfall = window_short / window_ticks
+                idle = window_sleep / elapsed
+                if runner.auto and not runner.turbo :
+                    runner.tick_limit = auto_tune(
+                        runner.tick_limit, per_tick, shortfall, idle )
+                runner.report( (
+                    ( executed * NS_PER_SECOND ) // elapsed,
+                    shortfall, idle, runner.tick_limit ) )
+                window_start = now
+                window_ticks = executed = window_short = window_sleep = 0
+            if ( now - deadline ) * TICKS_PER_SECOND > MAX_LATE_TICKS * NS_PER_SECOND :
+                '''
+                Too far behind to catch up; start the count of ticks over.
+                '''
+                origin = now
+                tick_number = 0
+            tick_number += 1
+            deadline = origin + ( tick_number * NS_PER_SECOND ) // TICKS_PER_SECOND
+        if inst_count < runner.tick_limit :
+            '''
+            Execute an instruction, and quit if it returns an error.
+
+            If the PC did not change, the program is marking time on one
+            instruction: a jump to itself, or the wait-for-key instruction
+            which repeats until a key is pressed and released. Nothing can
+            change until the next tick or a key command, so consider the
+            instructions for this tick done and go wait.
+            '''
+            pc = chip8.REGS[ chip8.R.P ]
+            message_text = chip8.step()
+            inst_count += 1
+            executed += 1
+            if message_text is not None :
+                return message_text
+            if pc == chip8.REGS[ chip8.R.P ] :
+                inst_count = runner.tick_limit
+        elif runner.turbo :
+            '''
+            A virtual tick has passed.
+            '''
+            chip8.tick()
+            inst_count = 0
+        else :
+            '''
+            We have done as many emulated instructions in this tick as
+            required, so wait out the rest of it, and count the time waited.
+            The host CPU is idle meanwhile.
+
+            Rather than sleep blindly, wait for a command, so a stop takes
+            effect at once. But once a key change has come in, sleep out the
+            tick and take no more commands at its deadline, so that the
+            program sees the key down for a whole tick before a release can
+            arrive.
+            '''
+            waited_from = time.perf_counter_ns()
+            remainder = deadline - waited_from
+            if remainder > 0 :
+                if key_taken :
+                    time.sleep( remainder / NS_PER_SECOND )
+                else :
+                    command = runner.wait_command( remainder / NS_PER_SECOND )
+                    if command is not None :
+                        if not runner.running :
+                            return 'Stopped'
+                        key_taken = command[0] == 'key'
+                window_sleep += time.perf_counter_ns() - waited_from
+
+'''
+Apply one of the commands that are common to the run thread and the emulator
+process:
+
+    ( 'stop', )                 stop running
+    ( 'key', code, latched )    the keypad state has changed
+    ( 'rate', count )           the Inst/tick value has changed
+    ( 'auto', flag )            auto-tuning is on or off
+    ( 'turbo', flag )           turbo mode is on or off
+    ( 'live', flag )            live mode is on or off
+'''
+
+def apply_command( runner, command ) -> None :
+    verb = command[0]
+    if verb == 'stop' :
+        runner.running = False
+    elif verb == 'key' :
+        chip8io.set_key( command[1], command[2] )
+    elif verb == 'rate' :
+        runner.tick_limit = command[1]
+    elif verb == 'auto' :
+        runner.auto = command[1]
+    elif verb == 'turbo' :
+        runner.turbo = command[1]
+    elif verb == 'live' :
+        runner.live = command[1]
+
+'''
+
+Define the layout of the shared memory block.
+
+    MEMORY      4096 bytes of emulated memory
+    REGS        20 registers as 16-bit ints, in order of chip8.R
+    STACK       count of entries, then 12 16-bit return addresses
+    IO          the I/O header, see below
+    FRAME       the emulated screen, as in chip8io.FRAME
+
+The I/O header is written by the child at every tick, and read by the parent
+at frame rate. To keep the parent from reading a half-written frame, it is
+guarded by a sequence number: the child makes the sequence odd before it
+writes and even after. The parent only believes what it read if the sequence
+was even, and the same before and after it read. The other fields are:
+
+    frame_count   incremented when the frame has changed
+    latch_count   incremented when the emulator released a latched key
+    mode          1 for SCHIP mode
+    tone          1 while the tone should sound
+    key_down      the key that is down, or -1
+    key_latched   1 when that key is latched
+
+'''
+
+MEMORY_OFFSET = 0
+REGS_FORMAT = '<20H'
+REGS_OFFSET = MEMORY_OFFSET + 4096
+STACK_FORMAT = '<B{0}H'.format( chip8.MAX_CALL_DEPTH )
+STACK_OFFSET = REGS_OFFSET + struct.calcsize( REGS_FORMAT )
+IO_FORMAT = '<IIIBBbB'
+IO_OFFSET = STACK_OFFSET + struct.calcsize( STACK_FORMAT )
+FRAME_OFFSET = IO_OFFSET + struct.calcsize( IO_FORMAT )
+FRAME_SIZE = chip8io.FRAME_WIDTH * chip8io.FRAME_HEIGHT
+SHARED_SIZE = FRAME_OFFSET + FRAME_SIZE
+
+'''
+The multiprocessing modules take a while to import, and are only needed when
+the emulator process is wanted, which usually it is not. So they are imported
+when the process is created, not when this module is.
+'''
+
+class SharedState( ) :
+    def __init__( self ) :
+        '''
+        Create the shared memory block. The child process receives this
+        object: by fork, with the block attached already, or by spawn,
+        pickled, then attached again by name in __setstate__().
+        '''
+        from multiprocessing import shared_memory
+        self.shm = shared_memory.SharedMemory( create=True, size=SHARED_SIZE )
+        self.buf = self.shm.buf
+        '''
+        Counts of frame changes and latch releases, as last written by
+        this process or seen by read_io().
+        '''
+        self.frame_count = 0
+        self.latch_count = 0
+
+    '''
+    A memoryview cannot be pickled, so buf is left out. SharedMemory pickles
+    as its name, and unpickling it attaches to the same block.
+    '''
+    def __getstate__( self ) -> dict :
+        state = self.__dict__.copy()
+        del state[ 'buf' ]
+        return state
+
+    def __setstate__( self, state:dict ) -> None :
+        self.__dict__.update( state )
+        self.buf = self.shm.buf
+
+    def close( self ) -> None :
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def io_header( self ) -> Tuple[int,int,int,int,int,int,int] :
+        return struct.unpack_from( IO_FORMAT, self.buf, IO_OFFSET )
+
+    '''
+    Write the emulated I/O into the shared memory block, copying the frame
+    only if it has changed. This is done by the child at every tick. The
+    tone events do not fit the block; return them for the child to send.
+    '''
+    def publish_io( self ) -> List[Tuple[int,bool]] :
+        ( sequence, frame_count, latch_count, *_ ) = self.io_header()
+        struct.pack_into( '<I', self.buf, IO_OFFSET, sequence + 1 )
+        ( frame, extended, tone, latch_cleared, events ) = chip8io.snapshot()
+        if frame is not None :
+            self.buf[ FRAME_OFFSET : FRAME_OFFSET + FRAME_SIZE ] = frame
+            frame_count += 1
+        if latch_cleared :
+            latch_count += 1
+        struct.pack_into( IO_FORMAT, self.buf, IO_OFFSET,
+                          sequence + 2, frame_count, latch_count,
+                          int( extended ), int( tone ),
+                          chip8io.KEY_DOWN, int( chip8io.KEY_LATCHED ) )
+        return events
+
+    '''
+    Read the emulated I/O from the shared memory block. Return a snapshot
+    in the form returned by chip8io.snapshot(), but with no tone events,
+    or None if the child was in the middle of writing.
+    '''
+    def read_io( self ) -> Optional[chip8io.Snapshot] :
+        ( sequence, frame_count, latch_count,
+          extended, tone, _, _ ) = self.io_header()
+        if sequence & 1 :
+            return None
+        frame = None
+        if frame_count != self.frame_count :
+            frame = bytes( self.buf[ FRAME_OFFSET : FRAME_OFFSET + FRAME_SIZE ] )
+        if self.io_header()[0] != sequence :
+            return None
+        latch_cleared = latch_count != self.latch_count
+        self.frame_count = frame_count
+        self.latch_count = latch_count
+        return ( frame, bool( extended ), bool( tone ), latch_cleared, [] )
+
+    '''
+    Store the whole state of the emulated machine in this process into the
+    shared memory block.
+    '''
+    def store_state( self ) -> None :
+        self.buf[ MEMORY_OFFSET : MEMORY_OFFSET + 4096 ] = bytes( chip8.MEMORY )
+        struct.pack_into( REGS_FORMAT, self.buf, REGS_OFFSET,
+                          *[ chip8.REGS[ r ] for r in chip8.R ] )
+        stack = chip8.CALL_STACK + [0] * ( chip8.MAX_CALL_DEPTH - len( chip8.CALL_STACK ) )
+        struct.pack_into( STACK_FORMAT, self.buf, STACK_OFFSET,
+                          len( chip8.CALL_STACK ), *stack )
+        self.buf[ FRAME_OFFSET : FRAME_OFFSET + FRAME_SIZE ] = chip8io.FRAME
+        ( sequence, *_ ) = self.io_header()
+        struct.pack_into( IO_FORMAT, self.buf, IO_OFFSET,
+                          sequence, self.frame_count, self.latch_count,
+                          int( chip8io.EXTENDED_MODE ), int( chip8io.TONE ),
+                          chip8io.KEY_DOWN, int( chip8io.KEY_LATCHED ) )
+
+    '''
+    Load the whole state of the emulated machine from the shared memory
+    block into this process.
+    '''
+    def load_state( self ) -> None :
+        chip8.MEMORY[:] = self.buf[ MEMORY_OFFSET : MEMORY_OFFSET + 4096 ]
+        values = struct.unpack_from( REGS_FORMAT, self.buf, REGS_OFFSET )
+        for r in chip8.R :
+            chip8.REGS[ r ] = values[ r ]
+        ( depth, *stack ) = struct.unpack_from( STACK_FORMAT, self.buf, STACK_OFFSET )
+        chip8.CALL_STACK[:] = stack[ : depth ]
+        ( _, self.frame_count, self.latch_count,
+          extended, tone, key_down, key_latched ) = self.io_header()
+        chip8io.FRAME[:] = self.buf[ FRAME_OFFSET : FRAME_OFFSET + FRAME_SIZE ]
+        chip8io.EXTENDED_MODE = bool( extended )
+        chip8io.FRAME_CHANGED = True
+        chip8io.TONE = bool( tone )
+        chip8io.set_key( key_down, bool( key_latched ) )
+
+'''
+
+The child process. It waits on the pipe for commands:
+
+    ( 'run', tick_limit, breakpoints )  load the state and run
+    ( 'quit', )                         end the process
+
+and the commands listed at apply_command() above.
+
+While running it sends ( 'telemetry', t ) at each report, ( 'tone', events )
+when the tone has changed, and in live mode, ( 'live', m ) with each machine
+state. When it stops
+running, it stores the state and sends ( 'stopped', message, ranges ), where
+ranges is the list of memory ranges changed during the run.
+
+'''
+
+class ChildRunner( ) :
+    def __init__( self, shared:SharedState, conn:'Connection' ) :
+        self.shared = shared
+        self.conn = conn
+        self.tick_limit = 1
+        self.auto = False
+        self.turbo = False
+        self.live = False
+        self.running = False
+
+    def do_command( self, command ) -> None :
+        if command[0] == 'run' :
+            self.running = True
+            self.tick_limit = command[1]
+            chip8.BREAKPOINTS[:] = command[2]
+        else :
+            apply_command( self, command )
+
+    '''
+    Take in commands, but no more than one key change, so that a quick tap
+    of a key is down for at least one tick where the program can see it.
+    '''
+    def take_commands( self ) -> None :
+        while self.conn.poll() :
+            command = self.conn.recv()
+            self.do_command( command )
+            if command[0] == 'key' :
+                break
+
+    def publish( self ) -> None :
+        events = self.shared.publish_io()
+        if events :
+            self.conn.send( ( 'tone', events ) )
+
+    def wait_command( self, timeout:float ) :
+        if self.conn.poll( timeout ) :
+            command = self.conn.recv()
+            self.do_command( command )
+            return command
+        return None
+
+    def report( self, telemetry:Telemetry ) -> None :
+        self.conn.send( ( 'telemetry', telemetry ) )
+
+    def publish_live( self, state:MachineState ) -> None :
+        self.conn.send( ( 'live', state ) )
+
+def child_main( shared:SharedState, conn:'Connection' ) -> None :
+    runner = ChildRunner( shared, conn )
+    while True :
+        try :
+            command = conn.recv()
+        except EOFError :
+            break # the parent has gone away
+        if command[0] == 'quit' :
+            break
+        runner.do_command( command )
+        if runner.running :
+            shared.load_state()
+            if chip8.REGS[ chip8.R.S ] :
+                chip8io.sound( True )
+            message_text = run_loop( runner )
+            runner.running = False
+            shared.store_state()
+            conn.send( ( 'stopped', message_text, chip8.take_dirty() ) )
+
+'''
+
+The parent's side of the emulator process.
+
+The child is started with the "fork" method where the platform has it, as it
+is quicker and the child inherits the shared memory block. Otherwise, as on
+Windows, it is started with "spawn", which pickles the SharedState and imports
+the main module again; chip8ide.py guards its startup code so that does not
+start a second copy of the app.
+
+'''
+
+class EmulatorProcess( ) :
+    def __init__( self ) :
+        import multiprocessing
+        self.shared = SharedState()
+        self.conn, child_conn = multiprocessing.Pipe()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in methods else 'spawn' )
+        self.process = context.Process(
+            target=child_main,
+            args=( self.shared, child_conn ),
+            daemon=True )
+        self.process.start()
+        self.running = False
+        self.tone_events = [] # type: List[Tuple[int,bool]]
+
+    def post( self, *command ) -> None :
+        self.conn.send( command )
+
+    def start( self, tick_limit:int ) -> None :
+        self.shared.store_state()
+        self.running = True
+        self.post( 'run', tick_limit, list( chip8.BREAKPOINTS ) )
+
+    def stop( self ) -> None :
+        self.post( 'stop' )
+
+    '''
+    Look for news from the child, waiting up to timeout seconds for it.
+    Return a snapshot of the I/O (or None if it has not changed), the latest
+    telemetry (or None), the latest machine state in live mode (or None), and
+    the stopped message (or None if still running). Other messages do not
+    end the wait, so a caller that waits for the child to stop gets the
+    stopped message if it comes before the time is up. If more than one
+    machine state came in, the changed ranges of all of them are in the
+    latest. Tone events are passed on in the snapshot, or held for the next
+    one if the snapshot could not be read.
+    When the child has stopped, its state has been loaded into this process,
+    and the memory it changed is marked dirty here.
+    '''
+    def poll( self, timeout:float = 0.0 ) -> Tuple[ Optional[chip8io.Snapshot], Optional[Telemetry], Optional[MachineState], Optional[str] ] :
+        telemetry = None
+        live = None
+        deadline = time.monotonic() + timeout
+        while self.running and self.conn.poll( max( 0.0, deadline - time.monotonic() ) ) :
+            ( verb, value, *ranges ) = self.conn.recv()
+            if verb == 'telemetry' :
+                telemetry = value
+                continue
+            if verb == 'tone' :
+                self.tone_events += value
+                continue
+            if verb == 'live' :
+                if live is not None :
+                    value = value[ : 3 ] + ( live[3] + value[3], )
+                live = value
+                continue
+            self.shared.load_state()
+            for ( start, end ) in ranges[0] :
+                chip8.mark_dirty( start, end )
+            self.running = False
+            self.tone_events = []
+            return ( chip8io.snapshot(), telemetry, live, value )
+        state = self.shared.read_io()
+        if state is not None and self.tone_events :
+            state = state[ : 4 ] + ( self.tone_events, )
+            self.tone_events = []
+        return ( state, telemetry, live, None )
+
+    '''
+    End the child at once, and throw away whatever it was doing. This is for
+    a child that did not stop when told to; its state must not be loaded
+    late, over whatever this process has done since. The object cannot be
+    used after this.
+    '''
+    def terminate( self ) -> None :
+        self.process.terminate()
+        self.process.join( 1.0 )
+        self.conn.close()
+        self.running = False
+        self.tone_events = []
+        self.shared.close()
+
+    def close( self ) -> None :
+        try :
+            self.post( 'quit' )
+        except OSError :
+            pass
+        self.process.join( 1.0 )
+        self.shared.close()
+
+if __name__ == '__main__' :
+
+    from binasm import binasm
+    chip8.reset_vm( binasm( 'A000 6000 6100 D015 7001 A300 F055 A000 1206' ) )
+    chip8.take_dirty()
+    emulator = EmulatorProcess()
+    emulator.post( 'live', True )
+    emulator.start( 10 )
+    time.sleep( 0.6 )
+    ( state, telemetry, live, message ) = emulator.poll()
+    assert state is not None and state[0] is not None
+    assert telemetry is not None and telemetry[0] > 0
+    assert live is not None and ( 0x300, 0x301 ) in live[3]
+    assert live[0][ chip8.R.v0 ] - live[2][ 0x300 ] in ( 0, 1, -255 )
+    emulator.post( 'live', False )
+    time.sleep( 0.1 )
+    emulator.stop()
+    ( state, telemetry, live, message ) = emulator.poll( 1.0 )
+    assert message == 'Stopped'
+    assert chip8.REGS[ chip8.R.v0 ] > 0
+    assert sum( chip8io.FRAME ) > 0
+    assert chip8.take_dirty()[0] == ( 0x300, 0x301 )
+    '''
+    Stopped while live messages are waiting, it still reports the stop.
+    '''
+    emulator.post( 'live', True )
+    emulator.start( 10 )
+    time.sleep( 0.3 )
+    emulator.stop()
+    ( state, telemetry, live, message ) = emulator.poll( 1.0 )
+    assert message == 'Stopped' and not emulator.running
+    emulator.close()
+    '''
+    A child that is terminated while it runs leaves the state here alone.
+    '''
+    memory = list( chip8.MEMORY )
+    emulator = EmulatorProcess()
+    emulator.start( 10 )
+    time.sleep( 0.1 )
+    emulator.terminate()
+    assert not emulator.process.is_alive() and not emulator.running
+    assert chip8.MEMORY == memory
+    '''
+    The SharedState survives pickling, as it must to be given to a spawned
+    child, and the copy sees the same block.
+    '''
+    import pickle
+    shared = SharedState()
+    shared.store_state()
+    copied = pickle.loads( pickle.dumps( shared ) )
+    chip8.MEMORY[ 0x300 ] = 0
+    copied.load_state()
+    assert chip8.MEMORY == memory
+    copied.shm.close()
+    shared.close()
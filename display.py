@@ -32,7 +32,7 @@ The window is an independent (that is, parent-less) window with the title
 "CHIP-8 I/O". It can be positioned, minimized or maximized independent of the
 rest of the app. Within the window are the following widgets:
 
-* The display, represented as a QLabel containing a QPixmap. It presents the
+* The display, represented as a QLabel that paints a QImage. It presents the
 display in CHIP8 (32x64) or SCHIP (64x128) format as an array of square
 pixels.
 
@@ -46,6 +46,12 @@ window and its contents as Qt objects. It sets its geometry from the saved
 settings. After creation, the window objects respond to Qt events from user
 actions.
 
+The window does not hold the state of the emulated machine. The screen
+contents, the tone and the keypad state are kept in the Qt-free chip8io
+module, which the emulator operates on from its own thread. This module
+presents snapshots of that state, and reports keypad changes, see
+present_state() and key_notify() below.
+
 Design/factorization note: The MasterWindow object is a container for the
 Screen and the Keypad objects. Nominally, the methods to operate on one of
 these, for example to set an emulated pixel or sample a key, would be methods
@@ -57,7 +63,7 @@ MasterWindow would just add another layer of name lookup and function call.
 
 So when MasterWindow instantiates the Screen and Keypad objects, it puts
 references to them in globals so their methods can be called directly from
-the API functions. See for example the draw_sprite() module function, which
+the API functions. See for example the present_state() module function, which
 calls directly into the Screen methods.
 
 '''
@@ -69,16 +75,12 @@ will be visible to code that imports this module.
 
 __all__ = [
     'initialize',
-    'set_mode',
-    'draw_sprite',
-    'clear',
-    'scroll_down',
-    'scroll_left',
-    'scroll_right',
-    'key_test',
+    'present',
+    'present_state',
+    'key_notify',
+    'fast_forward_notify',
     'sound',
-    'quit_signal_slot',
-    'reset_io'
+    'quit_signal_slot'
 ]
 
 import logging
@@ -86,25 +88,21 @@ import logging
 from typing import List, Tuple
 
 '''
-Import the audio resource file, a Qt resource that was created from a .wav
-file using pyrcc5. During this import, the Qt resource qrc:/330HzSQARE.wav
-is created and registered. See initialize() below.
+Import the tone generator, which synthesizes the beeper sound.
 '''
 
-import audio330hz
+import tone
 
 '''
 Import needed PyQt classes.
 '''
 
 from PyQt5.QtCore import (
-    QCoreApplication,
     Qt,
     QPoint,
     QSize,
     QRect,
-    QTimer,
-    QUrl
+    QTimer
     )
 
 from PyQt5.QtGui import (
@@ -112,6 +110,7 @@ from PyQt5.QtGui import (
     QBrush,
     QColor,
     QImage,
+    QKeySequence,
     QPainter,
     QPixmap,
     QResizeEvent
@@ -131,29 +130,51 @@ from PyQt5.QtWidgets import (
     QWidget
     )
 
-from PyQt5.QtMultimedia import QSoundEffect
-
+'''
+The emulated screen is recorded in the chip8io module as a frame, a bytearray
+with one byte per CHIP-8 pixel, stored in rows of FRAME_WIDTH bytes. Import
+that module for the frame dimensions and for the snapshot() function.
 '''
 
-Define the emulated screen as a customized QLabel.
-
-The QLabel manages the emulated video display as a QImage. Qt documents
-the QImage class as being designed for "pixel access and manipulation".
+import chip8io
+from chip8io import FRAME_WIDTH, FRAME_HEIGHT
 
-The emulated pixels of the CHIP-8 screen are PxP rectangles of QImage pixels,
-where P depends on the size of the QImage, but is at least 2.
+'''
 
-To actually draw a CHIP-8 pixel we use the QPainter method
-fillRect(x,y,w,h,color) where color is either white or black. To draw the
-CHIP-8 pixel at emulated coordinates cx, cy we use fillRect( P*cx, P*cy, P,
-P, color). To test the color of the CHIP-8 pixel at cx, cy we sample the
-QImage pixel at (P*cx+P/2, P*cy+P/2).
+Define the emulated screen as a customized QLabel.
 
-To actually display the image in the Qlabel, it has to be converted into a
-QPixmap, This is done with the class method, QPixmap.fromImage().
+The Screen is only a presenter. The truth of what is on the emulated screen
+is kept by the emulator in chip8io.FRAME. From time to time the Screen is
+given a copy of that frame, which it keeps in self.frame, and asked to show
+it. All of this happens on the GUI thread; the thread that runs the emulator
+never touches the Screen.
+
+What the user sees is a QImage, self.image, which is a scaled-up rendering of
+the frame. Qt documents the QImage class as being designed for "pixel access
+and manipulation". The emulated pixels of the CHIP-8 screen are PxP
+rectangles of QImage pixels, where P depends on the size of the widget, but is
+at least 2. To draw the CHIP-8 pixel at emulated coordinates cx, cy we use the
+QPainter method fillRect( P*cx, P*cy, P, P, color ).
+
+Because the frame is independent of the image, a change in the size of the
+widget only requires building a new image with a new P and rendering the frame
+into it. The emulated picture is preserved, and this can be done at any time,
+even while the emulator is running.
+
+We do not hand the image to the QLabel as a pixmap. Instead we override
+paintEvent() to draw the image directly.
+
+Rendering the frame into the image is the costly part, and it is wasted when
+nobody can see it: when the Display window is minimized, hidden, or (on
+platforms that report it) completely covered by other windows. Then
+show_frame() only keeps the new frame and sets self.stale. Qt sends a paint
+event when the window is exposed again, and paintEvent() renders the latest
+frame once before drawing it. A long run in the background costs only the
+copying of frames.
 
 '''
 class Screen( QLabel ) :
+
     def __init__( self, parent=None ) :
         super().__init__( parent )
         '''
@@ -179,11 +200,18 @@ class Screen( QLabel ) :
         self.setLineWidth( 3 )
         self.setMidLineWidth( 3 )
         '''
-        Set to align our pixmap in the center. For some unknown reason,
-        if the scaledContents property is on, no drawing appears.
+        Start with an all-black frame.
+        '''
+        self.frame = bytes( FRAME_WIDTH * FRAME_HEIGHT )
         '''
-        self.setAlignment( Qt.AlignCenter )
-        #self.setScaledContents( True )
+        Store convenient colors for use later.
+        '''
+        self.black_color = QColor( "black" )
+        self.white_color = QColor( "white" )
+        '''
+        Set the initial emulated screen mode to CHIP-8 standard, 32x64.
+        '''
+        self.extended_mode = False
         '''
         Create a place-holder QImage, which will shortly be replaced. At the
         time this __init__ runs, we have not been laid out. Soon we will come
@@ -196,181 +224,84 @@ class Screen( QLabel ) :
         one would think that; however anything other than RGB creates weird
         anomalies and strange behavior.
         '''
-        self.image = QImage( QSize( self.minimumWidth(), self.minimumHeight() ),
-                             QImage.Format_RGB32 )
+        self.P = 2
+        self.image = self.make_image( self.P )
         '''
-        Store convenient colors for use later.
-        '''
-        self.black_color = QColor( "black" )
-        self.white_color = QColor( "white" )
-        self.image.fill( self.black_color )
-        '''
-        Set up a flag which is False while the emulator (in chip8.py) is
-        free-running. This ensures we do not attempt to resize the display
-        while it is being updated. See API call change_of_thread() below.
-        '''
-        self.ok_to_resize = True
-        '''
-        Set the initial emulated screen mode to CHIP-8 standard, 32x64.
-        Initialize the factor P based on the current height of the image.
-        '''
-        self.extended_mode = False
-        self.P = int( self.minimumHeight() / 32 )
-        '''
-        Store QPainterer devices for use later. They are re-used as long as
-        possible, but must be discarded whenever a change of thread occurs;
-        see change_of_thread() and clear().
+        True when self.frame has not been rendered into self.image.
         '''
-        self.image_painter = None # type: QPainter
-        self.pixel_painter = None # type: QPainter
+        self.stale = False
 
     '''
-    Clear the emulated screen to black and update our displayed pixmap.
-    Discard the QPainters if we have any.
-
-    This is called by the emulator when it resets before execution, and when
-    executing the 0x00E0 instruction. It is also called as the last step of a
-    resize event to convert the resized QImage to a QPixmap, and whenever the
-    screen mode is changed.
+    Return the dimensions of the emulated screen in the current mode, as
+    (columns, rows).
     '''
-    def clear( self ) -> None :
-        self.image_painter = None
-        self.pixel_painter = None
-        self.image.fill( self.black_color )
-        self.setPixmap( QBitmap.fromImage( self.image ) )
+    def dimensions( self ) -> Tuple[int,int] :
+        return ( 128, 64 ) if self.extended_mode else ( 64, 32 )
 
     '''
-    Get the current screen mode, where True means SCHIP or extended mode.
+    Return a new, black QImage sized for pixel-rectangles of PxP in the
+    current mode.
     '''
-    def mode( self ) -> bool :
-        return self.extended_mode
+    def make_image( self, P:int ) -> QImage :
+        cols, rows = self.dimensions()
+        image = QImage( QSize( P * cols, P * rows ), QImage.Format_RGB32 )
+        image.fill( self.black_color )
+        return image
 
     '''
-    Set the screen mode to CHIP-8 or SCHIP. Recalculate pixel size P and clear
-    the screen.
+    Work out the largest value of P that lets the whole emulated screen fit
+    inside the widget's contents rectangle, given a widget size.
     '''
-    def set_mode( self, schip:bool = False ) -> None :
-        self.extended_mode = schip
-        '''
-        Regardless of a change, setting the mode recalculates the P value and
-        clears the screen. P is current height divided by either 32 or 64.
-        '''
-        self.P = int( self.image.size().height() / 32 )
-        if self.extended_mode :
-            self.P >>= 1 # make that, height/64
-        self.clear()
+    def best_P( self, size:QSize ) -> int :
+        cols, rows = self.dimensions()
+        margins = self.contentsMargins()
+        width = size.width() - margins.left() - margins.right()
+        height = size.height() - margins.top() - margins.bottom()
+        return max( 2, min( int( width / cols ), int( height / rows ) ) )
 
     '''
-    Paint a list of CHIP-8 pixels by the CHIP-8 XOR rule (if black, turn white,
-    if white, turn black), and return the truth of whether any were white.
+    Paint the whole frame into the image.
     '''
-    def paint_pixel_list( self, pixels: List[Tuple[int,int]] ) -> bool :
-        hit = False
+    def render_frame( self ) -> None :
+        self.stale = False
+        cols, rows = self.dimensions()
         P = self.P
-        P2 = P >> 1
-        if self.image_painter is None :
-            '''
-            Set up two QPainters, one to paint on self.pixmap and one
-            to paint on self.image. They will be reused as long as possible,
-            and trashed when the screen mode changes or the emulator thread
-            starts or stops.
-            '''
-            self.image_painter = QPainter( self.image )
-            self.pixel_painter = QPainter( self.pixmap() )
-        '''
-        Process each pixel in the list of pixels.
-        '''
-        for cx, cy in pixels :
-            '''
-            Convert CHIP-8 pixel to an image pixel upper left corner
-            '''
-            px = cx * P
-            py = cy * P
-            '''
-            Sample the image -- only QImage supports sampling a pixel --
-            to see if it was already white. Sample an image pixel at the
-            centerpoint of the square CHIP-8 pixel.
-            '''
-            was_white = 0xff000000 != self.image.pixel( px + P2, py + P2 )
-            '''
-            Record a hit if it was white. Note mypy doesn't dig "hit |= was_white"
-            '''
-            hit = hit or was_white
-            '''
-            New pixel will be the inverse color of the old one.
-            '''
-            color = Qt.black if was_white else Qt.white
-            '''
-            Paint the CHIP-8 pixel's rectangle in both the image, so we
-            can sample it later, and in the pixmap that is displayed.
-            '''
-            self.image_painter.fillRect( px, py, P, P, color )
-            self.pixel_painter.fillRect( px, py, P, P, color )
-
-        '''
-        Because we paint directly on our displayed pixmap, Qt does not
-        know it should repaint us on the screen. So, tell it.
-        '''
-        self.update( )
-        QCoreApplication.processEvents( )
-        QTest.qWait(1)
-        return hit
-
-    '''
-    Implement scrolling. The SCHIP scroll instructions cause the screen to
-    scroll by one pixel, left or right, or by a given number of rows down.
-
-    The same technique is used in all three scrolls. We define a rectangle
-    the current size of the screen, except displaced in the opposite
-    direction to the scroll (e.g. to the left when scrolling right). We use
-    that as the argument to the QImage.copy() method, which returns a new
-    QImage containing pixels from the current image where it falls inside the
-    rectangle, and black pixels where the rectangle falls outside.
-
-    It's just really cool that the Qt folks thought to properly support
-    negative X/Y values in QImage.copy() like this.
-    '''
-    def displace_rect( self, rect:QRect, x_diff:int, y_diff:int ) :
-        '''
-        If one only calls QRect.setX(), it helpfully extends the rectangle
-        to make its area larger. This function makes a new rect that is
-        simply displaced, same width and height.
-        '''
-        return QRect( rect.x()+x_diff, rect.y()+y_diff, rect.width(), rect.height() )
-
-    def finish_scroll( self, new_rect:QRect ) :
-        '''
-        Factored out of the three scroll methods, build a new QImage
-        from the old one based on an overlapping rectangle, and
-        install it as our image and display it.
-        '''
-        self.image = self.image.copy( new_rect )
-        self.setPixmap( QBitmap.fromImage( self.image ) )
-
-    def scroll_right( self ) :
-        P = self.P
-        offset = P * ( 4 if self.extended_mode else 2 )
-        new_rect = self.displace_rect( self.image.rect(), -offset, 0 )
-        self.finish_scroll( new_rect )
+        self.image.fill( self.black_color )
+        painter = QPainter( self.image )
+        for cy in range( rows ) :
+            row_base = cy * FRAME_WIDTH
+            for cx in range( cols ) :
+                if self.frame[ row_base + cx ] :
+                    painter.fillRect( cx * P, cy * P, P, P, self.white_color )
+        painter.end()
 
     '''
-    Implement scroll-left. Same technique as scroll-right.
+    Return True when the window can be seen: shown, not minimized, and
+    exposed, which on some platforms also means not covered by other windows.
     '''
-    def scroll_left( self ) :
-        P = self.P
-        offset = P * ( 4 if self.extended_mode else 2 )
-        new_rect = self.displace_rect( self.image.rect(), offset, 0 )
-        self.finish_scroll( new_rect )
+    def can_be_seen( self ) -> bool :
+        window = self.window()
+        handle = window.windowHandle()
+        return ( self.isVisible() and not window.isMinimized()
+                 and handle is not None and handle.isExposed() )
 
     '''
-    And scroll-down.
+    Show a new frame, in a given mode. If the mode has changed, work out a new
+    P and make a new image to suit. If the window can be seen, render the frame
+    into the image, and tell Qt that we need to be repainted. Otherwise just
+    note that the image is stale.
     '''
-    def scroll_down( self, rows:int ) :
-        P = self.P
-        offset = P * rows
-        new_rect = self.displace_rect( self.image.rect(), 0, -offset )
-        self.finish_scroll( new_rect )
-
+    def show_frame( self, frame:bytes, extended:bool ) -> None :
+        self.frame = frame
+        if extended != self.extended_mode :
+            self.extended_mode = extended
+            self.P = self.best_P( self.size() )
+            self.image = self.make_image( self.P )
+        if self.can_be_seen() :
+            self.render_frame()
+            self.update()
+        else :
+            self.stale = True
 
     '''
     Let Layout managers know we like to be 1x2 in geometry. Note this is only
@@ -392,62 +323,37 @@ class Screen( QLabel ) :
     frame. Here we are concerned with whether or not to resize the emulated
     screen image within the widget.
 
-    To resize means, build a new QImage sized to a multiple of 32/64 vertical
-    and 64/128 horizontal, and set a new P factor. The image is filled with
-    black (we do not attempt to preserve the current emulated pixel values)
-    so if the emulator is running, its current screen output is lost.
-
-    We compare the image size to the new size of our whole widget. If the new
-    size has gotten enough smaller that the image no longer fits, then resize
-    it. (Note that our QLabel minimum width and height keep us from getting
-    stupidly small.)
-
-    If the new widget size is larger by enough pixels to justify a change in
-    P, resize. A change in P is justified when at least 32 pixels are added
-    vertically and 64 horizontally, or twice that for SCHIP mode.
-
-    On the very first resize event, the image is a minimum-sized one. On a
-    later resize, the image has whatever size we set here.
+    To resize means, work out the largest P that fits the new size, and if it
+    differs from the current P, build a new QImage sized to P times 32/64
+    vertical and 64/128 horizontal, and render the frame into it.
     '''
     def resizeEvent( self, event:QResizeEvent ) :
-        old_w = self.image.size().width()
-        old_h = self.image.size().height()
-        new_w = event.size().width()
-        new_h = event.size().height()
-        do_resize = False
-        if old_w > new_w or old_h > new_h :
-            '''
-            Our existing image exceeds the size of the QLabel. We must
-            resize, which will effect a downsize.
-            '''
-            do_resize = True
-        else :
-            '''
-            The old image dimensions are less than the new widget dimensions.
-            Thus there are 0 or more available pixels between the current
-            image and the frame. Figure out if that gap justifies a resize,
-            which is true if we've added at least one screen of pixels.
-            '''
-            threshhold_h = 128 if self.extended_mode else 64
-            threshhold_w = threshhold_h >> 1 # that  is, 64 or 32
-            do_resize = (threshhold_h <= ( new_h - old_h ) \
-                         and threshhold_w <= ( new_w - old_w ) )
-        if do_resize and self.ok_to_resize :
-            '''
-            Image resize is advisable AND the emulator is not running free.
-            '''
-            self.P = int( new_w / ( 128 if self.extended_mode else 64 ) )
-            new_size = QSize(
-                self.P * ( 128 if self.extended_mode else 64 ),
-                self.P * ( 64 if self.extended_mode else 32 )
-                )
-            self.image = QImage( new_size, QImage.Format_RGB32 )
-            self.clear()
+        new_P = self.best_P( event.size() )
+        if new_P != self.P :
+            self.P = new_P
+            self.image = self.make_image( new_P )
+            self.render_frame()
         '''
         In any case, pass the resize event to our parent widget.
         '''
         super().resizeEvent( event )
 
+    '''
+    Paint the widget. If frames came while we could not be seen, render the
+    latest one now. Let the QLabel draw its frame, then draw our image
+    centered in the contents rectangle.
+    '''
+    def paintEvent( self, event ) :
+        if self.stale :
+            self.render_frame()
+        super().paintEvent( event )
+        painter = QPainter( self )
+        target = self.contentsRect()
+        x = target.x() + int( ( target.width() - self.image.width() ) / 2 )
+        y = target.y() + int( ( target.height() - self.image.height() ) / 2 )
+        painter.drawImage( QPoint( x, y ), self.image )
+        painter.end()
+
 '''
 
 Create the 16-button keypad as QWidget laid out as a 4x4 grid of KeyPadButton
@@ -524,6 +430,12 @@ Set up a 4x4 grid of KeyPadButtons. Route the "pressed" and "released"
 signals of each button to a single method where we keep track of which button
 is currently down, or a flag -1 when none of them are.
 
+The emulator does not look at the keypad. Whenever the state of the keypad
+changes we report it, by calling each callable registered with the key_notify()
+function (below) passing the code of the down key or -1, and whether that key
+is latched. The Memory module registers a callable that sends the key state to
+the thread that runs the emulator.
+
 '''
 
 class KeyPad( QWidget ) :
@@ -531,8 +443,7 @@ class KeyPad( QWidget ) :
         super().__init__( parent )
         '''
         This variable records the currently-down button value, or -1.
-        This is what is polled by the key_test() function called by
-        the Emulator.
+        This is what is reported to the emulator.
         '''
         self.pressed_code = -1
         '''
@@ -619,6 +530,7 @@ class KeyPad( QWidget ) :
         if that_button.latched :
             self.latched_code = True
             self.latched_button = that_button
+        self.report_key()
 
     def button_up( self ) :
         '''
@@ -633,15 +545,25 @@ class KeyPad( QWidget ) :
             self.pressed_code = -1
         else :
             self.latched_button.setDown( True )
+        self.report_key()
 
     def clear_latch( self ) :
         '''
-        Clear any latched button state -- called on a keypad read inst.
+        Clear any latched button state -- called when the emulator reports
+        that it has read the keypad, or when the emulator is reset.
         '''
         if self.latched_code :
             self.latched_button.setDown( False )
             self.latched_code = False
             self.pressed_code = -1
+            self.report_key()
+
+    def report_key( self ) :
+        '''
+        Tell whoever cares about the new state of the keypad.
+        '''
+        for callback in KEY_NOTIFY_LIST :
+            callback( self.pressed_code, bool( self.latched_code ) )
 
     def keyboard_press ( self, button ) :
         '''
@@ -865,7 +787,19 @@ class DisplayWindow( QWidget ) :
         so it can recover any custom maps.
         '''
         self.key_mapper = KeyChoiceCombo( self.key_maps, settings )
+        '''
+        Instantiate the fast-forward button. It is a checkable tool button:
+        while it is down, the emulator runs in turbo mode. Its toggled signal
+        goes to the callables registered by fast_forward_notify(), below.
+        '''
+        self.fast_forward = QToolButton( )
+        self.fast_forward.setText( '>>' )
+        self.fast_forward.setCheckable( True )
+        self.fast_forward.setShortcut( QKeySequence( 'Ctrl+F' ) )
+        self.fast_forward.setToolTip( 'Fast forward (Ctrl+F)' )
+        self.fast_forward.toggled.connect( fast_forward_toggled )
         hbox = QHBoxLayout( )
+        hbox.addWidget( self.fast_forward )
         hbox.addStretch()
         hbox.addWidget( self.key_mapper )
         vbox.addLayout( hbox )
@@ -926,9 +860,9 @@ class DisplayWindow( QWidget ) :
     the event on the global ACTUALLY_QUITTING.
     '''
     def closeEvent( self, event ) :
-        global SFX, ACTUALLY_QUITTING
+        global ACTUALLY_QUITTING
         if ACTUALLY_QUITTING :
-            SFX.stop()
+            tone.shutdown()
             self.settings.setValue( "display_page/size", self.size() )
             self.settings.setValue( "display_page/position", self.pos() )
             self.key_mapper.shutdown( self.settings )
@@ -947,7 +881,6 @@ ACTUALLY_QUITTING = False
 OUR_WINDOW = None # type: QWidget
 SCREEN = None # type: Screen
 KEYPAD = None # type: KeyPad
-SFX = None # type: QSoundEffect
 
 '''
 Receive the signal from the Quit menu action that we are actually shutting
@@ -960,246 +893,97 @@ def quit_signal_slot( ) -> None :
     ACTUALLY_QUITTING = True
 
 '''
-Set the mode of the emulated screen to CHIP-8 (32x64) or SCHIP (64x128) mode.
-The screen is also cleared by this.
+Register a callable to be called whenever the state of the keypad changes.
+It is called with two arguments, the code of the key that is down, or -1, and
+a bool that is True when that key is latched.
 '''
 
-def set_mode( schip : bool ) -> None :
-    SCREEN.set_mode( schip )
+from typing import Callable
 
-'''
-Return the mode of the emulated screen. The emulator needs to know which
-type of character font it should use.
-'''
+KEY_NOTIFY_LIST = [] # type: List[Callable]
 
-def get_mode( ) -> bool :
-    return SCREEN.mode()
+def key_notify( callback : Callable ) -> None :
+    global KEY_NOTIFY_LIST
+    KEY_NOTIFY_LIST.append( callback )
 
 '''
-Draw a CHIP8 sprite on the emulated screen. The sprite is passed as a list of
-ints: 1 to 15 ints for a standard sprite, or 32 for an SCHIP 16x16 sprite.
-
-We analyze the bytes and select out the 1-bits. For each 1-bit we make a
-screen coordinate tuple. The list of tuples is passed to the paint_pixel_list()
-method for drawing.
-
-This means that "black" pixels are not painted. This is in accord with the
-original COSMAC manual (and the BYTE article) which both say that "after a
-pattern is shown on the screen it can be erased by showing the same pattern
-again with the same X and Y coordinates" which is referred to as
-"Exclusive-OR" logic. Consider the XOR truth table:
-
-             Screen
-XOR          0     1
-          |-----|-----|
-Sprite  0 |  0  |  1  |
-          |-----|-----|
-        1 |  1  |  0  |
-          |-----|-----|
-
-In short, if the sprite bit is 0, the screen bit is unchanged (0^0=0, 0^1=1).
-While if the sprite bit is 1, the screen bit always changes. Ergo, we only
-need to paint the pixels where the sprite bits are 1.
-
-The given coordinates need to be wrapped at the screen boundaries.
-
+Register a callable to be called when the fast-forward button is toggled,
+with a bool that is True when it is down.
 '''
-from PyQt5.QtTest import QTest
-
-def draw_sprite( x: int, y:int, sprite_bytes: List[int] ) -> bool :
-    pixel_list = []
-    '''
-    Set bit masks for x and y based on the screen resolution.
-    '''
-    y_mask = 0x003F if get_mode() else 0x001F
-    x_mask = 0x007F if get_mode() else 0x003F
-
-    bit_mask = 0x0080
-    sprite = sprite_bytes
-    if 32 == len(sprite) :
-        '''
-        To reduce the special-casing, convert an SCHIP 16x16 sprite from
-        a list of 32, 8-bit ints, to a list of 16, 16-bit ints, adjusting
-        the bit_mask accordingly.
-        '''
-        bit_mask = 0x8000
-        sprite = []
-        for i in range(0, 32, 2) :
-            sprite.append( ( sprite_bytes[i] << 8) | sprite_bytes[i+1] )
-    '''
-    Keep the x- and y-coordinates in range, wrapping at the limit, by
-    masking them after each increment.
-    '''
-    y_coord = y & y_mask
-    for word in sprite :
-        '''
-        Sweep the bit_cursor across the current byte (or word),
-        incrementing the x-coordinate at each bit.
-        '''
-        x_coord = x & x_mask
-        bit_cursor = bit_mask
-        while bit_cursor : # is not zero,
-            if word & bit_cursor :
-                pixel_list.append( ( x_coord, y_coord ) )
-            bit_cursor >>= 1
-            x_coord = (x_coord + 1) & x_mask
-        '''
-        Increment the y-coordinate for each byte/word.
-        '''
-        y_coord = (y_coord + 1) & y_mask
 
-    '''
-    Paint the white pixels we found and exit.
-    '''
-    hit = SCREEN.paint_pixel_list( pixel_list )
-    #QTest.qWait(10)
-    return hit
+FAST_FORWARD_NOTIFY_LIST = [] # type: List[Callable]
 
-'''
-Clear the emulated screen to all-black.
-'''
+def fast_forward_notify( callback : Callable ) -> None :
+    global FAST_FORWARD_NOTIFY_LIST
+    FAST_FORWARD_NOTIFY_LIST.append( callback )
 
-def clear( ) -> None :
-    SCREEN.clear()
+def fast_forward_toggled( checked : bool ) -> None :
+    for callback in FAST_FORWARD_NOTIFY_LIST :
+        callback( checked )
 
 '''
-Scroll the emulated screen down N lines.
+Present a snapshot of the emulated I/O, as returned by chip8io.snapshot().
 
-Query: what if mode is now CHIP-8, which did not support scroll-down? Force
-SCHIP mode, or ignore?
+This is the only way the state of the emulator gets into the Display window.
+When the emulator is running, the Memory module's run thread takes a snapshot
+once per tick and sends it here through a queued signal, so this always
+executes on the GUI thread.
 
-Decision: just do it. Because most likely, any existing program that uses
-this, has already executed a HIGH to enter SCHIP mode. And if not, well, the
-old mode has a new feature.
+    * If the frame has changed, show the new one on the screen.
+    * Pass the tone changes, stamped with emulated time, to the tone
+      generator to play at the right moments.
+    * If the emulator has released a latched key, show it released.
 '''
 
-def scroll_down( n:int ) -> None :
-    SCREEN.scroll_down( n )
+def present_state( state : chip8io.Snapshot ) -> None :
+    ( frame, extended, _, latch_cleared, tone_events ) = state
+    if frame is not None :
+        SCREEN.show_frame( frame, extended )
+    if tone_events :
+        tone.schedule( tone_events )
+    if latch_cleared :
+        KEYPAD.clear_latch()
 
 '''
-Scroll the emulated screen 2 or 4 columns left, depending on mode.
-'''
+Present the current state of the emulated I/O. This is called from the GUI
+thread when the emulator is not running, for example after a single step or
+a reset, so it is safe to take the snapshot directly.
 
-def scroll_left( ) -> None :
-    SCREEN.scroll_left()
-
-'''
-Scroll the emulated screen 2 or 4 columns right, depending on mode.
+Do nothing unless our initialize() function has been called.
 '''
 
-def scroll_right( ) -> None :
-    SCREEN.scroll_right()
+def present( ) -> None :
+    if SCREEN :
+        present_state( chip8io.snapshot() )
+    # else: now running a unit-test, probably, so pass
 
 '''
-The Screen keeps a QPainter around as long as it is relevant. However it
-turns out that QPainter objects are not thread-safe. It is a disaster to try
-to use a QPainter from a thread different from the thread that created it. So
-whenever the Run thread is starting up or shutting down, it calls this
-function to say, "until further notice, calls to screen operations will come
-from a different thread."
-
-Delete any existing QPainters -- that's a thread-safe thing to do -- and the
-Screen will recreate them as and when needed. When it does, it will be
-executing on the thread that is starting.
-
-This is also a convenient time to set the ok_to_resize flag that prevents the
-emulated screen from responding to Qt resize events while the emulator is
-running.
-'''
+Turn the emulated beeper/tone on or off, at once.
 
-def change_of_thread( running=False ) -> None :
-    SCREEN.image_painter = None
-    SCREEN.pixel_painter = None
-    SCREEN.ok_to_resize = not running
+The tone is a 330Hz square wave synthesized by the tone module, which streams
+it to the audio output continuously and gates it on and off; see tone.py.
 
-'''
-Turn the emulated beeper/tone on or off.
-
-The tone is implemented with a QSoundEffect object primed with a 4.25 second,
-330Hz, square wave tone.
-
-The emulator calls sound(True) when the emulated ST reg is loaded. It calls
-sound(False) when the ST reg goes to zero or when the emulator stops for some
-reason.
-
-It might seem logical to use SFX.play()/SFX.stop() for this. However, this
-sound() function is usually called from a separate thread, the RunThread in
-memory.py. When that thread calls SFX.play(), we get an error message about
-"cannot create child from another thread" -- it seems that the play() method
-creates an object.
-
-So the present solution is to call SFX.play() in initialize() and immediately
-call setMuted(True). So the sound is playing all the time, but muted. This
-function calls setMuted(False) to reveal the existing sound, and
-setMuted(True) to stifle it. The setMuted() call is apparently thread-safe.
-
-The disadvantage is that there is a slight break in the sound each time it
-starts a new loop. The current sound file is 4.25 seconds long, so the break
-doesn't usually occur within the window of a short beep -- although it will
-occasionally. If it is a problem, one possible solution is to use a much
-longer .wav sample to make the resource file audio330hz.py.
+This function is called only from the GUI thread, by the Memory module when
+the emulator steps or stops. While the emulator runs, the tone follows the
+events in the snapshots instead; see present_state() above.
 '''
 
 def sound( on : bool ) -> None :
-    global SFX
-    if on : SFX.setMuted( False )
-    else : SFX.setMuted( True )
-
-'''
-Return the value of a key that is currently pressed, if any; else return
--1. This method is called for the key-testing instructions, SKE and SKNE.
-It does not clear a latched key status.
-'''
-
-def key_test(  ) -> int :
-    return KEYPAD.pressed_code
-
-'''
-Return the value of a key that is currently pressed, if any; else return
--1. this method is called for the LD Vt, K instruction and it does clear
-a latched value if there is one.
-'''
-
-def key_read( ) -> int :
-    key_code = KEYPAD.pressed_code
-    KEYPAD.clear_latch()
-    return key_code
-
-'''
-Reset display: called to clear the display when the emulated machine is
-reset, for example just before starting execution.
-    * set the mode to standard
-    * clear the emulated screen
-    * turn the sound off
-    * clear any latched key on the keypad
-
-Do none of these things unless our initialize() function has been called.
-'''
-def reset_io( ) -> None :
-    if KEYPAD :
-        '''
-        Assume the existence of a KEYPAD object means,
-        we have been initialized.
-        '''
-        set_mode( False )
-        clear( )
-        sound( False )
-        _ = key_read( )
-    # else: now running a unit-test, probably, so pass
+    tone.sound( on )
 
 '''
     MODULE INITIALIZATION
 
 Receive the settings object and save it in a global for shutdown time.
 Create the Display window including the screen and keypad.
-Create the QSoundEffect object.
+Start the tone generator.
 
 '''
 
 from PyQt5.QtCore import QSettings
 
 def initialize( settings: QSettings ) -> None :
-    global OUR_WINDOW, SCREEN, KEYPAD, SFX
+    global OUR_WINDOW, SCREEN, KEYPAD
     '''
     Create the window and everything in it.
     Pass the settings object for its use.
@@ -1211,14 +995,9 @@ def initialize( settings: QSettings ) -> None :
     SCREEN = OUR_WINDOW.screen
     KEYPAD = OUR_WINDOW.keypad
     '''
-    Create the QSoundEffect used to make the tone that is toggled by the
-    sound() method.
+    Start the tone generator, silent, for the sound() function.
     '''
-    SFX = QSoundEffect( None )
-    SFX.setSource( QUrl( 'qrc:/330HzSQARE.wav' ) )
-    SFX.setLoopCount( QSoundEffect.Infinite )
-    SFX.play()
-    SFX.setMuted( True )
+    tone.initialize()
 
     '''
     Display our window
@@ -1246,18 +1025,6 @@ if __name__ == '__main__' :
     quit_signal_slot() # otherwise you can't quit the unit test!
     OUR_WINDOW.show()
     sprite = [0x20,0x70,0x70,0xF8,0xD8,0x88] # rocket ship
-    draw_sprite( 16, 8, sprite )
+    chip8io.draw_sprite( 16, 8, sprite )
+    present()
     the_app.exec_()
-
-    #url = QUrl( 'qrc:/330HzSQARE.wav' )
-    #print('url',url.isValid() )
-    #sfx = QSoundEffect( )
-    #sfx.setSource( url )
-    #sfx.setLoopCount( QSoundEffect.Infinite )
-    #print('status',sfx.status())
-    #print('loaded',sfx.isLoaded() )
-    #print('vol',sfx.volume())
-    #from PyQt5.QtTest import QTest
-    #sfx.play()
-    #QTest.qWait(1000)
-    #sfx.stop()
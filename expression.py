@@ -0,0 +1,417 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 IDE Assembler Expressions
+
+This module compiles the expression operands of assembler statements, and
+evaluates them. It is used by assembler1, which compiles each expression when
+the statement is scanned, and by assembler2, which evaluates them during
+assembly.
+
+The expression syntax is that of CHIPPER: literals in decimal, #hex, @octal,
+$binary (in which a dot is a zero, so $..1..1.. draws a sprite), 'strings',
+names, parentheses, and the operators
+
+    unary:  +  -  ~
+    binary: !  (power)
+            *  /  %
+            +  -
+            <  >  (shift left, right)
+            &
+            ^
+            |
+
+which bind in the order listed, tightest first; and in which "!" groups right
+to left and the others left to right, so that 2!3!2 is 2!(3!2), and -2!2 is
+-(2!2). These are the precedences of the corresponding Python operators.
+That is no accident: originally the expressions were translated to Python
+and compiled by compile(), then evaluated by eval(). The operators are
+applied with the functions of the Python operator module, so the values are
+exactly what they were then, down to "/" producing a float that is truncated
+when the value is used.
+
+An expression is compiled by the "shunting-yard" algorithm to a postfix
+program: a tuple of steps, each a pair ( code, argument ):
+
+    ( PUSH, value ) push a literal value
+    ( NAME, name )  push the value of a name from the symbol table
+    ( UNARY, f )    replace the top value v with f( v )
+    ( BINARY, f )   replace the top two values a, b with f( a, b )
+
+While the program is built, any operator applied only to literals is
+evaluated at once ("constant folding"). Most operands are a single literal,
+or literals only, and fold to a single value; then compile_expression()
+returns that value itself, an int (or bytes, for a string), and evaluating it
+costs nothing. An operator is not folded when applying it raises an
+exception, for example a division by zero, so that the error is reported when
+the statement is assembled, as it always was.
+
+An expression that refers to names is not left as a postfix program, which
+would have to be interpreted step by step on every assembly. Instead the
+program is turned into a tree of small functions, one per operator, each
+taking the symbol table as its argument and calling the functions of its
+operands. A name is an operator.itemgetter(), which looks it up directly in
+the symbol table; so the most common case, a single name, costs one call to a
+built-in function.
+
+'''
+
+__all__ = [ 'ExpressionError', 'compile_expression', 'evaluate' ]
+
+import operator
+
+from typing import Callable, Dict, List, Tuple, Union
+
+'''
+The codes of the steps in a postfix program.
+'''
+
+PUSH = 0
+NAME = 1
+UNARY = 2
+BINARY = 3
+
+'''
+A compiled expression is a value, or a function of the symbol table.
+'''
+
+Expression = Union[ int, bytes, Callable[ [Dict[str,int]], object ] ]
+
+'''
+Shifting, multiplying and raising to a power can make numbers so big that
+just computing them takes seconds, and phase_one folds literals on every
+keystroke. So these operators refuse a result of more than VALUE_BIT_LIMIT
+bits, far more than any CHIP-8 value needs. Likewise a string repeated by
+multiplying may be no longer than STRING_LIMIT bytes, all of memory. Folding
+such an expression then fails, it is left to be evaluated at assembly, and
+the error is reported there.
+'''
+
+VALUE_BIT_LIMIT = 256
+STRING_LIMIT = 4096
+
+def check_size( bits : int ) -> None :
+    if bits > VALUE_BIT_LIMIT :
+        raise ValueError( 'Value too large' )
+
+def shift_left( a, b ) :
+    if isinstance( a, int ) and isinstance( b, int ) and a and b > 0 :
+        check_size( a.bit_length() + b )
+    return operator.lshift( a, b )
+
+def multiply( a, b ) :
+    if isinstance( a, int ) and isinstance( b, int ) :
+        check_size( a.bit_length() + b.bit_length() )
+    elif isinstance( a, bytes ) or isinstance( b, bytes ) :
+        ( text, count ) = ( a, b ) if isinstance( a, bytes ) else ( b, a )
+        if isinstance( count, int ) and len( text ) * count > STRING_LIMIT :
+            raise ValueError( 'Value too large' )
+    return operator.mul( a, b )
+
+def power( a, b ) :
+    if isinstance( a, int ) and isinstance( b, int ) and abs( a ) > 1 and b > 0 :
+        check_size( ( a.bit_length() - 1 ) * b + 1 )
+    return operator.pow( a, b )
+
+'''
+The operators, as a dict from the operator character to a tuple of
+(precedence, function, right-associative). Bigger numbers bind tighter.
+The unary operators are prefixes; they all have the same precedence, which
+is below that of "!" so that -2!2 is -(2!2), but 2!-1 is still 2!(-1).
+'''
+
+BINARY_OPS = {
+    '|' : ( 1, operator.or_, False ),
+    '^' : ( 2, operator.xor, False ),
+    '&' : ( 3, operator.and_, False ),
+    '<' : ( 4, shift_left, False ),
+    '>' : ( 4, operator.rshift, False ),
+    '+' : ( 5, operator.add, False ),
+    '-' : ( 5, operator.sub, False ),
+    '*' : ( 6, multiply, False ),
+    '/' : ( 6, operator.truediv, False ),
+    '%' : ( 6, operator.mod, False ),
+    '!' : ( 8, power, True )
+    }
+
+UNARY_PRECEDENCE = 7
+
+UNARY_OPS = {
+    '+' : operator.pos,
+    '-' : operator.neg,
+    '~' : operator.invert
+    }
+
+
+'''
+The exception raised by compile_expression() for an expression that does not
+make sense. The position is the index in the line of the offending token.
+'''
+
+class ExpressionError( ValueError ) :
+    def __init__( self, message:str, position:int ) :
+        super().__init__( message )
+        self.position = position
+
+'''
+Return the value of a literal token.
+'''
+
+def literal_value( t_type:str, t_value:str, position:int ) -> Union[int,bytes] :
+    if t_type == 'DECIMAL' :
+        return int( t_value, 10 )
+    if t_type == 'HEX' :
+        return int( t_value[1:], 16 )
+    if t_type == 'OCTAL' :
+        return int( t_value[1:], 8 )
+    if t_type == 'BINARY' :
+        return int( t_value[1:].replace( '.', '0' ), 2 )
+    '''
+    A STRING: drop the quotes, uppercase it, and make it ASCII bytes.
+    '''
+    try :
+        return t_value[1:-1].upper().encode( 'ASCII' )
+    except UnicodeEncodeError :
+        raise ExpressionError( 'Invalid string', position )
+
+'''
+Append an operator to the program being built, folding it into the values
+it applies to when they are both literals.
+'''
+
+def emit( program:List, code:int, function ) -> None :
+    if code == UNARY :
+        if program[-1][0] == PUSH :
+            try :
+                program[-1] = ( PUSH, function( program[-1][1] ) )
+                return
+            except Exception :
+                pass
+    elif program[-1][0] == PUSH and program[-2][0] == PUSH :
+        a = program[-2][1]
+        b = program[-1][1]
+        try :
+            value = function( a, b )
+            del program[-1]
+            program[-1] = ( PUSH, value )
+            return
+        except Exception :
+            pass
+    program.append( ( code, function ) )
+
+'''
+Compile a list of tokens, as made by assembler1 (each with t_type, t_value
+and t_start members), to an Expression. Raise ExpressionError if the tokens
+do not make an expression.
+
+The tokens alternate between operands and operators; expecting_operand tells
+which is wanted next. When an operand is expected, a "(" or one of the unary
+operators may come first.
+'''
+
+def compile_expression( tokens:List ) -> Expression :
+    program = [] # type: List[ Tuple[int,object] ]
+    pending = [] # stack of ( precedence, code, function ) or '('
+    expecting_operand = True
+    for token in tokens :
+        t_type = token.t_type
+        t_value = token.t_value
+        if t_type == 'WORD' :
+            if not expecting_operand :
+                raise ExpressionError( 'Invalid expression', token.t_start )
+            program.append( ( NAME, t_value ) )
+            expecting_operand = False
+        elif t_type != 'EXPOPS' :
+            if not expecting_operand :
+                raise ExpressionError( 'Invalid expression', token.t_start )
+            program.append( ( PUSH, literal_value( t_type, t_value, token.t_start ) ) )
+            expecting_operand = False
+        elif t_value == '(' :
+            if not expecting_operand :
+                raise ExpressionError( 'Invalid expression', token.t_start )
+            pending.append( '(' )
+        elif t_value == ')' :
+            if expecting_operand :
+                raise ExpressionError( 'Invalid expression', token.t_start )
+            while pending and pending[-1] != '(' :
+                ( _, code, function ) = pending.pop()
+                emit( program, code, function )
+            if not pending :
+                raise ExpressionError( 'Unbalanced parentheses', token.t_start )
+            pending.pop()
+        elif expecting_operand :
+            if t_value not in UNARY_OPS :
+                raise ExpressionError( 'Invalid expression', token.t_start )
+            pending.append( ( UNARY_PRECEDENCE, UNARY, UNARY_OPS[ t_value ] ) )
+        elif t_value not in BINARY_OPS :
+            raise ExpressionError( 'Invalid expression', token.t_start )
+        else :
+            ( precedence, function, right ) = BINARY_OPS[ t_value ]
+            while pending and pending[-1] != '(' \
+                  and ( pending[-1][0] > precedence
+                        or ( pending[-1][0] == precedence and not right ) ) :
+                ( _, code, pending_function ) = pending.pop()
+                emit( program, code, pending_function )
+            pending.append( ( precedence, BINARY, function ) )
+            expecting_operand = True
+    if expecting_operand :
+        position = tokens[-1].t_start if tokens else 0
+        raise ExpressionError( 'Invalid expression', position )
+    while pending :
+        item = pending.pop()
+        if item == '(' :
+            raise ExpressionError( 'Unbalanced parentheses', tokens[0].t_start )
+        emit( program, item[1], item[2] )
+    return make_tree( program )
+
+'''
+Turn a postfix program into the function tree described above, or into the
+value itself when it has been folded to a single value. The operands of each
+operator are taken from a stack of nodes, each either ( True, value ) for a
+literal, or ( False, function ).
+'''
+
+def make_tree( program:List ) -> Expression :
+    nodes = [] # type: List[ Tuple[bool,object] ]
+    for ( code, argument ) in program :
+        if code == PUSH :
+            nodes.append( ( True, argument ) )
+        elif code == NAME :
+            nodes.append( ( False, operator.itemgetter( argument ) ) )
+        elif code == UNARY :
+            nodes[-1] = ( False, unary_node( argument, nodes[-1] ) )
+        else :
+            right = nodes.pop()
+            nodes[-1] = ( False, binary_node( argument, nodes[-1], right ) )
+    ( is_value, result ) = nodes[0]
+    return result
+
+'''
+The operators applied to literals here are the ones that could not be folded
+because they raised an exception; they raise it again when evaluated.
+'''
+
+def unary_node( f, operand ) :
+    ( is_value, a ) = operand
+    if is_value :
+        return lambda symbols : f( a )
+    return lambda symbols : f( a( symbols ) )
+
+def binary_node( f, left, right ) :
+    ( left_is_value, a ) = left
+    ( right_is_value, b ) = right
+    if left_is_value and right_is_value :
+        return lambda symbols : f( a, b )
+    if right_is_value :
+        return lambda symbols : f( a( symbols ), b )
+    if left_is_value :
+        return lambda symbols : f( a, b( symbols ) )
+    return lambda symbols : f( a( symbols ), b( symbols ) )
+
+'''
+Evaluate an Expression, looking names up in a symbol table. A name that is
+not in the table raises IndexError( "Symbol 'X' is undefined" ). Anything
+else, for example ZeroDivisionError, is raised by the operator functions.
+(The operators of ints and bytes never raise KeyError, so a KeyError can
+only come from a name.)
+'''
+
+def evaluate( expression:Expression, symbols:Dict[str,int] ) :
+    if not callable( expression ) :
+        return expression
+    try :
+        return expression( symbols )
+    except KeyError as K :
+        raise IndexError( 'Symbol {!r} is undefined'.format( K.args[0] ) )
+
+if __name__ == '__main__' :
+
+    class Token() :
+        def __init__( self, t_type, t_value, t_start ) :
+            self.t_type = t_type
+            self.t_value = t_value
+            self.t_start = t_start
+
+    def tokens( text:str ) -> List[Token] :
+        result = []
+        for ( position, item ) in enumerate( text.split() ) :
+            if item[0] in '#@$' :
+                t_type = { '#':'HEX', '@':'OCTAL', '$':'BINARY' }[ item[0] ]
+            elif item[0] == "'" :
+                t_type = 'STRING'
+            elif item.isdigit() :
+                t_type = 'DECIMAL'
+            elif item in '()+-~!<>*/&|^%' :
+                t_type = 'EXPOPS'
+            else :
+                t_type = 'WORD'
+            result.append( Token( t_type, item, position ) )
+        return result
+
+    symbols = { 'BUF' : 0x300, 'SIZE' : 16 }
+    for ( text, value ) in [
+        ( '#FF', 255 ),
+        ( '$..1..1..', 0x24 ),
+        ( '@17 + 1', 16 ),
+        ( '- 2 ! 2', -4 ),
+        ( '2 ! - 1', 0.5 ),
+        ( '2 ! 3 ! 2', 512 ),
+        ( '7 / 2', 3.5 ),
+        ( '1 < 4 | 1', 17 ),
+        ( "'ma'", b'MA' ),
+        ( '( BUF + SIZE ) & #FF', 0x10 ),
+        ( 'BUF - - SIZE', 0x310 ),
+        ( '~ SIZE + 1', -16 )
+        ] :
+        compiled = compile_expression( tokens( text ) )
+        assert evaluate( compiled, symbols ) == value, text
+    '''
+    Literals fold to a value; names stay in the program.
+    '''
+    assert compile_expression( tokens( '( 2 + 3 ) * #10' ) ) == 80
+    assert compile_expression( tokens( 'BUF + 2 * 3' ) )( symbols ) == 0x306
+    assert compile_expression( tokens( "'AB' * 3" ) ) == compile_expression( tokens( "3 * 'AB'" ) ) == b'ABABAB'
+    '''
+    Errors at compile time, and at evaluation.
+    '''
+    for text in [ '1 2', '1 +', '( 1', '1 )', '* 2', '( )', 'BUF (', '1 ~ 2' ] :
+        try :
+            compile_expression( tokens( text ) )
+            assert False, text
+        except ExpressionError as E :
+            pass
+    for ( text, error ) in [ ( '1 / 0', ZeroDivisionError ),
+                             ( "~ 'A'", TypeError ),
+                             ( '1 < 20000000000 < 0', ValueError ),
+                             ( '( 1 < 1000000000 ) * ( 1 < 1000000000 ) > 99', ValueError ),
+                             ( '10 ! 99999', ValueError ),
+                             ( "'AB' * 99999", ValueError ),
+                             ( 'NONE + 1', IndexError ) ] :
+        try :
+            evaluate( compile_expression( tokens( text ) ), symbols )
+            assert False, text
+        except error :
+            pass
@@ -0,0 +1,331 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 IDE Control Flow Analysis
+
+This module has no Qt content. From the Statements of a successful assembly
+-- the form, PC and value of each -- it works out how many instructions a
+subroutine or a loop executes, without running it. The Source window shows
+the results in its status line, on the line that begins a subroutine or a
+loop, so the author can see whether the work of a frame fits in the
+instructions per tick that the emulator is set to run.
+
+The control flow graph has a node for each instruction, with edges to the
+instructions that can come next: the next one; for a skip, the next one and
+the one after; for JP, its target; for RET and EXIT, none. A CALL goes on to
+the next instruction, but its cost includes the cost of the subroutine.
+
+A subroutine is the target of a CALL. A loop is found wherever a jump (or
+just falling through) goes back to an instruction that is already under way,
+found by a depth-first search of the graph from the start of the program,
+from every CALL target and from every label. The instruction it goes back to
+is the head of the loop.
+
+For each, we find the fewest and the most instructions on any path: for a
+subroutine, from its entry to a RET (or EXIT); for a loop, from its head
+around to the jump back. We also find the fewest and most sprite rows drawn
+on any path, counting 16 for a DRAW of height 0. Each of these four numbers
+is found separately, so the fewest instructions and the fewest rows may come
+from different paths.
+
+A loop within a subroutine or loop is counted once around, and a JP V0 or a
+CALL whose cost cannot be known (a recursive one, or a CALL into included
+code, which has no Statements) is counted as one instruction. Then the
+numbers are lower bounds, not exact, and are shown with a +.
+
+'''
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from statement_class import Statement
+
+__all__ = [ 'Cost', 'analyze', 'describe' ]
+
+SKIP_FORMS = ( 'SER', 'SNER', 'SEB', 'SNEB', 'SKP', 'SKNP' )
+END_FORMS = ( 'RET', 'EXIT' )
+DATA_FORMS = ( 'DA', 'DB', 'DW' )
+
+class Cost() :
+    __slots__ = [ 'best', 'worst', 'best_rows', 'worst_rows', 'exact' ]
+    def __init__( self, best : int, worst : int, best_rows : int, worst_rows : int, exact : bool ) :
+        self.best = best
+        self.worst = worst
+        self.best_rows = best_rows
+        self.worst_rows = worst_rows
+        self.exact = exact
+
+'''
+The graph of one assembled program.
+'''
+
+class FlowGraph() :
+    def __init__( self, statements : List[Statement] ) :
+        '''
+        Index the instructions by PC. Data is not part of the graph.
+        '''
+        self.nodes = dict() # type: Dict[ int, Statement ]
+        for S in statements :
+            if S.value and S.form not in DATA_FORMS :
+                self.nodes[ S.PC ] = S
+        '''
+        Collect the roots for the search: the start, the CALL targets, which
+        are the subroutines, and every label on an instruction. A label on a
+        line by itself labels the next statement that has a value.
+        '''
+        self.subroutines = set() # type: Set[int]
+        for S in self.nodes.values() :
+            if form_of( S ) == 'CALL' and target_of( S ) in self.nodes :
+                self.subroutines.add( target_of( S ) )
+        labels = [] # type: List[int]
+        labelled = False
+        for S in statements :
+            if S.defined_name and S.form != 'EQU' :
+                labelled = True
+            if labelled and S.value :
+                labels.append( S.PC )
+                labelled = False
+        roots = [ 0x200 ] + sorted( self.subroutines ) + labels
+        self.back_edges = set() # type: Set[ Tuple[int,int] ]
+        self.find_back_edges( [ PC for PC in roots if PC in self.nodes ] )
+        self.headers = set( head for ( tail, head ) in self.back_edges )
+        self.sub_costs = dict() # type: Dict[ int, Optional[Cost] ]
+        self.in_progress = set() # type: Set[int]
+
+    '''
+    Return the PCs of the instructions that can follow the one at PC.
+    '''
+    def successors( self, PC : int ) -> List[int] :
+        S = self.nodes[ PC ]
+        if S.form in END_FORMS or S.form == 'JPXADR' :
+            return []
+        if form_of( S ) == 'JPADR' :
+            following = [ target_of( S ) ]
+        elif S.form in SKIP_FORMS :
+            following = [ PC + 2, PC + 4 ]
+        else :
+            following = [ PC + len( S.value ) ]
+        return [ next_PC for next_PC in following if next_PC in self.nodes ]
+
+    def forward( self, PC : int ) -> List[int] :
+        return [ next_PC for next_PC in self.successors( PC )
+                 if ( PC, next_PC ) not in self.back_edges ]
+
+    '''
+    Depth-first search from each root in turn, without recursion. An edge to
+    an instruction whose successors are still being searched closes a loop.
+    '''
+    def find_back_edges( self, roots : List[int] ) -> None :
+        done = set() # type: Set[int]
+        for root in roots :
+            if root in done :
+                continue
+            on_path = { root }
+            stack = [ ( root, iter( self.successors( root ) ) ) ]
+            while stack :
+                ( PC, following ) = stack[-1]
+                next_PC = next( following, None )
+                if next_PC is None :
+                    stack.pop()
+                    on_path.discard( PC )
+                    done.add( PC )
+                elif next_PC in on_path :
+                    self.back_edges.add( ( PC, next_PC ) )
+                elif next_PC not in done :
+                    on_path.add( next_PC )
+                    stack.append( ( next_PC, iter( self.successors( next_PC ) ) ) )
+
+    '''
+    Find the Cost of the paths from start along forward edges that end: at a
+    RET or EXIT when head is None, else at a jump back to head. Without back
+    edges the graph has no cycles, so the Cost of each instruction can be
+    found from those of its successors, visiting them first.
+    '''
+    def measure( self, start : int, head : Optional[int] = None ) -> Optional[Cost] :
+        memo = dict() # type: Dict[ int, Optional[Cost] ]
+        expanded = set() # type: Set[int]
+        stack = [ start ]
+        while stack :
+            PC = stack[-1]
+            if PC in memo :
+                stack.pop()
+                continue
+            if PC not in expanded :
+                expanded.add( PC )
+                stack.extend( next_PC for next_PC in self.forward( PC ) if next_PC not in memo )
+                continue
+            stack.pop()
+            memo[ PC ] = self.path_cost( PC, head, memo )
+        return memo[ start ]
+
+    def path_cost( self, PC : int, head : Optional[int], memo : Dict[ int, Optional[Cost] ] ) -> Optional[Cost] :
+        S = self.nodes[ PC ]
+        '''
+        The cost of this instruction itself.
+        '''
+        own = Cost( 1, 1, 0, 0, S.form != 'JPXADR' and ( PC == head or PC not in self.headers ) )
+        if S.form == 'DRAW' :
+            own.best_rows = own.worst_rows = ( S.value[1] & 0x0F ) or 16
+        elif form_of( S ) == 'CALL' :
+            called = self.subroutine( target_of( S ) )
+            if called is None :
+                own.exact = False
+            else :
+                add_cost( own, called )
+        '''
+        The choices of how to go on from here.
+        '''
+        choices = [] # type: List[Cost]
+        if ( head is None and S.form in END_FORMS ) or ( PC, head ) in self.back_edges :
+            choices.append( Cost( 0, 0, 0, 0, True ) )
+        for next_PC in self.forward( PC ) :
+            if memo.get( next_PC ) is not None :
+                choices.append( memo[ next_PC ] )
+        if not choices :
+            return None
+        rest = Cost( min( C.best for C in choices ), max( C.worst for C in choices ),
+                     min( C.best_rows for C in choices ), max( C.worst_rows for C in choices ),
+                     all( C.exact for C in choices ) )
+        add_cost( own, rest )
+        return own
+
+    '''
+    Return the Cost of the subroutine at PC, or None if it cannot be known.
+    '''
+    def subroutine( self, PC : int ) -> Optional[Cost] :
+        if PC not in self.sub_costs :
+            if PC not in self.nodes or PC in self.in_progress :
+                return None
+            self.in_progress.add( PC )
+            self.sub_costs[ PC ] = self.measure( PC )
+            self.in_progress.discard( PC )
+        return self.sub_costs[ PC ]
+
+'''
+Return the form of the instruction as it will run. The optimizer (see
+peephole.py) turns a CALL followed by RET into a JP in the value it puts in
+the Statement, but leaves the form as the source says, since that is what
+the next assembly goes by. So for these two, the opcode decides.
+'''
+
+def form_of( S : Statement ) -> str :
+    if S.form in ( 'CALL', 'JPADR' ) :
+        return 'CALL' if S.value[0] >> 4 == 2 else 'JPADR'
+    return S.form
+
+def target_of( S : Statement ) -> int :
+    return ( ( S.value[0] & 0x0F ) << 8 ) | S.value[1]
+
+def add_cost( total : Cost, more : Cost ) -> None :
+    total.best += more.best
+    total.worst += more.worst
+    total.best_rows += more.best_rows
+    total.worst_rows += more.worst_rows
+    total.exact = total.exact and more.exact
+
+'''
+Analyze the Statements of a successful assembly. Return a dict from the PC
+of each subroutine and loop head to a list of ( kind, Cost ), where kind is
+'call' or 'loop'. An instruction can be both.
+'''
+
+def analyze( statements : List[Statement] ) -> Dict[ int, List[ Tuple[ str, Cost ] ] ] :
+    graph = FlowGraph( statements )
+    results = dict() # type: Dict[ int, List[ Tuple[ str, Cost ] ] ]
+    for PC in sorted( graph.subroutines ) :
+        cost = graph.subroutine( PC )
+        if cost is not None :
+            results.setdefault( PC, [] ).append( ( 'call', cost ) )
+    for PC in sorted( graph.headers ) :
+        cost = graph.measure( PC, PC )
+        if cost is not None :
+            results.setdefault( PC, [] ).append( ( 'loop', cost ) )
+    return results
+
+'''
+Describe the results for one PC in a line of text. When inst_per_tick is
+given, also say how many ticks the most instructions would take.
+'''
+
+def describe( results : List[ Tuple[ str, Cost ] ], inst_per_tick : int = 0 ) -> str :
+    parts = []
+    for ( kind, cost ) in results :
+        plus = '' if cost.exact else '+'
+        text = '{} {}{} inst'.format( kind, span( cost.best, cost.worst ), plus )
+        if cost.worst_rows :
+            rows = span( cost.best_rows, cost.worst_rows ) + plus
+            text += ', {} row{}'.format( rows, '' if rows == '1' else 's' )
+        if inst_per_tick > 0 :
+            ticks = -( -cost.worst // inst_per_tick )
+            text += ', {} tick{}'.format( ticks, '' if ticks == 1 else 's' )
+        parts.append( text )
+    return '; '.join( parts )
+
+def span( low : int, high : int ) -> str :
+    return str( low ) if low == high else '{}-{}'.format( low, high )
+
+if __name__ == '__main__' :
+
+    from assembler2 import assemble_lines
+    ( image, statements ) = assemble_lines( [
+        'MAIN:   CALL SHOW',          # 200
+        '        LD V2, K',           # 202
+        '        JP MAIN',            # 204
+        'SHOW:   LD I, DOT',          # 206
+        '        LD V0, 0',           # 208
+        'ROW:    DRAW V0, V1, 1',     # 20A
+        '        ADD V0, 8',          # 20C
+        '        SE V0, 64',          # 20E
+        '        JP ROW',             # 210
+        '        SNE V1, 0',          # 212
+        '        RET',                # 214
+        '        DRAW V0, V1, 0',     # 216
+        '        RET',                # 218
+        'DOT:    DB #80'              # 21A
+        ] )
+    results = analyze( statements )
+    assert sorted( results ) == [ 0x200, 0x206, 0x20A ]
+    ( kind, cost ) = results[ 0x20A ][0]
+    assert kind == 'loop' and ( cost.best, cost.worst, cost.best_rows, cost.worst_rows, cost.exact ) == ( 4, 4, 1, 1, True )
+    ( kind, cost ) = results[ 0x206 ][0]
+    assert kind == 'call' and ( cost.best, cost.worst, cost.best_rows, cost.worst_rows, cost.exact ) == ( 7, 8, 1, 17, False )
+    assert describe( results[ 0x206 ] ) == 'call 7-8+ inst, 1-17+ rows'
+    assert describe( results[ 0x200 ], 10 ) == 'loop 10-11+ inst, 1-17+ rows, 2 ticks'
+    '''
+    After optimizing, a CALL made JP is counted as the JP it now is.
+    '''
+    from peephole import optimize
+    ( image, statements ) = assemble_lines( [
+        'MAIN:   CALL SHOW',          # 200
+        '        JP MAIN',            # 202
+        'SHOW:   CALL DOT',           # 204 becomes JP DOT
+        '        RET',                # 206
+        'DOT:    CLS',                # 208
+        '        RET'                 # 20A
+        ] )
+    assert describe( analyze( statements )[ 0x204 ] ) == 'call 4 inst'
+    optimize( statements, image )
+    assert statements[2].form == 'CALL' and statements[2].value == [ 0x12, 0x08 ]
+    assert describe( analyze( statements )[ 0x204 ] ) == 'call 3 inst'
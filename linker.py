@@ -0,0 +1,304 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 IDE Object Modules and Linker
+
+This module has no Qt content. It implements the INCLUDE directive,
+
+    INCLUDE 'library.asm'
+
+which makes the subroutines and data of another source file part of the
+program, without pasting them into it. The file name is relative to the
+folder of the program's file.
+
+An included file is assembled on its own, once, into an object module:
+
+* code: its bytes, as assembled starting at 0x0200,
+* relocations: the places in the code that hold an address within the
+  module, which must be adjusted when the module is loaded elsewhere,
+* symbols: every name it defines, with its value and whether that value
+  is an address within the module (relocatable) or not (absolute).
+
+The modules are kept in a cache keyed by the hash of the file's text, so
+editing and assembling the program does not assemble the unchanged
+libraries again. If the assembly cache is in use (asmcache.py) they are also
+saved in its folder, so they survive to the next session.
+
+When the program is assembled (see assembler2.assemble_statements()) each
+module is placed after the end of the program, in the order of the INCLUDE
+statements, and its symbols become part of the program's symbol table. The
+absolute ones are defined before the first pass and the relocatable ones as
+soon as the program's size is known, after the first pass. So the program
+can use the module's names anywhere except in ORG and DS, where they would
+be forward references. After the second pass, the code of each module is
+relocated to its place and copied into the memory image.
+
+Finding the relocations
+
+The assembler has no notion of a relocatable value; an expression just has
+a value. So to find which values depend on where the module is loaded, the
+module is assembled twice, at 0x0200 and at 0x0200+RELOCATION_TEST. A value
+that is the same both times is absolute. The address field of a jump, call
+or LD I, or a DW word, that moved by exactly RELOCATION_TEST, is an address
+in the module and is relocated. Any other value that changed -- a byte that
+holds part of an address, for instance -- cannot be adjusted, and is an
+error. Names are classified the same way.
+
+Restrictions
+
+An included file must stand alone: it cannot refer to names of the program
+or of other modules, nor can it contain ORG, which would fix its address, or
+INCLUDE. Including the same file twice includes it once.
+
+'''
+
+import hashlib
+import os
+
+from typing import Dict, List, Optional, Tuple
+
+__all__ = [ 'ObjectModule', 'load_module', 'relocate', 'include_signature' ]
+
+'''
+The base address of all CHIP-8 programs, and the offset of the second
+assembly of a module.
+'''
+BASE_ADDRESS = 0x0200
+RELOCATION_TEST = 0x10
+
+'''
+The forms of statement whose value is an opcode with a 12-bit address.
+'''
+ADDRESS_FORMS = ( 'JPADR', 'CALL', 'LDI', 'JPXADR' )
+
+class ObjectModule() :
+    __slots__ = [ 'name', 'code', 'relocations', 'symbols', 'errors' ]
+    def __init__( self, name : str ) :
+        '''
+        The file name, as written in the INCLUDE.
+        '''
+        self.name = name
+        '''
+        The bytes of the module as assembled at BASE_ADDRESS.
+        '''
+        self.code = [] # type: List[int]
+        '''
+        The relocations, each a tuple (offset, bits), where offset is the
+        index in code of the first of two bytes, and bits is 12 for the
+        address field of an opcode or 16 for a DW word.
+        '''
+        self.relocations = [] # type: List[ Tuple[int,int] ]
+        '''
+        The names defined, each with a tuple (value, relocatable). The
+        value of a relocatable name is as assembled at BASE_ADDRESS.
+        '''
+        self.symbols = dict() # type: Dict[ str, Tuple[int,bool] ]
+        '''
+        Error messages in file:line: message form. A module with errors
+        cannot be linked.
+        '''
+        self.errors = [] # type: List[str]
+
+'''
+Make an object module from the text of a file.
+'''
+
+def make_module( name : str, text : str ) -> ObjectModule :
+    import assembler2
+    module = ObjectModule( name )
+    from assembler1 import phase_one
+    from statement_class import Statement
+    statements = [] # type: List[Statement]
+    for ( number, line ) in enumerate( text.splitlines(), 1 ) :
+        S = Statement()
+        phase_one( line, S )
+        if S.form in ( 'ORG', 'INCLUDE' ) :
+            module.errors.append( '{}:{}: {} is not allowed in an included file'.format( name, number, S.form ) )
+        statements.append( S )
+    if module.errors :
+        return module
+    '''
+    The first assembly, at BASE_ADDRESS. Save the values of the statements
+    and of the names.
+    '''
+    code = assembler2.assemble_statements( statements, incremental=False )
+    if code and code[0] < 0 :
+        module.errors = assembly_errors( name, statements )
+        return module
+    first_values = [ S.value for S in statements ]
+    first_symbols = dict( assembler2.SYMBOLS )
+    '''
+    The second assembly, moved up by RELOCATION_TEST.
+    '''
+    moved_base = BASE_ADDRESS + RELOCATION_TEST
+    moved = assembler2.assemble_statements( statements, incremental=False, origin=moved_base )
+    if moved and moved[0] < 0 :
+        module.errors = assembly_errors( name, statements )
+        return module
+    '''
+    Compare them.
+    '''
+    for ( number, S ) in enumerate( statements, 1 ) :
+        before = first_values[ number - 1 ]
+        if S.value == before :
+            continue
+        offset = S.PC - moved_base
+        if S.form in ADDRESS_FORMS \
+           and ( S.value[1] - before[1] ) + ( ( S.value[0] - before[0] ) << 8 ) == RELOCATION_TEST :
+            module.relocations.append( ( offset, 12 ) )
+            continue
+        if S.form == 'DW' :
+            good = True
+            for index in range( 0, len( S.value ), 2 ) :
+                old_word = ( before[ index ] << 8 ) | before[ index + 1 ]
+                new_word = ( S.value[ index ] << 8 ) | S.value[ index + 1 ]
+                if new_word - old_word == RELOCATION_TEST :
+                    module.relocations.append( ( offset + index, 16 ) )
+                elif new_word != old_word :
+                    good = False
+            if good :
+                continue
+        module.errors.append( '{}:{}: value depends on the module address and cannot be relocated'.format( name, number ) )
+    for ( symbol, value ) in first_symbols.items() :
+        moved_value = assembler2.SYMBOLS.get( symbol )
+        if moved_value == value :
+            module.symbols[ symbol ] = ( value, False )
+        elif moved_value == value + RELOCATION_TEST :
+            module.symbols[ symbol ] = ( value, True )
+        else :
+            module.errors.append( '{}: value of {} cannot be relocated'.format( name, symbol ) )
+    module.code = list( code )
+    return module
+
+def assembly_errors( name : str, statements : List ) -> List[str] :
+    return [ '{}:{}: {}'.format( name, number, S.error_msg )
+             for ( number, S ) in enumerate( statements, 1 )
+             if S.text_error or S.expr_error ]
+
+'''
+Return the code of a module relocated to be loaded at base.
+'''
+
+def relocate( module : ObjectModule, base : int ) -> List[int] :
+    code = list( module.code )
+    shift = base - BASE_ADDRESS
+    for ( offset, bits ) in module.relocations :
+        word = ( code[ offset ] << 8 ) | code[ offset + 1 ]
+        if bits == 12 :
+            word = ( word & 0xF000 ) | ( ( word + shift ) & 0x0FFF )
+        else :
+            word = ( word + shift ) & 0xFFFF
+        code[ offset ] = word >> 8
+        code[ offset + 1 ] = word & 0xFF
+    return code
+
+'''
+Object modules are cached in MODULES, keyed by the hash of their text. The
+number kept is limited to MODULE_LIMIT, dropping the oldest. When the
+assembly cache is in use, CACHE_DIRECTORY is the folder of it, where the
+modules are saved as well.
+'''
+
+MODULES = dict() # type: Dict[ str, ObjectModule ]
+MODULE_LIMIT = 32
+CACHE_DIRECTORY = None # type: Optional[str]
+
+def text_key( text : str ) -> str :
+    from asmcache import source_key
+    return 'module-' + source_key( text )
+
+'''
+Return the object module for a file, from the cache if possible. A file
+that cannot be read, or is not a source file, makes a module with only an
+error.
+'''
+
+def load_module( name : str, directory : str ) -> ObjectModule :
+    try :
+        with open( os.path.join( directory, name ), 'rb' ) as file :
+            text = file.read().decode( 'ASCII', errors='strict' )
+    except OSError as E :
+        module = ObjectModule( name )
+        module.errors = [ '{}: {}'.format( name, E.strerror ) ]
+        return module
+    except UnicodeDecodeError :
+        module = ObjectModule( name )
+        module.errors = [ '{}: not an assembler source'.format( name ) ]
+        return module
+    key = text_key( text )
+    if key in MODULES :
+        return MODULES[ key ]
+    module = None
+    if CACHE_DIRECTORY is not None :
+        module = load_saved_module( name, key )
+    if module is None :
+        module = make_module( name, text )
+        if CACHE_DIRECTORY is not None and not module.errors :
+            save_module( module, key )
+    MODULES[ key ] = module
+    if len( MODULES ) > MODULE_LIMIT :
+        del MODULES[ next( iter( MODULES ) ) ]
+    return module
+
+def load_saved_module( name : str, key : str ) -> Optional[ObjectModule] :
+    from asmcache import load_json
+    saved = load_json( CACHE_DIRECTORY, key )
+    if saved is None :
+        return None
+    try :
+        module = ObjectModule( name )
+        module.code = list( bytes.fromhex( saved[ 'code' ] ) )
+        module.relocations = [ ( offset, bits ) for ( offset, bits ) in saved[ 'relocations' ] ]
+        module.symbols = { symbol : ( value, relocatable )
+                           for ( symbol, ( value, relocatable ) ) in saved[ 'symbols' ].items() }
+    except ( ValueError, KeyError, TypeError ) :
+        return None
+    return module
+
+def save_module( module : ObjectModule, key : str ) -> None :
+    from asmcache import save_json
+    save_json( CACHE_DIRECTORY, key, {
+        'code' : bytes( module.code ).hex(),
+        'relocations' : module.relocations,
+        'symbols' : module.symbols
+        } )
+
+'''
+Return a string that identifies the contents of the files included by a
+list of Statements, for the assembly cache: the whole assembly is the same
+only if these are also the same.
+'''
+
+def include_signature( statements : List, directory : str ) -> str :
+    signature = []
+    for S in statements :
+        if S.form == 'INCLUDE' :
+            try :
+                with open( os.path.join( directory, S.expressions[0] ), 'rb' ) as file :
+                    signature.append( hashlib.sha256( file.read() ).hexdigest() )
+            except OSError :
+                signature.append( 'missing' )
+    return '\n'.join( signature )
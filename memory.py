@@ -76,6 +76,21 @@ executed around 100 instructions per tick (about 2500/sec). On modern hardware
 the emulator can exceed that by orders of magnitude, and this gives the user
 control over how fast an emulated program runs.
 
+The AUTO button, when checked, lets the emulator choose the Inst/tick value
+itself: the highest rate it can sustain with time to spare. While running, the
+status line shows the instructions per second actually executed, the
+shortfall (instructions per tick asked for but not done) and the fraction of
+time spent idle. The rate chosen is remembered for each program.
+
+The LIVE button, when checked, keeps the memory, call stack and register
+displays up to date while the emulator runs, refreshing them ten times a
+second from a copy of the machine state. Otherwise they show the state as it
+was at RUN until the emulator stops.
+
+The Run mode can be switched to turbo, using the fast-forward button in the
+Display window. Then the emulator runs as fast as it can, with the delay and
+sound timers counting down once per Inst/tick instructions.
+
 Coding note:
 
 Because this is a module, rather than a singleton class definition, it is
@@ -98,14 +113,28 @@ __all__ = [ 'initialize', 'connect_signal' ]
 
 '''
 Import the chip8 module for access to the memory, registers and call stack.
-Import the display module just so we can call display.sound().
+Import chip8io, the emulated I/O state, which the run thread updates with key
+changes. Import the display module to present snapshots of that state.
 Import chip8util for access to the font and RSSButton class.
 '''
 
 import chip8
+import chip8io
+import chip8proc
 import display
 import chip8util
 
+'''
+Import the standard modules: hashlib for the key of the AUTO rate, os for the
+environment, and queue and threading for the run thread.
+'''
+
+import hashlib
+import logging
+import os
+import queue
+import threading
+
 '''
 Import needed Qt names.
 '''
@@ -115,16 +144,14 @@ from PyQt5.QtCore import (
     Qt,
     QAbstractListModel,
     QAbstractTableModel,
-    QCoreApplication,
     QItemSelection,
     QItemSelectionModel,
-    QMutex,
     QPoint,
     QSettings,
+    QObject,
     QSize,
     QThread,
-    QTimer,
-    QWaitCondition
+    QTimer
 )
 
 from PyQt5.QtGui import (
@@ -137,17 +164,18 @@ from PyQt5.QtWidgets import (
     QAbstractItemView,
     QFrame,
     QHBoxLayout,
+    QHeaderView,
     QLabel,
     QLineEdit,
     QListView,
     QSizePolicy,
     QSpinBox,
+    QStyle,
     QStyledItemDelegate,
     QTableView,
     QVBoxLayout,
     QWidget
 )
-from PyQt5.QtTest import QTest
 
 
 '''
@@ -157,6 +185,24 @@ white QBrush for foreground.
 BLACK_BRUSH = QBrush( QColor( "Black" ) )
 WHITE_BRUSH = QBrush( QColor( "White" ) )
 
+'''
+While the emulator runs in live mode, the tables show LIVE_STATE, the latest
+copy of the machine state published by the run loop (see chip8proc.py),
+rather than the emulator's globals, which are changing under them. The rest
+of the time LIVE_STATE is None and the tables show the globals. The models
+get their data through these functions.
+'''
+LIVE_STATE = None # type: chip8proc.MachineState
+
+def shown_regs( ) :
+    return chip8.REGS if LIVE_STATE is None else LIVE_STATE[0]
+
+def shown_stack( ) :
+    return chip8.CALL_STACK if LIVE_STATE is None else LIVE_STATE[1]
+
+def shown_memory( ) :
+    return chip8.MEMORY if LIVE_STATE is None else LIVE_STATE[2]
+
 '''
 Define the RUN/STOP button. The base RSSButton class sets its visual properties
 including a mono font, and sizes it to a width of 8 ems.
@@ -203,12 +249,44 @@ class InstPerTick( QSpinBox ) :
     def __init__( self, start_value:int ) -> None :
         super().__init__( None )
         self.setMinimum( 1 )
-        self.setMaximum( 100 )
+        self.setMaximum( chip8proc.AUTO_LIMIT_MAX )
         self.setValue( start_value )
         self.setSingleStep( 1 )
 
 INST_PER_TICK = None # type: InstPerTick
 
+'''
+Define the AUTO button, a checkable RSSButton. When it is checked, the run
+loop tunes the instructions/tick itself, and the spinbox follows along to show
+the value it has chosen. The value it settles on is remembered in the settings
+for each program, identified by a hash of the program as loaded, and is used
+as the starting point the next time that program runs.
+'''
+
+class AutoButton( chip8util.RSSButton ) :
+    def __init__( self, checked:bool, parent=None ) :
+        super().__init__( parent )
+        self.setCheckable( True )
+        self.setText( ' AUTO  ' )
+        self.setChecked( checked )
+
+AUTO_BUTTON = None # type: AutoButton
+
+'''
+Define the LIVE button, a toggle like AUTO. When it is checked, the tables
+are refreshed ten times a second while the emulator runs, instead of staying
+as they were until it stops.
+'''
+
+class LiveButton( chip8util.RSSButton ) :
+    def __init__( self, checked:bool, parent=None ) :
+        super().__init__( parent )
+        self.setCheckable( True )
+        self.setText( ' LIVE  ' )
+        self.setChecked( checked )
+
+LIVE_BUTTON = None # type: LiveButton
+
 '''
     MEMORY DISPLAY
 
@@ -271,6 +349,17 @@ class MemoryDisplay( QTableView ) :
             QSizePolicy( QSizePolicy.Expanding, QSizePolicy.Preferred )
             )
         '''
+        Every cell and every column header is two characters of the mono
+        font, so the column width is known now, once: those two characters
+        plus the margins Qt puts around the text of a header section. Fix it,
+        so Qt never measures 4096 cells to resize the columns to contents.
+        '''
+        margin = self.style().pixelMetric( QStyle.PM_FocusFrameHMargin ) + 1
+        header = self.horizontalHeader()
+        header.setSectionResizeMode( QHeaderView.Fixed )
+        header.setDefaultSectionSize(
+            chip8util.MONOFONT_METRICS.width( '00' ) + ( 4 * margin ) )
+        '''
         Instantiate the table model (data supplier) and connect it.
         '''
         mm = MemoryModel( self )
@@ -308,6 +397,17 @@ class MemoryDisplay( QTableView ) :
         '''
         self.selectionModel().select( sel_item, QItemSelectionModel.ClearAndSelect )
 
+'''
+Qt calls the data() method of the memory model for every role of every
+visible cell, each time the table is repainted or scrolled: thousands of
+calls. So do no formatting there. HEX_BYTE holds the two-digit display form
+of each of the 256 byte values, and HEX_ADDRESS the four-digit form of each of
+the 4096 addresses, for tooltips and row headers.
+'''
+
+HEX_BYTE = [ '{0:02X}'.format( value ) for value in range( 256 ) ]
+HEX_ADDRESS = [ '{0:04X}'.format( address ) for address in range( 4096 ) ]
+
 '''
 Define the memory table model, the object that contains the contents of
 memory and delivers them as required by the table view. For example if the
@@ -321,6 +421,36 @@ class MemoryModel( QAbstractTableModel ) :
 
     def __init__( self, parent=None ) :
         super().__init__( parent )
+        '''
+        Make the table that dispatches data() on the role. Each entry takes
+        the address of the cell and returns its data in that role. The font
+        and brushes are the same for every cell, so those return constants.
+        '''
+        font = chip8util.MONOFONT
+        self.role_table = {
+            Qt.DisplayRole : lambda address : HEX_BYTE[ shown_memory()[ address ] ],
+            Qt.ToolTipRole : HEX_ADDRESS.__getitem__,
+            Qt.FontRole : lambda address : font,
+            Qt.ForegroundRole : lambda address : WHITE_BRUSH,
+            Qt.BackgroundRole : lambda address : BLACK_BRUSH
+            }
+
+    '''
+    Tell the view that some ranges of memory have changed, as returned by
+    chip8.take_dirty(). Each range is converted to the rectangle of cells
+    it covers: part of one row, or else the full width of the rows it
+    touches. The view repaints those cells, if they are visible, and leaves
+    the rest of the table alone.
+    '''
+    def cells_changed( self, ranges ) :
+        last_col = MEM_TABLE_COLS - 1
+        for ( start, end ) in ranges :
+            ( top, left ) = divmod( start, MEM_TABLE_COLS )
+            ( bottom, right ) = divmod( end - 1, MEM_TABLE_COLS )
+            if top != bottom :
+                ( left, right ) = ( 0, last_col )
+            self.dataChanged.emit(
+                self.index( top, left ), self.index( bottom, right ) )
 
     '''
     The flags method tells Qt what the user can do with the table. It is
@@ -351,21 +481,13 @@ class MemoryModel( QAbstractTableModel ) :
         font: MONOFONT
         background: BLACK_BRUSH
         foreground: WHITE_BRUSH
+    Any other role gets None. See role_table, above.
     '''
     def data( self, index, role ) :
-        row = index.row()
-        col = index.column()
-        if role == Qt.DisplayRole :
-            return '{0:02X}'.format( chip8.MEMORY[ (row * MEM_TABLE_COLS) + col ] )
-        elif role == Qt.ToolTipRole :
-            return '{0:04X}'.format( (row * MEM_TABLE_COLS) + col )
-        elif role == Qt.FontRole :
-            return chip8util.MONOFONT
-        elif role == Qt.ForegroundRole :
-            return WHITE_BRUSH
-        elif role == Qt.BackgroundRole :
-            return BLACK_BRUSH
-        return None
+        handler = self.role_table.get( role )
+        if handler is None :
+            return None
+        return handler( ( index.row() * MEM_TABLE_COLS ) + index.column() )
 
     '''
     The headerData() method returns data for the horizontal and
@@ -378,9 +500,9 @@ class MemoryModel( QAbstractTableModel ) :
     def headerData( self, section, orientation, role ) :
         if role == Qt.DisplayRole :
             if orientation == Qt.Horizontal :
-                return '{0:02X}'.format( section ) # ' 0', ' 1'...
+                return HEX_BYTE[ section ] # 00, 01...
             else :
-                return '{0:04X}'.format( MEM_TABLE_COLS * section ) # 0000, 0010...
+                return HEX_ADDRESS[ MEM_TABLE_COLS * section ] # 0000, 0020...
         elif role == Qt.FontRole :
             return chip8util.MONOFONT
         elif role == Qt.ForegroundRole :
@@ -547,7 +669,7 @@ class RegisterModel( QAbstractTableModel ) :
             pattern = '{0:02X}'
             if col == chip8.R.P or col == chip8.R.I :
                 pattern = '{0:03X}'
-            return pattern.format( chip8.REGS [ col ] )
+            return pattern.format( shown_regs()[ col ] )
         elif role == Qt.ToolTipRole :
             return 'register {}'.format( self.headers[ col ] )
         elif role == Qt.FontRole :
@@ -681,7 +803,8 @@ class CallStackModel( QAbstractListModel ) :
         The emulated stack might have zero, one to twelve items. Note whether
         the requested item is in the stack or just empty.
         '''
-        stack_item_exists = item_number < len( chip8.CALL_STACK )
+        call_stack = shown_stack()
+        stack_item_exists = item_number < len( call_stack )
         '''
         Respond with data to the various "roles"
         '''
@@ -690,7 +813,7 @@ class CallStackModel( QAbstractListModel ) :
             For the display role, return either an address or 4 spaces.
             '''
             if stack_item_exists :
-                return '{0:04X}'.format( chip8.CALL_STACK[ item_number ] )
+                return '{0:04X}'.format( call_stack[ item_number ] )
             else :
                 return '    '
         elif role == Qt.FontRole :
@@ -780,7 +903,7 @@ class MasterWindow( QWidget ) :
     EmulatorStopped = pyqtSignal(int)
 
     def __init__( self, settings ) :
-        global RUN_STOP_BUTTON, STEP_BUTTON, INST_PER_TICK, SETTINGS, STATUS_LINE
+        global RUN_STOP_BUTTON, STEP_BUTTON, INST_PER_TICK, AUTO_BUTTON, LIVE_BUTTON, SETTINGS, STATUS_LINE
         super().__init__( None )
         '''
         Create a vertical box layout and make it this widget's layout.
@@ -799,9 +922,8 @@ class MasterWindow( QWidget ) :
         self.register_display = RegisterDisplay()
         vbox.addWidget( self.register_display, 5, Qt.AlignHCenter )
         '''
-           resize the columns to minimize the tables
+           resize the register columns to minimize the table
         '''
-        self.memory_display.resizeColumnsToContents()
         self.register_display.resizeColumnsToContents()
         '''
         * The call stack, in an hbox with a label.
@@ -852,6 +974,18 @@ class MasterWindow( QWidget ) :
         set_value = int( SETTINGS.value( "memory_page/spinner", 10 ) )
         INST_PER_TICK = InstPerTick( set_value )
         hbox.addWidget( INST_PER_TICK )
+        '''
+        * The AUTO button, initialized to its saved previous state.
+        '''
+        set_value = SETTINGS.value( "memory_page/auto", False, type=bool )
+        AUTO_BUTTON = AutoButton( set_value )
+        hbox.addWidget( AUTO_BUTTON )
+        '''
+        * The LIVE button, likewise.
+        '''
+        set_value = SETTINGS.value( "memory_page/live", False, type=bool )
+        LIVE_BUTTON = LiveButton( set_value )
+        hbox.addWidget( LIVE_BUTTON )
         hbox.addStretch( 10 )
         '''
         Connect the clicked signal of the STEP switch to our step_click() method.
@@ -925,33 +1059,93 @@ class MasterWindow( QWidget ) :
             '''
             The button has gone from unchecked to checked.
             * Make it read STOP
-            * Disable the various display tables
-            * Wake up the run() thread.
+            * Disable the Step button and the various display tables
+            * Tell the run thread to start.
             '''
             RUN_STOP_BUTTON.setText( RUN_STOP_BUTTON.on_text )
+            STEP_BUTTON.setEnabled( False )
             self.begin_resets()
             STATUS_LINE.clear()
-            OUR_THREAD.wake_up()
+            if AUTO_BUTTON.isChecked() :
+                '''
+                Start from the rate remembered for this program, if any.
+                '''
+                INST_PER_TICK.setValue( int(
+                    SETTINGS.value( auto_rate_key(), INST_PER_TICK.value() ) ) )
+            OUR_THREAD.start_emulator()
 
         else :
             '''
             The button has gone from checked to unchecked, i.e. STOP clicked.
-            The run thread will soon notice the button state and enter its
-            wait state, at which time it releases the shared mutex. Wait for
-            that to happen.
+            Tell the run thread to stop. It will soon notice, and send its
+            stopped signal, which calls emulator_stopped() below. Until then,
+            disable the button so the user cannot start it again.
             '''
-            THREAD_MUTEX.lock()
-            '''
-            With the thread in the stopped state,
-            * Make the button read RUN again
-            * Put the emulator status in the status line
-            * Re-enable and update the various tables.
-            * Release the mutex
-            '''
-            RUN_STOP_BUTTON.setText( RUN_STOP_BUTTON.off_text )
-            STATUS_LINE.setText( OUR_THREAD.message_text )
-            self.end_resets()
-            THREAD_MUTEX.unlock()
+            RUN_STOP_BUTTON.setEnabled( False )
+            OUR_THREAD.stop_emulator()
+
+    '''
+    Receive the stopped( message ) signal from the run thread, which is
+    now waiting for its next command.
+    * Make sure the button is unchecked (the emulator may have stopped on
+      its own) and enabled, and make it read RUN again
+    * Turn off the tone
+    * Put the emulator status in the status line
+    * Re-enable and update the various tables.
+    '''
+    def emulator_stopped( self, message_text:str ) -> None :
+        global LIVE_STATE
+        LIVE_STATE = None
+        if AUTO_BUTTON.isChecked() :
+            SETTINGS.setValue( auto_rate_key(), INST_PER_TICK.value() )
+        RUN_STOP_BUTTON.setChecked( False )
+        RUN_STOP_BUTTON.setEnabled( True )
+        RUN_STOP_BUTTON.setText( RUN_STOP_BUTTON.off_text )
+        STEP_BUTTON.setEnabled( True )
+        display.sound( on=False )
+        STATUS_LINE.setText( message_text )
+        self.end_resets()
+
+    '''
+    Receive the telemetry( t ) signal from the run thread while it runs, and
+    show the measurements in the status line. In auto mode, make the spinbox
+    show the rate the run loop has chosen, without sending it back as a
+    command.
+    '''
+    def show_telemetry( self, telemetry:chip8proc.Telemetry ) -> None :
+        ( ips, shortfall, idle, tick_limit ) = telemetry
+        if not RUN_STOP_BUTTON.isChecked() :
+            return # a late report, after STOP was clicked
+        if TURBO :
+            STATUS_LINE.setText( 'Turbo: {0:,} inst/sec'.format( ips ) )
+        else :
+            STATUS_LINE.setText(
+                '{0:,} inst/sec, short {1:.1f}/tick, idle {2:.0%}'.format(
+                    ips, shortfall, idle ) )
+        if AUTO_BUTTON.isChecked() :
+            INST_PER_TICK.blockSignals( True )
+            INST_PER_TICK.setValue( tick_limit )
+            INST_PER_TICK.blockSignals( False )
+
+    '''
+    Receive the live_ready( m ) signal from the run thread, ten times a
+    second while it runs in live mode. Make the tables show the machine state
+    m: all of the registers and the call stack, which are few, and those
+    cells of memory that have changed since the last one.
+    A late one, after STOP was clicked, is not shown; but the run loop took
+    its changed ranges out of the dirty list, so the stopped state will not
+    repaint them. Repaint them anyway, to show chip8.MEMORY.
+    '''
+    def show_live( self, state:chip8proc.MachineState ) -> None :
+        global LIVE_STATE
+        if RUN_STOP_BUTTON.isChecked() :
+            LIVE_STATE = state
+            regs = self.register_display.model()
+            regs.dataChanged.emit(
+                regs.index( 0, 0 ), regs.index( 0, len( regs.headers ) - 1 ) )
+            stack = self.call_stack_display.model()
+            stack.dataChanged.emit( stack.index( 0 ), stack.index( 11 ) )
+        self.memory_display.model().cells_changed( state[3] )
 
     '''
     When the vm is going to reset, #1, STOP THE EMULATOR.
@@ -962,13 +1156,16 @@ class MasterWindow( QWidget ) :
             The button is in the checked state, meaning the emulator is
             running. Simulate a user click to force it to unchecked state,
             which will emit the signal that will call run_stop_click() above.
-            It in turn will call end_resets() to update displays.
             '''
             RUN_STOP_BUTTON.click()
-            '''
-            Now kill a little time to make sure that all happens.
-            '''
-            QTest.qWait(5)
+        '''
+        Whether we just stopped it, or it was already stopping, wait until
+        the run thread is idle so the reset does not happen under its feet.
+        If it does not stop in time, it must not go on running, nor deliver
+        its state late, over the program that is about to be loaded.
+        '''
+        if not OUR_THREAD.wait_idle() :
+            OUR_THREAD.abandon()
 
     '''
     The emulated machine gets a full reset when a new program is loaded, as
@@ -976,11 +1173,12 @@ class MasterWindow( QWidget ) :
     make all the tables update. Also, clear the status line.
     '''
     def reset_display( self ) :
-        global MEMORY_UPDATE_NEEDED
-        MEMORY_UPDATE_NEEDED = True # we do want the memory table updated
+        global PROGRAM_HASH
+        PROGRAM_HASH = hashlib.sha1( bytes( chip8.MEMORY[ 0x200 : ] ) ).hexdigest()
         self.begin_resets()
         self.end_resets()
         STATUS_LINE.clear()
+        display.present()
 
     '''
     Tell our attached display widgets that their underlying data will
@@ -995,10 +1193,9 @@ class MasterWindow( QWidget ) :
     Update all the display widgets to reflect the new(?) machine state.
 
     Make the memory display show the PC row.
-    Make the tables resize columns to contents.
+    Make the register table resize columns to contents.
     '''
     def end_resets( self ) :
-        global MEMORY_UPDATE_NEEDED
         '''
         The call stack and register displays have already begun-reset,
         so finish them.
@@ -1008,14 +1205,10 @@ class MasterWindow( QWidget ) :
         self.register_display.resizeColumnsToContents()
         '''
         We didn't initiate the reset on memory because it is so expensive
-        it makes STEP slow to respond. And usually isn't needed. Was it
-        needed?
+        it makes STEP slow to respond. Instead, tell the memory table which
+        cells the emulator has changed since the last time, if any.
         '''
-        if MEMORY_UPDATE_NEEDED :
-            self.memory_display.model().beginResetModel()
-            self.memory_display.model().endResetModel()
-            self.memory_display.resizeColumnsToContents()
-            MEMORY_UPDATE_NEEDED = False
+        self.memory_display.model().cells_changed( chip8.take_dirty() )
 
         self.memory_display.scroll_to_PC( chip8.REGS[ chip8.R.P ] )
         self.EmulatorStopped.emit( chip8.REGS[ chip8.R.P ] )
@@ -1035,6 +1228,9 @@ class MasterWindow( QWidget ) :
             SETTINGS.setValue( "memory_page/size", self.size() )
             SETTINGS.setValue( "memory_page/position", self.pos() )
             SETTINGS.setValue( "memory_page/spinner", INST_PER_TICK.value() )
+            SETTINGS.setValue( "memory_page/auto", AUTO_BUTTON.isChecked() )
+            SETTINGS.setValue( "memory_page/live", LIVE_BUTTON.isChecked() )
+            OUR_THREAD.shutdown()
             super().closeEvent( event ) # pass it along
         else :
             event.ignore()
@@ -1057,179 +1253,283 @@ chip8.step() function as fast as possible. This loop could continue for
 an indefinite time, seconds to minutes, even to hours. For this reason the
 operation needs to be in a separate thread.
 
-The QThread is passed a mutex that it shares with the MasterWindow. It saves
-that. Further initialization has to wait until the thread is started. Then it
-initializes a 1/60th second timer and a QWaitCondition.
+The thread touches only plain Python state: the chip8 module, and the chip8io
+module that holds the emulated screen, tone and keypad. It never calls a Qt
+widget, so it cannot step on a QPainter in use by the GUI thread, and it does
+not have to compete with the GUI thread for the Qt event loop.
+
+The GUI thread talks to the run thread by putting commands, which are tuples,
+into a queue.SimpleQueue:
 
-In operation the thread executes in its run() method, which waits on the
-WaitCondition, then runs the emulator until the emulator returns an error or
-the Run/Stop switch changes state, whichever comes first.
+    ( 'run', )               start running the emulator
+    ( 'stop', )              stop running it
+    ( 'key', code, latched ) the keypad state has changed
+    ( 'rate', count )        the Inst/tick value has changed
+    ( 'auto', flag )         the AUTO button has changed
+    ( 'turbo', flag )        the fast-forward button has changed
+    ( 'live', flag )         the LIVE button has changed
+
+The loop that runs the emulator is chip8proc.run_loop(), which calls back to
+the take_commands() and publish() methods of the thread once per tick.
+
+The run thread talks back through two Qt signals. Because the thread object
+belongs to the GUI thread, the signals are queued, and the connected slots
+execute in the GUI thread:
+
+    io_ready( snapshot )     a snapshot of the emulated I/O for the display
+    telemetry( t )           measures of performance, see chip8proc.py
+    stopped( message )       the emulator has stopped, and why
 
 '''
 
 class RunThread( QThread ) :
+    io_ready = pyqtSignal( object )
+    telemetry = pyqtSignal( object )
+    live_ready = pyqtSignal( object )
+    stopped = pyqtSignal( str )
 
-    def __init__( self, mutex, parent=None ) :
-        '''
-        Minimal object initialization, because this __init__() is executed by
-        the calling thread, i.e. the main one running MainWindow. The timer
-        used in the run-thread needs to be created in that thread, which
-        means, created from within the run() method. Hence the real
-        __init__() is post_init() below.
-        '''
+    def __init__( self, tick_limit:int, auto:bool, live:bool, parent=None ) :
         super().__init__( parent )
-        self.mutex = mutex # mutexes are thread-safe.
-        self.message_text = None # type: str
-
-    def post_init( self ) :
         '''
-        The run() method has been called, so complete initialing now that
-        we are executing within that thread.
-
-        Create a one-shot timer with an interval of 1/60th second, or just a
-        skosh less, which should not be a problem. For one thing, we probably
-        blow one millisecond just getting it restarted.
-
-        The timer is (re)started with when the run() method wakes up from a
-        wait. As long as the timer isActive() the interval has not expired.
+        Create the command queue. SimpleQueue is thread-safe, and its get()
+        blocks until something arrives, which is how the thread idles while
+        the emulator is stopped.
         '''
-        self.timer = QTimer()
-        self.timer.setInterval( 17 ) # juuuust over 1/60th
-        self.timer.setSingleShot( True )
+        self.commands = queue.SimpleQueue()
         '''
-        Create a QWaitCondition, upon which the run() method can wait
-        for a signal. The signal will come when the MasterWindow
-        calls our wake_up method, indicating that RUN has been clicked.
+        The count of instructions to execute per tick, whether to tune it
+        automatically, whether to run in turbo mode (see chip8proc.py),
+        whether to publish the machine state, and whether we are running.
+        These are only changed by commands, on our own thread.
         '''
-        self.wait_for_click = QWaitCondition()
-
-    def wake_up( self ) :
+        self.tick_limit = tick_limit
+        self.auto = auto
+        self.turbo = False
+        self.live = live
+        self.running = False
         '''
-        When the MasterWindow is told that the RUN/STOP switch has been
-        toggled to the active state, it calls this (hence this method
-        actually runs in the master thread). The only reason for this method
-        is that I don't want to expose the waitCondition to the MasterWindow
-        code.
+        The idle event is set while the thread is waiting for a command with
+        the emulator stopped. The MasterWindow waits on it when it needs to be
+        sure the emulator is not running, for example before a reset.
+        The thread only sets it when no command is waiting, and checks that
+        under idle_lock, which the GUI thread holds while it clears it and
+        posts a run command. Otherwise the thread, just done with some other
+        command, could set it again between the two, and run with it set.
         '''
-        self.wait_for_click.wakeOne()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.idle_lock = threading.Lock()
+
+    '''
+    The following methods are called from the GUI thread.
+    '''
+    def post( self, *command ) -> None :
+        self.commands.put( command )
+
+    def start_emulator( self ) -> None :
+        with self.idle_lock :
+            self.idle.clear()
+            self.post( 'run' )
+
+    def stop_emulator( self ) -> None :
+        self.post( 'stop' )
+
+    def wait_idle( self, timeout:float = 1.0 ) -> bool :
+        return self.idle.wait( timeout )
+
+    '''
+    Called when wait_idle() returned False, but the emulator must not be left
+    running. A thread cannot be ended from outside, and this one works on the
+    same machine state as the GUI, so there is nothing to do but wait for it.
+    The run loop takes in commands every tick, so it has been told to stop
+    and should soon be idle, then send its stopped signal as usual. But do
+    not hang the GUI if it does not; log that, and go on.
+    '''
+    def abandon( self, timeout:float = 5.0 ) -> None :
+        self.stop_emulator()
+        if not self.idle.wait( timeout ) :
+            logging.error( 'Emulator thread did not stop in {} seconds'.format( timeout ) )
+
+    '''
+    The following methods execute on the run thread.
+    '''
+    def do_command( self, command ) -> None :
+        if command[0] == 'run' :
+            self.running = True
+        else :
+            chip8proc.apply_command( self, command )
 
     def run( self ) :
-        '''
-        Finish initializing, but from our own thread.
-        '''
-        self.post_init()
-        '''
-        Acquire ownership of the mutex.
-        '''
-        self.mutex.lock()
         '''
         Execute the following endless loop.
         '''
         while True :
             '''
-            Wait to be awakened. When a QWaitCondition.wait() method is
-            entered it releases the given mutex. The MasterWindow can acquire
-            the mutex as a way of knowing that this thread has entered the
-            wait -- see run_stop_click() above.
+            Wait for a command. While we are stopped, this is where we sit,
+            and commands such as key changes are applied as they come.
             '''
-            self.wait_for_click.wait( self.mutex )
+            with self.idle_lock :
+                if self.commands.empty() :
+                    self.idle.set()
+            self.do_command( self.commands.get() )
+            if not self.running :
+                continue
             '''
-            Our wake_up() has been called. Yawn. Stretch. OK, set up to enter
-            the loop. Tell the Screen module that a new thread will be
-            calling it. If the emulated sound is supposed to be going,
-            restart it. Initialize a counter. Start the 1/60th timer going.
+            A run command. If the emulated sound is supposed to be going,
+            restart it. Run until stopped or the emulator cannot continue.
             '''
-            display.change_of_thread( True )
+            self.idle.clear()
             if chip8.REGS[ chip8.R.S ] :
-                display.sound( on=True )
-            tick_limit = INST_PER_TICK.value()
-            inst_count = 0
-            burn_count = 0 # DBG
-            self.timer.start()
-            '''
-            Enter a loop that only ends when STOP is clicked or the emulator
-            returns some kind of error.
-            '''
-            while RUN_STOP_BUTTON.isChecked() :
-                '''
-                If the timer has popped,
-                '''
-                if not self.timer.isActive() :
-                    '''
-                    * notify the emulator of one tick passing
-                    * clear the inst_count
-                    * refresh the tick_limit (so the user can change it while
-                      the emulator is running, for experimentation)
-                    * start a new timer
-
-                    Also keeps two debugging values that could be logged or displayed:
-
-                    shortfall is the number of instructions requested by the
-                    inst-per-tick that are not executed -- when >0, you have
-                    asked for more insts than the emulator can do in 17ms.
-
-                    burn_count is the number of idle cycles we took to kill
-                    time waiting for the end of 17ms -- when >0, we could
-                    have done more emulated instructions than requested.
-                    '''
-                    chip8.tick()
-                    shortfall = inst_count - INST_PER_TICK.value()
-                    inst_count = 0
-                    tick_limit = INST_PER_TICK.value()
-                    burn_count = 0
-                    self.timer.start()
-                '''
-                If we have not reached the inst/tick limit, execute an instruction:
-                '''
-                if inst_count <= tick_limit :
-                    '''
-                    * call the emulator, save its result
-                    * count the instruction
-                    * break the inner loop if any error
-                    '''
-                    self.message_text = chip8.step()
-                    inst_count += 1
-                    if self.message_text is not None :
-                        break
-                else :
-                    '''
-                    Else we have done as many emulated instructions in this tick
-                    as required, so just pass the time in a constructive way.
-                    '''
-                    QCoreApplication.processEvents( )
-                    burn_count += 1 #DBG
-            # end while
-            '''
-            Either the RUN/STOP switch was clicked, or the emulator returned
-            an error. If the emulated tone is sounding, stop it.
-            '''
-            display.sound( on=False )
-            if self.message_text is None :
-                '''
-                We stopped because the Run/Stop button changed state. Supply
-                a message for the status line.
-                '''
-                self.message_text = 'Stopped'
-            else :
-                '''
-                We stopped because the emulator cannot continue.
-                Toggle the Run/Stop switch directly, if it needs it.
-                '''
-                if RUN_STOP_BUTTON.isChecked():
-                    RUN_STOP_BUTTON.click()
+                chip8io.sound( True )
+            message_text = chip8proc.run_loop( self )
+            self.running = False
             '''
-            Tell display that another thread (possibly) will be calling it.
+            Publish the final state of the I/O and the reason we stopped.
             '''
-            display.change_of_thread( False )
+            self.io_ready.emit( chip8io.snapshot() )
+            self.stopped.emit( message_text )
+        # end while True
+
+    '''
+    Take in any commands that have arrived, but no more than one key change,
+    so that a quick tap of a key is down for at least one tick where the
+    emulated program can see it. Called by chip8proc.run_loop() once a tick.
+    '''
+    def take_commands( self ) -> None :
+        while not self.commands.empty() :
+            command = self.commands.get()
+            self.do_command( command )
+            if command[0] == 'key' :
+                break
+
+    '''
+    Publish a snapshot of the emulated I/O to the display. Called by
+    chip8proc.run_loop() once a tick.
+    '''
+    def publish( self ) -> None :
+        self.io_ready.emit( chip8io.snapshot() )
+
+    def report( self, telemetry:chip8proc.Telemetry ) -> None :
+        self.telemetry.emit( telemetry )
+
+    def publish_live( self, state:chip8proc.MachineState ) -> None :
+        self.live_ready.emit( state )
+
+    '''
+    Wait for a command, but not beyond the end of the present tick. Called
+    by chip8proc.run_loop() when the instructions for a tick are done.
+    '''
+    def wait_command( self, timeout:float ) :
+        try :
+            command = self.commands.get( timeout=timeout )
+        except queue.Empty :
+            return None
+        self.do_command( command )
+        return command
+
+    '''
+    Nothing to do at shutdown; the thread ends with the app.
+    '''
+    def shutdown( self ) -> None :
+        pass
+
+'''
+
+The emulator can instead run in a child process, when the environment
+variable CHIP8_EMULATOR_PROCESS is set to a nonempty value. Then OUR_THREAD
+is a ProcessRunner, which offers the same methods and signals as RunThread,
+but passes the commands to a chip8proc.EmulatorProcess.
+
+While the emulator runs, a QTimer polls the process at frame rate for a new
+snapshot of the emulated I/O, the machine state in live mode, and for the
+stopped message.
+
+Key changes are applied to this process's chip8io as well as sent to the
+child, because while the emulator is stopped, it is the state in this process
+that counts, for example when the user clicks STEP.
+
+'''
+
+class ProcessRunner( QObject ) :
+    io_ready = pyqtSignal( object )
+    telemetry = pyqtSignal( object )
+    live_ready = pyqtSignal( object )
+    stopped = pyqtSignal( str )
+
+    def __init__( self, tick_limit:int, auto:bool, live:bool, parent=None ) :
+        super().__init__( parent )
+        self.tick_limit = tick_limit
+        '''
+        The last setting command of each kind, to give to a new child.
+        '''
+        self.settings = { 'auto' : ( 'auto', auto ), 'live' : ( 'live', live ) }
+        self.process = chip8proc.EmulatorProcess()
+        for command in self.settings.values() :
+            self.process.post( *command )
+        self.timer = QTimer( self )
+        self.timer.setInterval( 16 )
+        self.timer.timeout.connect( self.poll )
+
+    def post( self, *command ) -> None :
+        if command[0] == 'key' :
+            chip8io.set_key( command[1], command[2] )
+        elif command[0] == 'rate' :
+            self.tick_limit = command[1]
+        elif command[0] in ( 'auto', 'live', 'turbo' ) :
+            self.settings[ command[0] ] = command
+        self.process.post( *command )
+
+    def start_emulator( self ) -> None :
+        self.process.start( self.tick_limit )
+        self.timer.start()
+
+    def stop_emulator( self ) -> None :
+        self.process.stop()
+
+    def wait_idle( self, timeout:float = 1.0 ) -> bool :
+        if self.process.running :
+            self.poll( timeout )
+        return not self.process.running
+
+    '''
+    Called when wait_idle() returned False, but the emulator must not be left
+    running. End the child without taking its state, start a new one with
+    the same settings, and report the stop, which the child will not.
+    '''
+    def abandon( self ) -> None :
+        self.timer.stop()
+        self.process.terminate()
+        self.process = chip8proc.EmulatorProcess()
+        for command in self.settings.values() :
+            self.process.post( *command )
+        self.stopped.emit( 'Stopped' )
+
+    def poll( self, timeout:float = 0.0 ) -> None :
+        ( state, telemetry, live, message_text ) = self.process.poll( timeout )
+        if state is not None :
+            self.io_ready.emit( state )
+        if telemetry is not None :
+            self.tick_limit = telemetry[3] # as auto-tuned, maybe
+            self.telemetry.emit( telemetry )
+        if live is not None :
+            self.live_ready.emit( live )
+        if message_text is not None :
             '''
-            Start over from the wait.
+            The child stopped, and its state is now ours, including the
+            ranges of memory it changed.
             '''
-        # end while True
+            self.timer.stop()
+            self.stopped.emit( message_text )
+
+    def shutdown( self ) -> None :
+        self.timer.stop()
+        self.process.close()
 
 '''
 
 The step() function is called when the MasterWindow gets a clicked signal
-from the Step pushbutton. Operate the emulator for one instruction.
+from the Step pushbutton. Operate the emulator for one instruction. This is
+done on the GUI thread; the run thread is idle.
 
 '''
 
@@ -1238,15 +1538,18 @@ def step():
 
     STATUS_LINE.clear()
     '''
-    If the sound should be on, turn it on.
+    If the sound should be on, turn it on. (QtTest is imported here, not at
+    startup, as this is its only use.)
     '''
     if chip8.REGS[ chip8.R.S ] :
         display.sound( on=True )
+        from PyQt5.QtTest import QTest
         QTest.qWait(5)
     '''
-    Execute one instruction
+    Execute one instruction and show its effect on the display.
     '''
     result = chip8.step()
+    display.present()
     '''
     Turn the sound off in case it was on or was turned on.
     '''
@@ -1259,7 +1562,6 @@ def step():
 
 
 '''
-
 Initialize, called from the chip8ide module. Create the window and all widgets
 and initialize them from saved settings.
 
@@ -1271,18 +1573,32 @@ SETTINGS = None # type: QSettings
 
 OUR_WINDOW = None # type: MasterWindow
 
-OUR_THREAD = None # type: QThread
+OUR_THREAD = None # type: RunThread
 
-THREAD_MUTEX = None # type: QMutex
+'''
+PROGRAM_HASH identifies the program now in memory, as a hash of memory from
+0x200 up, taken when the machine was reset and loaded. It is the key under
+which the AUTO rate for that program is remembered.
+'''
+PROGRAM_HASH = ''
 
-MEMORY_UPDATE_NEEDED = False
+def auto_rate_key( ) -> str :
+    return 'memory_page/auto_rate/' + PROGRAM_HASH
 
-def memory_updated( ) :
-    global MEMORY_UPDATE_NEEDED
-    MEMORY_UPDATE_NEEDED = True
+'''
+TURBO is True while the fast-forward button of the Display window is down.
+Then the run loop goes as fast as it can, in virtual time; see chip8proc.py.
+'''
+
+TURBO = False
+
+def set_turbo( on:bool ) -> None :
+    global TURBO
+    TURBO = on
+    OUR_THREAD.post( 'turbo', on )
 
 def initialize( settings: QSettings ) -> None :
-    global OUR_WINDOW, SETTINGS, OUR_THREAD, THREAD_MUTEX
+    global OUR_WINDOW, SETTINGS, OUR_THREAD
     '''
     Save the settings for shutdown time
     '''
@@ -1296,13 +1612,32 @@ def initialize( settings: QSettings ) -> None :
     '''
     OUR_WINDOW = MasterWindow( settings )
     '''
-    Create the run() thread and start it going.
-    '''
-    THREAD_MUTEX = QMutex()
-    OUR_THREAD = RunThread( THREAD_MUTEX )
-    OUR_THREAD.start()
-
-    chip8.memory_notify( memory_updated )
+    Create the run() thread, or the runner for the emulator process, and
+    start it going. Connect its signals to the display, which
+    presents the emulated I/O, and to the window, which shows telemetry and
+    live machine state, and handles the stop. Send it keypad changes and
+    changes of the Inst/tick value and the AUTO and LIVE buttons.
+    '''
+    runner_class = RunThread
+    if os.environ.get( 'CHIP8_EMULATOR_PROCESS' ) :
+        runner_class = ProcessRunner
+    OUR_THREAD = runner_class(
+        INST_PER_TICK.value(), AUTO_BUTTON.isChecked(), LIVE_BUTTON.isChecked() )
+    if runner_class is RunThread :
+        OUR_THREAD.start()
+    OUR_THREAD.io_ready.connect( display.present_state, Qt.QueuedConnection )
+    OUR_THREAD.telemetry.connect( OUR_WINDOW.show_telemetry, Qt.QueuedConnection )
+    OUR_THREAD.live_ready.connect( OUR_WINDOW.show_live, Qt.QueuedConnection )
+    OUR_THREAD.stopped.connect( OUR_WINDOW.emulator_stopped, Qt.QueuedConnection )
+    display.key_notify(
+        lambda code, latched : OUR_THREAD.post( 'key', code, latched ) )
+    INST_PER_TICK.valueChanged.connect(
+        lambda count : OUR_THREAD.post( 'rate', count ) )
+    AUTO_BUTTON.toggled.connect(
+        lambda checked : OUR_THREAD.post( 'auto', checked ) )
+    LIVE_BUTTON.toggled.connect(
+        lambda checked : OUR_THREAD.post( 'live', checked ) )
+    display.fast_forward_notify( set_turbo )
 
     '''
     Display our window
@@ -1336,5 +1671,26 @@ if __name__ == '__main__' :
     quit_signal_slot() # otherwise the unit test cannot be ended!
     STATUS_LINE.setText('now in unit test')
     OUR_WINDOW.show()
+    import sys
+    if 'bench' in sys.argv :
+        '''
+        Benchmark: scroll the memory table from top to bottom one row at a
+        time, repainting it at each position, and report the time per
+        repaint. Smooth scrolling wants this well under a 60Hz frame, 16ms.
+        '''
+        import time
+        the_app.processEvents()
+        view = OUR_WINDOW.memory_display
+        bar = view.verticalScrollBar()
+        positions = range( bar.minimum(), bar.maximum() + 1 )
+        start = time.perf_counter()
+        for position in positions :
+            bar.setValue( position )
+            view.viewport().repaint()
+        elapsed = time.perf_counter() - start
+        print( 'memory scroll: {0} repaints, {1:.2f} ms each'.format(
+            len( positions ), 1000 * elapsed / max( 1, len( positions ) ) ) )
+        OUR_THREAD.shutdown()
+        sys.exit( 0 )
     the_app.exec_()
 
@@ -0,0 +1,242 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+'''
+
+    CHIP-8 IDE Peephole Optimizer
+
+This module has no Qt content. After a successful assembly, it looks for
+short sequences of instructions that can be replaced by cheaper ones that
+do exactly the same thing, and makes a new memory image with them. The
+Source window uses it when File>Optimize Code is checked, and chip8asm.py
+when given --optimize. Programs run against a budget of instructions per
+frame, so an instruction saved in a loop is saved every time around it.
+
+There are three rewrites.
+
+* A CALL followed by RET becomes a JP to the same place. The subroutine's
+  own RET returns to where the RET would have. The RET is kept, since it may
+  be reached some other way, for instance by a skip over the CALL. Saves
+  the RET each time, and a level of the call stack.
+
+* A JP or CALL to a JP goes directly to where that JP goes, and so on down a
+  chain of JPs. Saves one JP each time for each link of the chain.
+
+* An LD I that loads the value I already has is dropped. That is the case
+  when the same LD I came before it, and every instruction between them is
+  executed in a straight line, and none of them changes I. (Those that do
+  are LD I, ADD I, LDC, LDH, and STM and LDM, which advance I.) A label on
+  the dropped LD I, or on an instruction between, means it can be reached
+  another way, and a skip just before it or just before the first LD I
+  means one of them may not run, so those stop it. Saves two bytes, and the
+  LD I each time.
+
+Dropping an LD I moves everything after it. Addresses written as names are
+simply assembled again at their new values, but a program that depends on
+where its code is, because it uses ORG, JP V0, or an address written as a
+number, could break, so then only the first two rewrites are made. Nor
+can any rewrite be right for a program that changes its own instructions
+as it runs, so do not optimize such a program.
+
+The rewrites are not made to the Statements of the document, but to copies
+of them, which are then assembled again as usual, with no way to produce an
+error. Then the new PC and value of each Statement are put in it, so that
+what the Source window shows, and its breakpoints, match the memory image.
+Each Statement whose value is not what the source says is marked changed,
+so that the next assembly evaluates it again. Its form is left as the source
+says, as that is what the next assembly evaluates, so a CALL made JP keeps
+the form CALL; only its value shows the JP (flowgraph.py goes by that).
+
+'''
+
+import copy
+
+from typing import List, Optional, Tuple
+
+import assembler2
+from statement_class import Statement
+
+__all__ = [ 'optimize', 'summary' ]
+
+'''
+The forms of statement that matter here.
+'''
+SKIP_FORMS = ( 'SER', 'SNER', 'SEB', 'SNEB', 'SKP', 'SKNP' )
+I_FORMS = ( 'LDI', 'ADDI', 'LDC', 'LDH', 'STM', 'LDM' )
+FLOW_FORMS = ( 'JPADR', 'CALL', 'JPXADR', 'RET', 'EXIT' )
+DATA_FORMS = ( 'DA', 'DB', 'DW' )
+ADDRESS_FORMS = ( 'JPADR', 'CALL', 'LDI', 'JPXADR' )
+
+'''
+Each rewrite is reported as a tuple (index, message, bytes, instructions):
+the index of the Statement in the list, what was done, the bytes saved, and
+the instructions saved each time that Statement is executed.
+'''
+Rewrite = Tuple[ int, str, int, int ]
+
+def address_of( S : Statement ) -> int :
+    return ( ( S.value[0] & 0x0F ) << 8 ) | S.value[1]
+
+'''
+Optimize the Statements of a successful assembly, whose memory image is
+given. Return the new image and the rewrites, or when there are none, the
+same image and an empty list.
+'''
+
+def optimize( statements : List[Statement], image : List[int],
+              directory : Optional[str] = None ) -> Tuple[ List[int], List[Rewrite] ] :
+    '''
+    Index the statements that generate bytes by their PCs, and note every
+    address that has a name; any of them might be reached by a jump.
+    '''
+    at = dict()
+    for S in statements :
+        if S.value :
+            at[ S.PC ] = S
+    named = set( assembler2.SYMBOLS.values() )
+    fixed_layout = any( S.form in ( 'ORG', 'JPXADR' )
+                        or ( S.form in ADDRESS_FORMS and not S.references )
+                        for S in statements )
+
+    rewrites = [] # type: List[Rewrite]
+    program = [ copy.copy( S ) for S in statements ]
+
+    '''
+    Thread jumps, and turn CALL-RET into JP.
+    '''
+    for ( index, S ) in enumerate( statements ) :
+        if S.form not in ( 'JPADR', 'CALL' ) or not S.value :
+            continue
+        new = program[ index ]
+        chain = []
+        target = at.get( address_of( S ) )
+        while target is not None and target.form == 'JPADR' and target not in chain :
+            chain.append( target )
+            target = at.get( address_of( target ) )
+        if chain and address_of( chain[-1] ) != address_of( S ) :
+            new.expressions = chain[-1].expressions
+            new.references = chain[-1].references
+            mnemonic = 'CALL' if S.form == 'CALL' else 'JP'
+            rewrites.append( ( index, '{} threaded through {} JP'.format( mnemonic, len( chain ) ), 0, len( chain ) ) )
+        following = at.get( S.PC + 2 )
+        if S.form == 'CALL' and following is not None and following.form == 'RET' :
+            new.form = 'JPADR'
+            rewrites.append( ( index, 'CALL followed by RET made JP', 0, 1 ) )
+
+    '''
+    Drop LD I of the value I already has. I_value is the value of the last
+    LD I in the straight line of instructions that ends with previous, or
+    None if it is not known.
+    '''
+    if not fixed_layout :
+        I_value = None
+        previous = None # type: Optional[Statement]
+        for ( index, S ) in enumerate( statements ) :
+            if not S.value :
+                continue
+            if previous is None or previous.PC + len( previous.value ) != S.PC \
+               or S.PC in named :
+                I_value = None
+            after_skip = previous is not None and previous.form in SKIP_FORMS
+            if S.form == 'LDI' and S.value == I_value and not after_skip :
+                program[ index ] = Statement()
+                rewrites.append( ( index, 'LD I dropped, I is already {:03X}'.format( address_of( S ) ), 2, 1 ) )
+            elif S.form == 'LDI' and not after_skip :
+                I_value = S.value
+            elif S.form in I_FORMS + FLOW_FORMS + DATA_FORMS :
+                I_value = None
+            previous = S
+
+    if not rewrites :
+        return ( image, [] )
+
+    '''
+    Assemble the copies, keeping the symbol table and index of the real
+    assembly, which the document's next assembly and the assembly cache
+    depend on. The copies assemble unless something is badly wrong; then
+    leave the original assembly as it is.
+    '''
+    saved_tables = ( assembler2.SYMBOLS, assembler2.DEPENDENTS )
+    try :
+        new_image = assembler2.assemble_statements( program, incremental=False, directory=directory )
+    finally :
+        ( assembler2.SYMBOLS, assembler2.DEPENDENTS ) = saved_tables
+    if new_image and new_image[0] < 0 :
+        return ( image, [] )
+
+    for ( S, new ) in zip( statements, program ) :
+        if S.PC != new.PC or S.value != new.value :
+            S.PC = new.PC
+            S.value = new.value
+            S.value_dump = ''
+            S.changed = True
+    rewrites.sort()
+    return ( new_image, rewrites )
+
+'''
+Return a line summarizing the rewrites, for the Source window's status line.
+'''
+
+def summary( rewrites : List[Rewrite] ) -> str :
+    if not rewrites :
+        return 'Optimizer found nothing to improve'
+    return 'Optimizer made {} rewrites, saving {} bytes and {} instructions as they run'.format(
+        len( rewrites ), sum( R[2] for R in rewrites ), sum( R[3] for R in rewrites ) )
+
+if __name__ == '__main__' :
+
+    from assembler2 import assemble_lines
+    ( image, statements ) = assemble_lines( [
+        'START:  CALL MOVE',          # 200 CALL MOVE, becomes CALL STEP
+        '        LD I, DOT',          # 202
+        '        DRAW V0, V1, 1',     # 204
+        '        ADD V0, 1',          # 206
+        '        LD I, DOT',          # 208 dropped
+        '        DRAW V0, V1, 1',     # 20A
+        '        JP START',           # 20C
+        'MOVE:   JP STEP',            # 20E
+        'STEP:   ADD V1, 1',          # 210
+        '        CALL WAIT',          # 212 becomes JP WAIT
+        '        RET',                # 214
+        'WAIT:   LD V2, DT',          # 216
+        '        SE V2, 0',           # 218
+        '        LD I, DOT',          # 21A kept, after a skip
+        '        RET',                # 21C
+        'DOT:    DB #80'              # 21E
+        ] )
+    ( optimized, rewrites ) = optimize( statements, image )
+    assert [ ( R[0], R[2], R[3] ) for R in rewrites ] == [ ( 0, 0, 1 ), ( 4, 2, 1 ), ( 9, 0, 1 ) ]
+    assert optimized == [ 0x22, 0x0E, 0xA2, 0x1C, 0xD0, 0x11, 0x70, 0x01, 0xD0, 0x11, 0x12, 0x00,
+                          0x12, 0x0E, 0x71, 0x01, 0x12, 0x14, 0x00, 0xEE,
+                          0xF2, 0x07, 0x32, 0x00, 0xA2, 0x1C, 0x00, 0xEE, 0x80 ]
+    assert statements[4].value == [] and statements[4].changed
+    assert statements[9].value == [ 0x12, 0x14 ] and statements[9].PC == 0x210
+    assert not statements[3].changed and statements[1].changed and statements[15].PC == 0x21C
+    assert summary( rewrites ) == 'Optimizer made 3 rewrites, saving 2 bytes and 3 instructions as they run'
+    '''
+    With an address written as a number, LD I is not dropped.
+    '''
+    ( image, statements ) = assemble_lines( [
+        '  LD I, #300', '  DRAW V0, V1, 1', '  LD I, #300', '  DRAW V0, V1, 1' ] )
+    assert optimize( statements, image ) == ( image, [] )
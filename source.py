@@ -97,12 +97,11 @@ Import the Statement class.
 from statement_class import Statement
 
 '''
-Import the statement inspection routine from the assembler1 module and
-the assemble() and disassemble methods from their modules.
+Import the statement inspection routine from the assembler1 module. The
+assemble() and disassemble() functions are imported from their modules
+where they are used, so that startup does not wait for them.
 '''
 from assembler1 import phase_one
-from assembler2 import assemble
-from disassemble import disassemble
 
 '''
 Import chip8, the emulator, for reset_vm and breakpoint ops.
@@ -131,6 +130,7 @@ from PyQt5.QtCore import (
     QPoint,
     QSettings,
     QSize,
+    QStandardPaths,
     Qt
     )
 
@@ -269,10 +269,12 @@ class Highlighter( QSyntaxHighlighter ) :
             S = U.statement
 
         '''
-        Perform tokenization and lexical validation of this line.
-        See assembler1.py, phase_one().
+        Perform tokenization and lexical validation of this line, unless it
+        is the same text as was last scanned, for example on a rehighlight()
+        after assembly. See assembler1.py, phase_one().
         '''
-        phase_one( text, S )
+        if text != S.text :
+            phase_one( text, S )
 
         if S.text_error or S.expr_error :
             self.setFormat( 0, len(text), self.error_format )
@@ -519,6 +521,12 @@ class SourceEditor( QPlainTextEdit ) :
                         dump = [ '{:02X}'.format(n) for n in S.value ]
                         S.value_dump = '{:04X} : '.format( S.PC ) + ''.join( dump )
                     status_msg = S.value_dump
+                    '''
+                    If a subroutine or loop starts here, add what it costs.
+                    '''
+                    note = self.main_window.flow_note( S )
+                    if note :
+                        status_msg += '  ' + note
         self.main_window.status_line.setText( status_msg )
 
     '''
@@ -988,6 +996,15 @@ class SourceWindow( QMainWindow ) :
         '''
         self.clean_assembly = False
 
+        '''
+        Keep the Statements of the last clean assembly, and the analysis of
+        their control flow (see flowgraph.py), which is made only when
+        cursor_moved() first wants it. Set in do_assembly(), used in
+        flow_note().
+        '''
+        self.assembled_statements = [] # type: List[Statement]
+        self.flow_results = None
+
         '''
         Create the text edit widget and put it in the layout. Give it
         a reference to this object so it can access the status_line.
@@ -1084,6 +1101,32 @@ class SourceWindow( QMainWindow ) :
         temp_action.setToolTip( 'Save the assembly program in a file by name' )
         temp_action.triggered.connect(self.file_save_as)
 
+        '''
+        Create the Cache Assemblies toggle. When it is checked, the results
+        of each successful assembly are saved, and an assembly of the same
+        text later, even in another session, just restores them. See
+        do_assembly() below and asmcache.py. Its state is kept in the
+        settings.
+        '''
+        self.file_menu.addSeparator()
+        self.cache_action = self.file_menu.addAction( 'Cache Assemblies' )
+        self.cache_action.setCheckable( True )
+        self.cache_action.setChecked(
+            settings.value( "source_page/assembly_cache", False, type=bool ) )
+        self.cache_action.setToolTip( 'Reuse the results of assembling the same text' )
+
+        '''
+        Create the Optimize Code toggle. When it is checked, each successful
+        assembly is followed by the peephole optimizer, which rewrites some
+        instruction sequences into cheaper ones. See do_assembly() below and
+        peephole.py. Its state is kept in the settings.
+        '''
+        self.optimize_action = self.file_menu.addAction( 'Optimize Code' )
+        self.optimize_action.setCheckable( True )
+        self.optimize_action.setChecked(
+            settings.value( "source_page/optimize", False, type=bool ) )
+        self.optimize_action.setToolTip( 'Rewrite instruction sequences into cheaper equivalents' )
+
         '''
         Create the Quit action, which Qt will put in the appropriate menu for
         the platform: File menu for Windows and Linux, App menu for mac. We
@@ -1142,10 +1185,35 @@ class SourceWindow( QMainWindow ) :
             next_block = next_block.next()
 
         '''
-        Assemble the document text, getting back a list of ints (which might
-        be empty, for an empty doc).
-        '''
-        mem_load = assemble( first_block )
+        If assemblies are cached, look for the results of assembling this
+        very text, and of the files it includes. If they are found (and they
+        fit the document, which they should) put them in the Statements, and
+        that is the assembly. Included files are relative to the document's
+        folder; their object modules are saved in the cache as well.
+        '''
+        import assembler2
+        import linker
+        statements = assembler2.block_statements( first_block )
+        directory = self.windowFilePath() or os.getcwd()
+        linker.CACHE_DIRECTORY = CACHE_DIRECTORY if self.cache_action.isChecked() else None
+        cache_key = None
+        entry = None
+        if self.cache_action.isChecked() :
+            import asmcache
+            cache_key = asmcache.source_key( self.document.toPlainText()
+                                             + linker.include_signature( statements, directory ) )
+            entry = asmcache.lookup( CACHE_DIRECTORY, cache_key )
+            if entry is not None and entry[ 'lines' ] != len( statements ) :
+                entry = None
+        if entry is not None :
+            assembler2.restore_assembly( statements, entry[ 'symbols' ], entry[ 'values' ] )
+            mem_load = entry[ 'image' ]
+        else :
+            '''
+            Assemble the document text, getting back a list of ints (which
+            might be empty, for an empty doc).
+            '''
+            mem_load = assembler2.assemble_statements( statements, directory=directory )
         if (mem_load) and mem_load[0] < 0 :
             '''
             The assembler found errors. The count of syntax errors (which
@@ -1178,12 +1246,45 @@ class SourceWindow( QMainWindow ) :
         else:
             '''
             Clean assembly. re-highlight the document to make sure any error
-            colors are cleared. Note a clean assembly. Return the executable code.
+            colors are cleared. Note a clean assembly. Save the results in the
+            cache, if it is in use and they did not come from it.
+
+            Then if File>Optimize Code is checked, let the optimizer improve
+            the code, and report what it did in the status line. The cache
+            keeps the plain assembly; the optimizer does not change the
+            symbol table, and marks the Statements it changes for the next
+            assembly to evaluate again (see peephole.py).
+
+            Return the executable code.
             '''
+            if cache_key is not None and entry is None :
+                asmcache.store( CACHE_DIRECTORY, cache_key, mem_load,
+                                statements, assembler2.SYMBOLS )
+            if self.optimize_action.isChecked() :
+                import peephole
+                ( mem_load, rewrites ) = peephole.optimize( statements, mem_load, directory )
+                self.status_line.setText( peephole.summary( rewrites ) )
         self.highlighter.rehighlight()
         self.clean_assembly = True
+        self.assembled_statements = statements
+        self.flow_results = None
         return mem_load
 
+    '''
+    Return a note on the cost of the subroutine or loop that starts at a
+    Statement of the last clean assembly, or an empty string. The analysis
+    of the whole program is made the first time it is needed. The emulator's
+    current Inst/tick setting is used to say how many ticks it may take.
+    '''
+    def flow_note( self, S : Statement ) -> str :
+        import flowgraph
+        if self.flow_results is None :
+            self.flow_results = flowgraph.analyze( self.assembled_statements )
+        if S.PC not in self.flow_results :
+            return ''
+        inst_per_tick = memory.INST_PER_TICK.value() if memory.INST_PER_TICK is not None else 0
+        return flowgraph.describe( self.flow_results[ S.PC ], inst_per_tick )
+
     '''
     This method is called when the CHECK button is clicked. It performs
     the assembly and that is all.
@@ -1343,6 +1444,7 @@ class SourceWindow( QMainWindow ) :
             '''
             It's a binary file. Convert to a source file.
             '''
+            from disassemble import disassemble
             source_string = disassemble( byte_string )
             self.set_up_new_document( name="Untitled", clear=True )
 
@@ -1437,6 +1539,8 @@ class SourceWindow( QMainWindow ) :
             '''
             SETTINGS.setValue( "source_page/size", self.size() )
             SETTINGS.setValue( "source_page/position", self.pos() )
+            SETTINGS.setValue( "source_page/assembly_cache", self.cache_action.isChecked() )
+            SETTINGS.setValue( "source_page/optimize", self.optimize_action.isChecked() )
             display.quit_signal_slot( )
             memory.quit_signal_slot( )
             event.accept()
@@ -1451,11 +1555,23 @@ SETTINGS = None # type: QSettings
 
 OUR_WINDOW = None # type: QMainWindow
 
+'''
+The assembly cache is kept in a folder beside the settings file, or where
+the platform keeps application caches when the settings are not in a file
+(on Windows they are in the registry).
+'''
+CACHE_DIRECTORY = '' # type: str
+
 def initialize( settings ) :
-    global SETTINGS, OUR_WINDOW
+    global SETTINGS, OUR_WINDOW, CACHE_DIRECTORY
 
     SETTINGS = settings
 
+    settings_folder = os.path.dirname( settings.fileName() )
+    if not os.path.isdir( settings_folder ) :
+        settings_folder = QStandardPaths.writableLocation( QStandardPaths.CacheLocation )
+    CACHE_DIRECTORY = os.path.join( settings_folder, 'CHIP8IDE assembly cache' )
+
     OUR_WINDOW = SourceWindow( settings )
 
     OUR_WINDOW.show()
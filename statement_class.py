@@ -44,9 +44,17 @@ class Statement():
     '''
     __slots__ = [ 'text_error', 'expr_error', 'error_pos', 'error_msg',
                   'form', 'defined_name', 'reg_1', 'reg_2',
-                  'next_pc', 'expressions', 'value', 'value_dump', 'PC' ]
+                  'next_pc', 'expressions', 'value', 'value_dump', 'PC',
+                  'text', 'references', 'changed' ]
 
     def __init__( self ) :
+        '''
+        The text of the line as it was last scanned by phase_one. The syntax
+        highlighter is called for a line on many occasions when its text has
+        not changed, for example on a rehighlight(), and it need not scan the
+        same text again.
+        '''
+        self.text = None
         '''
         Does this statement have any errors? text_error is set by the
         phase_one syntax scan. expr_error is set during assembly.
@@ -96,10 +104,17 @@ class Statement():
         '''
         Only two instructions can have more than one expression (DB, DW).
         The rest have at most one. In any case, all expressions are stored
-        here as a list of Python code objects, one per expression.
+        here as a list of compiled expressions (see expression.py), one per
+        expression.
         '''
         self.expressions = []
         '''
+        The set of the names referred to in the expressions. The assembler
+        uses it to find the statements that have to be evaluated again when
+        the value of a name changes.
+        '''
+        self.references = frozenset()
+        '''
         The number of generated bytes can always be known when a statement is
         entered, but the actual bytes cannot be known until phase two
         time (for some types of statement). After the value is known it is
@@ -112,10 +127,18 @@ class Statement():
         is stored here.
         '''
         self.PC = None
+        '''
+        True when self.value is not known to be right: the statement has been
+        scanned since it was last assembled, or its assembly failed. When
+        this is False and none of the references has changed its value, the
+        assembler can reuse self.value without evaluating anything.
+        '''
+        self.changed = True
 
     '''
     Call this method to initialize the Statement prior to a lexical scan.
-    Clear fields used during the lexical scan, including any error.
+    Clear fields used during the lexical scan, including any error, and note
+    that the statement needs to be assembled again.
     '''
     def init_static( self ) :
         self.text_error = False
@@ -128,6 +151,8 @@ class Statement():
         self.reg_2 = None
         self.next_pc = 0
         self.expressions = []
+        self.references = frozenset()
+        self.changed = True
     '''
     Call this method to initialize the Statement prior to the phase-2 scan.
     Clear fields set during assembly, and an expression error if any. Don't
@@ -0,0 +1,384 @@
+__license__ = '''
+ License (GPL-3.0) :
+    This file is part of CHIP8IDE.
+
+    CHIP8IDE is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You can find a copy of the GNU General Public License in the file
+    COPYING.TXT included in the distribution of this program, or see:
+    <http://www.gnu.org/licenses/>.
+'''
+__version__ = "1.0.0"
+__author__  = "David Cortesi"
+__copyright__ = "Copyright 2016 David Cortesi"
+__maintainer__ = "David Cortesi"
+__email__ = "davecortesi@gmail.com"
+
+
+'''
+
+    CHIP-8 Tone Generator
+
+The CHIP-8 has a beeper that sounds while the sound timer ST is nonzero. This
+module makes that sound: a 330Hz square wave, synthesized as it is played.
+
+The square wave is produced by SquareWave, a QIODevice that a QAudioOutput
+reads from (the "pull" mode of QAudioOutput). Each time the audio output
+wants more samples it calls readData(), which returns the wave while the gate
+is open and silence while it is closed. The gate is opened and closed by
+sound(), and the change takes effect at the very next sample produced, so
+there is no waiting for a loop of a recording to come round, and no gap when
+one does.
+
+The wave is never stopped and restarted, only gated, so there is no start-up
+delay and no click from starting the audio device. The audio output buffer is
+kept short, BUFFER_MS, because a change of gate cannot be heard until the
+samples ahead of it in the buffer have been played.
+
+At 22050 samples per second, one cycle of 330Hz is 66.8 samples, not a whole
+number. But 11 cycles are exactly 735 samples. So WAVE_TABLE holds 11 cycles,
+and reading round and round it gives a continuous wave with no glitch where
+the table wraps.
+
+The emulator turns the tone on and off once per instruction or tick, on its
+own thread or process, and the changes reach us some time later, at the
+mercy of thread scheduling. So the beep lengths and the silences between them
+would wobble with the load on the system, if the gate simply followed the
+changes as they arrive. Instead, each change comes stamped with the emulated
+time it was made (see chip8io.py) and schedule() lays it on the audio clock,
+the count of samples produced, at the same spacing as in emulated time. The
+price is a small fixed delay, GATE_LATENCY_MS, to give late arrivals time to
+be on time. The length of each beep played is compared to the length
+requested, and beep_stats() reports the totals.
+
+If the system cannot play our sample format, fall back to the old way: a
+QSoundEffect looping a recorded square wave, kept playing but muted when the
+tone is off. The recording is the Qt resource in audio330hz.py, which is only
+imported in that case.
+
+'''
+
+__all__ = [ 'initialize', 'sound', 'schedule', 'beep_stats', 'shutdown' ]
+
+import collections
+import logging
+
+from typing import List, Tuple
+
+from array import array
+
+from PyQt5.QtCore import QIODevice, QUrl
+
+'''
+QtMultimedia is slow to load and is not needed until the Display window
+starts the tone, so it is imported in initialize() and make_format().
+'''
+
+SAMPLE_RATE = 22050
+FREQUENCY = 330
+AMPLITUDE = 6000
+BUFFER_MS = 40
+GATE_LATENCY_MS = 50
+TICKS_PER_SECOND = 60
+PENDING_LIMIT = 64
+
+'''
+Build the wave table. A sample is high for the first half of each cycle and
+low for the second. Sample n is in cycle n*FREQUENCY // SAMPLE_RATE, and the
+remainder tells how far into that cycle it is.
+'''
+
+WAVE_SAMPLES = 735 # 11 cycles of FREQUENCY at SAMPLE_RATE
+
+def make_wave_table( ) -> bytes :
+    samples = array( 'h' )
+    for n in range( WAVE_SAMPLES ) :
+        in_cycle = ( n * FREQUENCY ) % SAMPLE_RATE
+        samples.append( AMPLITUDE if in_cycle < SAMPLE_RATE // 2 else -AMPLITUDE )
+    return samples.tobytes() # native order, which is little-endian on our platforms
+
+WAVE_TABLE = make_wave_table()
+
+'''
+The QIODevice that synthesizes the tone. It is a sequential device, and it
+always has data, so the audio output never starves.
+
+SquareWave counts the samples it has produced in self.sample, which is the
+audio clock: sample n will be heard n/SAMPLE_RATE seconds after the first.
+A change of gate can be made at once, with set_gate(), or scheduled for a
+given sample, with schedule(). Scheduled changes wait in self.pending, and
+readData() makes each one at exactly its sample.
+'''
+
+class SquareWave( QIODevice ) :
+    def __init__( self, parent=None ) :
+        super().__init__( parent )
+        self.gate = False # True while the tone sounds
+        self.sample = 0 # the number of the next sample to produce
+        self.pending = collections.deque() # of ( sample, on, tick )
+        '''
+        The anchor relates emulated time to the audio clock, as a tick
+        number and the sample at which that tick is heard.
+        '''
+        self.anchor = None # type: Tuple[int,int]
+        '''
+        The sample and tick at which the present beep started, and the
+        instrumentation: the count of beeps measured, and their total
+        requested and played lengths, and the worst difference, in samples.
+        '''
+        self.opened_at = None # type: Tuple[int,int]
+        self.beeps = 0
+        self.requested = 0
+        self.played = 0
+        self.worst = 0
+
+    def isSequential( self ) -> bool :
+        return True
+
+    def bytesAvailable( self ) -> int :
+        return len( WAVE_TABLE ) + super().bytesAvailable()
+
+    '''
+    Open or close the gate now, forgetting any scheduled changes.
+    '''
+    def set_gate( self, on:bool ) -> None :
+        self.pending.clear()
+        self.anchor = None
+        self.switch( on, None )
+
+    '''
+    Schedule a change of gate stamped with the emulated tick it happened on.
+
+    The emulated ticks are mapped onto samples from the anchor, so the time
+    between any two changes -- the length of a beep, or of the silence
+    between beeps -- is played exactly as the emulator timed it, however late
+    each event arrives here, so long as it arrives within GATE_LATENCY_MS.
+
+    When a beep starts, if there is no anchor, or if the time works out to a
+    sample already produced (the event came too late, the emulator fell
+    behind real time) or one too far ahead (the emulator got ahead, say in
+    turbo mode), the anchor is set afresh: this tick is heard GATE_LATENCY_MS
+    from now. The end of a beep is never re-anchored, so that the beep keeps
+    its length, unless it came too late, when it ends at once. And if changes
+    pile up faster than they can be played, forget them and follow the
+    latest one at once.
+    '''
+    def schedule( self, tick:int, on:bool ) -> None :
+        latency = ( SAMPLE_RATE * GATE_LATENCY_MS ) // 1000
+        target = -1
+        if self.anchor is not None :
+            ( anchor_tick, anchor_sample ) = self.anchor
+            target = anchor_sample + \
+                ( ( tick - anchor_tick ) * SAMPLE_RATE ) // TICKS_PER_SECOND
+        if on and not ( self.sample <= target <= self.sample + 2 * latency ) :
+            target = self.sample + latency
+            if self.pending :
+                target = max( target, self.pending[-1][0] )
+            self.anchor = ( tick, target )
+        target = max( target, self.sample )
+        if self.pending :
+            target = max( target, self.pending[-1][0] )
+        if len( self.pending ) >= PENDING_LIMIT :
+            self.set_gate( on )
+            return
+        self.pending.append( ( target, on, tick ) )
+
+    '''
+    Make a change of gate. When a beep ends, and both its ends were stamped
+    with emulated time, compare the length requested with the length
+    played, and count it.
+    '''
+    def switch( self, on:bool, tick:int ) -> None :
+        if on == self.gate :
+            return
+        self.gate = on
+        if on :
+            self.opened_at = ( self.sample, tick )
+            return
+        ( opened_sample, opened_tick ) = self.opened_at
+        self.opened_at = None
+        if tick is None or opened_tick is None :
+            return
+        requested = ( ( tick - opened_tick ) * SAMPLE_RATE ) // TICKS_PER_SECOND
+        played = self.sample - opened_sample
+        self.beeps += 1
+        self.requested += requested
+        self.played += played
+        self.worst = max( self.worst, abs( played - requested ) )
+        logging.debug( 'Beep requested {0} ms, played {1} ms'.format(
+            ( 1000 * requested ) // SAMPLE_RATE, ( 1000 * played ) // SAMPLE_RATE ) )
+
+    '''
+    Return up to maxlen bytes of samples, a whole number of samples, making
+    any scheduled changes of gate at their samples. When the gate is closed,
+    return silence, but keep counting samples, so the wave resumes in phase
+    with where it would have been.
+    '''
+    def readData( self, maxlen:int ) -> bytes :
+        end = self.sample + maxlen // 2
+        chunks = []
+        while True :
+            while self.pending and self.pending[0][0] <= self.sample :
+                ( _, on, tick ) = self.pending.popleft()
+                self.switch( on, tick )
+            stop = end
+            if self.pending :
+                stop = min( end, self.pending[0][0] )
+            chunks.append( self.wave( self.sample, stop ) )
+            self.sample = stop
+            if stop == end :
+                break
+        return b''.join( chunks )
+
+    def wave( self, start:int, stop:int ) -> bytes :
+        length = 2 * ( stop - start )
+        if not self.gate :
+            return bytes( length )
+        offset = 2 * ( start % WAVE_SAMPLES )
+        chunk = WAVE_TABLE[ offset : offset + length ]
+        while len( chunk ) < length :
+            chunk += WAVE_TABLE[ : length - len( chunk ) ]
+        return chunk
+
+    def writeData( self, data:bytes ) -> int :
+        return -1 # read-only
+
+'''
+The module state: the wave and the audio output that plays it, or else the
+fallback sound effect.
+'''
+
+WAVE = None # type: SquareWave
+OUTPUT = None # type: PyQt5.QtMultimedia.QAudioOutput
+SFX = None # type: PyQt5.QtMultimedia.QSoundEffect
+
+'''
+Make the audio format for our samples: mono, 16-bit signed little-endian
+integers at SAMPLE_RATE.
+'''
+
+def make_format( ) -> 'QAudioFormat' :
+    from PyQt5.QtMultimedia import QAudioFormat
+    audio_format = QAudioFormat()
+    audio_format.setSampleRate( SAMPLE_RATE )
+    audio_format.setChannelCount( 1 )
+    audio_format.setSampleSize( 16 )
+    audio_format.setCodec( 'audio/pcm' )
+    audio_format.setByteOrder( QAudioFormat.LittleEndian )
+    audio_format.setSampleType( QAudioFormat.SignedInt )
+    return audio_format
+
+'''
+Start the tone generator with the gate closed. Called once from display.py.
+'''
+
+def initialize( ) -> None :
+    global WAVE, OUTPUT, SFX
+    from PyQt5.QtMultimedia import (
+        QAudio, QAudioDeviceInfo, QAudioOutput, QSoundEffect )
+    audio_format = make_format()
+    if QAudioDeviceInfo.defaultOutputDevice().isFormatSupported( audio_format ) :
+        WAVE = SquareWave()
+        WAVE.open( QIODevice.ReadOnly )
+        OUTPUT = QAudioOutput( audio_format )
+        OUTPUT.setBufferSize( ( SAMPLE_RATE * 2 * BUFFER_MS ) // 1000 )
+        OUTPUT.start( WAVE )
+        if OUTPUT.state() != QAudio.StoppedState :
+            return
+        logging.error( 'Audio output did not start, using sound effect' )
+        WAVE = OUTPUT = None
+    else :
+        logging.error( 'Audio format not supported, using sound effect' )
+    import audio330hz # registers the resource qrc:/330HzSQARE.wav
+    SFX = QSoundEffect( None )
+    SFX.setSource( QUrl( 'qrc:/330HzSQARE.wav' ) )
+    SFX.setLoopCount( QSoundEffect.Infinite )
+    SFX.play()
+    SFX.setMuted( True )
+
+'''
+Turn the tone on or off, now.
+'''
+
+def sound( on:bool ) -> None :
+    if WAVE is not None :
+        WAVE.set_gate( on )
+    elif SFX is not None :
+        SFX.setMuted( not on )
+
+'''
+Play a list of tone events, ( tick, on ), from chip8io, each at its time.
+The fallback sound effect has no clock, so it just takes the last one.
+'''
+
+def schedule( events:List[Tuple[int,bool]] ) -> None :
+    if WAVE is not None :
+        for ( tick, on ) in events :
+            WAVE.schedule( tick, on )
+    elif SFX is not None and events :
+        SFX.setMuted( not events[-1][1] )
+
+'''
+Return the beep instrumentation as a tuple of the count of beeps measured,
+the total milliseconds requested, the total milliseconds played, and the
+worst difference of any one beep, in milliseconds.
+'''
+
+def beep_stats( ) -> Tuple[int,int,int,int] :
+    if WAVE is None :
+        return ( 0, 0, 0, 0 )
+    return ( WAVE.beeps,
+             ( 1000 * WAVE.requested ) // SAMPLE_RATE,
+             ( 1000 * WAVE.played ) // SAMPLE_RATE,
+             ( 1000 * WAVE.worst ) // SAMPLE_RATE )
+
+'''
+Stop the sound, at shutdown, and log the beep instrumentation.
+'''
+
+def shutdown( ) -> None :
+    if WAVE is not None and WAVE.beeps :
+        logging.info(
+            '{0} beeps, {1} ms requested, {2} ms played, worst error {3} ms'.format(
+                *beep_stats() ) )
+    if OUTPUT is not None :
+        OUTPUT.stop()
+    if SFX is not None :
+        SFX.stop()
+
+if __name__ == '__main__' :
+
+    assert len( WAVE_TABLE ) == 2 * WAVE_SAMPLES
+    assert ( WAVE_SAMPLES * FREQUENCY ) % SAMPLE_RATE == 0
+    wave = SquareWave()
+    assert wave.readData( 100 ) == bytes( 100 )
+    wave.set_gate( True )
+    chunk = wave.readData( 2 * WAVE_SAMPLES + 1 )
+    assert len( chunk ) == 2 * WAVE_SAMPLES
+    assert chunk == WAVE_TABLE[ 100 : ] + WAVE_TABLE[ : 100 ]
+    wave.set_gate( False )
+    '''
+    A beep of 3 ticks, the stop arriving late, is played 3 ticks long.
+    '''
+    wave.schedule( 1000, True )
+    wave.readData( 2000 )
+    wave.schedule( 1003, False )
+    wave.readData( 20000 )
+    assert wave.beeps == 1 and wave.worst == 0
+    assert wave.played == ( 3 * SAMPLE_RATE ) // TICKS_PER_SECOND
+    '''
+    The gate opens at exactly the scheduled sample.
+    '''
+    wave.schedule( 1010, True )
+    ( target, _, _ ) = wave.pending[0]
+    chunk = wave.readData( 2 * ( target - wave.sample + 10 ) )
+    assert chunk[ : -20 ] == bytes( len( chunk ) - 20 )
+    assert chunk[ -20 : ] != bytes( 20 )